@@ -1,5 +1,6 @@
+import asyncio
 import re
-from typing import Optional
+from typing import AsyncIterator, Optional
 from functools import lru_cache
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
@@ -7,11 +8,18 @@ from langchain_core.output_parsers import StrOutputParser
 from app.config import get_settings
 from app.database import get_mysql_client
 from app.vectorstore import get_vectorstore
+from app.agents import templates
 
 
 class ChatAgent:
     """LangChain-based chat agent for product consultation."""
     
+    # Intents whose context comes from MySQL rather than the vector store
+    MYSQL_INTENTS = {
+        "order_history", "order_status", "best_sellers",
+        "check_stock", "most_expensive", "cheapest"
+    }
+    
     SYSTEM_PROMPT = """Bạn là trợ lý ảo của nền tảng cho thuê đồ ReRent. 
 Nhiệm vụ của bạn là tư vấn, hỗ trợ khách hàng tìm sản phẩm phù hợp và trả lời các câu hỏi về đơn hàng.
 
@@ -29,6 +37,26 @@ Lịch sử hội thoại:
 {chat_history}
 """
 
+    INTENT_KEYWORDS = {
+        "order_history": ["đơn hàng", "lịch sử", "đã mua", "đã thuê", "order"],
+        "best_sellers": ["bán chạy", "phổ biến", "best seller", "hot", "được thuê nhiều"],
+        "most_expensive": ["đắt nhất", "cao nhất", "giá cao", "mắc nhất", "most expensive"],
+        "cheapest": ["rẻ nhất", "thấp nhất", "giá thấp", "giá rẻ", "cheapest"],
+    }
+    ORDER_ID_PATTERN = r"(?:đơn|order)\s*#?\s*(\d+)"
+    STOCK_PATTERN = r"(?:tồn kho|còn hàng|còn không|stock)\s*(?:sản phẩm|sp)?\s*#?\s*(\d+)?"
+    
+    # Words that carry no filter/topic on their own, used by classify_intent
+    FILLER_TOKENS = {
+        "sản", "phẩm", "sp", "món", "đồ", "cái", "hàng", "nào", "là", "gì", "cho",
+        "tôi", "mình", "em", "anh", "chị", "bạn", "ơi", "ạ", "nhé", "vậy", "với",
+        "xem", "của", "có", "không", "những", "các", "mấy", "top", "shop", "hãy",
+        "giúp", "liệt", "kê", "hiện", "nay", "đang", "được", "thế", "ra", "sao",
+        "nhất", "kiểm", "tra", "check", "tình", "trạng", "gần", "đây", "về", "thuê",
+        "mua", "trên", "bên", "mà", "thì", "ở", "đâu", "my", "the", "what",
+        "is", "are", "show", "me", "of", "products", "product",
+    }
+    
     def __init__(self):
         self.settings = get_settings()
         self._llm = None
@@ -55,38 +83,76 @@ Lịch sử hội thoại:
             self._chain = prompt | self._get_llm() | StrOutputParser()
         return self._chain
     
+    def _category_filter(self, query_lower: str) -> dict:
+        """{"category": name} when the query names a known category, else {}."""
+        category = get_mysql_client().match_category(query_lower)
+        return {"category": category} if category else {}
+    
     def _detect_intent(self, query: str) -> tuple[str, dict]:
         """Detect user intent from query."""
         query_lower = query.lower()
         
         # Check for order history
-        if any(kw in query_lower for kw in ["đơn hàng", "lịch sử", "đã mua", "đã thuê", "order"]):
+        if any(kw in query_lower for kw in self.INTENT_KEYWORDS["order_history"]):
             return "order_history", {}
         
         # Check for order status with order ID
-        order_match = re.search(r"(?:đơn|order)\s*#?\s*(\d+)", query_lower)
+        order_match = re.search(self.ORDER_ID_PATTERN, query_lower)
         if order_match:
             return "order_status", {"order_id": int(order_match.group(1))}
         
         # Check for best sellers
-        if any(kw in query_lower for kw in ["bán chạy", "phổ biến", "best seller", "hot", "được thuê nhiều"]):
-            return "best_sellers", {}
+        if any(kw in query_lower for kw in self.INTENT_KEYWORDS["best_sellers"]):
+            return "best_sellers", self._category_filter(query_lower)
         
         # Check for stock inquiry
-        stock_match = re.search(r"(?:tồn kho|còn hàng|còn không|stock)\s*(?:sản phẩm|sp)?\s*#?\s*(\d+)?", query_lower)
+        stock_match = re.search(self.STOCK_PATTERN, query_lower)
         if stock_match and stock_match.group(1):
             return "check_stock", {"product_id": int(stock_match.group(1))}
         
         # Check for price-based queries (most expensive, cheapest)
-        if any(kw in query_lower for kw in ["đắt nhất", "cao nhất", "giá cao", "mắc nhất", "most expensive"]):
-            return "most_expensive", {}
+        if any(kw in query_lower for kw in self.INTENT_KEYWORDS["most_expensive"]):
+            return "most_expensive", self._category_filter(query_lower)
         
-        if any(kw in query_lower for kw in ["rẻ nhất", "thấp nhất", "giá thấp", "giá rẻ", "cheapest"]):
-            return "cheapest", {}
+        if any(kw in query_lower for kw in self.INTENT_KEYWORDS["cheapest"]):
+            return "cheapest", self._category_filter(query_lower)
         
         # Default: product search/consultation
         return "product_search", {}
     
+    def classify_intent(self, query: str) -> tuple[str, dict, float]:
+        """
+        Detect intent and estimate how confidently the rules cover the query.
+        
+        Confidence is high only when nothing but the trigger phrase, an id and
+        filler words remain; extra content words ("bàn tiệc đắt nhất") mean
+        the question carries a filter the rules would ignore.
+        """
+        intent, intent_data = self._detect_intent(query)
+        if intent == "product_search":
+            return intent, intent_data, 0.0
+        
+        text = query.lower()
+        for keyword in self.INTENT_KEYWORDS.get(intent, []):
+            text = text.replace(keyword, " ")
+        if intent == "order_status":
+            text = re.sub(self.ORDER_ID_PATTERN, " ", text)
+        elif intent == "check_stock":
+            text = re.sub(self.STOCK_PATTERN, " ", text)
+        if intent_data.get("category"):
+            # A recognized category is a filter the rankings apply, not noise
+            text = text.replace(intent_data["category"].lower(), " ")
+        
+        leftover = [
+            token for token in re.findall(r"\w+", text)
+            if token not in self.FILLER_TOKENS
+        ]
+        if not leftover:
+            return intent, intent_data, 0.95
+        if len(leftover) == 1:
+            return intent, intent_data, 0.7
+        return intent, intent_data, 0.4
+    
     def _format_price(self, price: float) -> str:
         """Format price in Vietnamese style."""
         return f"{price:,.0f}₫".replace(",", ".")
@@ -94,8 +160,10 @@ Lịch sử hội thoại:
     def _build_order_history_context(self, user_id: int) -> str:
         """Build context for order history."""
         mysql_client = get_mysql_client()
-        orders = mysql_client.get_user_orders(user_id)
-        
+        return self._format_order_history(mysql_client.get_user_orders(user_id))
+    
+    def _format_order_history(self, orders: list[dict]) -> str:
+        """Format a user's recent orders as context."""
         if not orders:
             return "Khách hàng chưa có đơn hàng nào."
         
@@ -112,11 +180,30 @@ Lịch sử hội thoại:
             )
         return "\n".join(context_parts)
     
-    def _build_order_status_context(self, order_id: int, user_id: int) -> str:
-        """Build context for order status."""
+    def _load_intent_data(self, intent: str, intent_data: dict, user_id: Optional[int]) -> Optional[dict]:
+        """Fetch the rows behind a structured intent, or None for other intents."""
         mysql_client = get_mysql_client()
-        order = mysql_client.get_order_status(order_id, user_id)
-        
+        if intent == "order_status" and user_id:
+            order_id = intent_data["order_id"]
+            return {"order_id": order_id, "order": mysql_client.get_order_status(order_id, user_id)}
+        category = intent_data.get("category")
+        if intent == "best_sellers":
+            return {"category": category, "products": mysql_client.get_best_sellers(limit=5, category=category)}
+        if intent == "check_stock":
+            product_id = intent_data["product_id"]
+            return {"product_id": product_id, "product": mysql_client.check_product_stock(product_id)}
+        if intent in ("most_expensive", "cheapest"):
+            order = "DESC" if intent == "most_expensive" else "ASC"
+            return {
+                "order": order,
+                "limit": 5,
+                "category": category,
+                "products": mysql_client.get_products_by_price(order=order, limit=5, category=category)
+            }
+        return None
+    
+    def _format_order_status_context(self, order: Optional[dict], order_id: int) -> str:
+        """Build context for order status."""
         if not order:
             return f"Không tìm thấy đơn hàng #{order_id} trong hệ thống của khách hàng."
         
@@ -128,15 +215,13 @@ Lịch sử hội thoại:
             f"- Địa chỉ: {order.get('address', 'N/A')}"
         )
     
-    def _build_best_sellers_context(self) -> str:
+    def _format_best_sellers_context(self, products: list[dict], category: Optional[str] = None) -> str:
         """Build context for best sellers."""
-        mysql_client = get_mysql_client()
-        products = mysql_client.get_best_sellers(limit=5)
-        
+        scope = f" (danh mục {category})" if category else ""
         if not products:
-            return "Chưa có dữ liệu về sản phẩm được thuê nhiều."
+            return f"Chưa có dữ liệu về sản phẩm được thuê nhiều{scope}."
         
-        context_parts = ["Top sản phẩm được thuê nhiều nhất:"]
+        context_parts = [f"Top sản phẩm được thuê nhiều nhất{scope}:"]
         for i, product in enumerate(products, 1):
             context_parts.append(
                 f"{i}. {product['name']} - {self._format_price(float(product['price']))} "
@@ -146,11 +231,8 @@ Lịch sử hội thoại:
             )
         return "\n".join(context_parts)
     
-    def _build_stock_context(self, product_id: int) -> str:
+    def _format_stock_context(self, product: Optional[dict], product_id: int) -> str:
         """Build context for stock check."""
-        mysql_client = get_mysql_client()
-        product = mysql_client.check_product_stock(product_id)
-        
         if not product:
             return f"Không tìm thấy sản phẩm #{product_id}."
         
@@ -162,16 +244,20 @@ Lịch sử hội thoại:
             f"- Trạng thái: {product['status']}"
         )
     
-    def _build_price_query_context(self, order: str = "DESC", limit: int = 5) -> tuple[str, list[dict]]:
+    def _format_price_query_context(
+        self,
+        products: list[dict],
+        order: str = "DESC",
+        limit: int = 5,
+        category: Optional[str] = None
+    ) -> tuple[str, list[dict]]:
         """Build context for price-based queries (most expensive or cheapest)."""
-        mysql_client = get_mysql_client()
-        products = mysql_client.get_products_by_price(order=order, limit=limit)
-        
+        scope = f" (danh mục {category})" if category else ""
         if not products:
-            return "Không tìm thấy sản phẩm nào trong hệ thống.", []
+            return f"Không tìm thấy sản phẩm nào trong hệ thống{scope}.", []
         
         label = "đắt nhất" if order == "DESC" else "rẻ nhất"
-        context_parts = [f"Top {limit} sản phẩm có giá {label}:"]
+        context_parts = [f"Top {limit} sản phẩm có giá {label}{scope}:"]
         sources = []
         
         for i, product in enumerate(products, 1):
@@ -194,7 +280,7 @@ Lịch sử hội thoại:
     def _build_product_search_context(self, query: str) -> tuple[str, list[dict]]:
         """Build context for product search using vector similarity."""
         vectorstore = get_vectorstore()
-        similar_products = vectorstore.search_similar(query, n_results=5)
+        similar_products = vectorstore.search_similar(query)
         
         if not similar_products:
             return "Không tìm thấy sản phẩm liên quan trong hệ thống.", []
@@ -209,51 +295,81 @@ Lịch sử hội thoại:
         
         return "\n".join(context_parts), similar_products
     
-    def chat(
+    def _build_context_with_data(
         self,
+        intent: str,
+        intent_data: dict,
         query: str,
-        user_id: Optional[int] = None,
-        conversation_history: Optional[list[dict]] = None
-    ) -> dict:
-        """Process a chat message and return response."""
+        user_id: Optional[int]
+    ) -> tuple[str, list[dict], Optional[dict]]:
+        """Build (context, sources, data) for a detected intent.
         
-        # Detect intent
-        intent, intent_data = self._detect_intent(query)
-        
-        # Build context based on intent
+        `data` holds the raw rows for structured intents so answers can be
+        rendered from templates; it is None for free-form intents.
+        """
         sources = []
+        data = self._load_intent_data(intent, intent_data, user_id)
         if intent == "order_history" and user_id:
             context = self._build_order_history_context(user_id)
-        elif intent == "order_status" and user_id:
-            context = self._build_order_status_context(
-                intent_data["order_id"], user_id
-            )
+        elif intent == "order_status" and data is not None:
+            context = self._format_order_status_context(data["order"], data["order_id"])
         elif intent == "best_sellers":
-            context = self._build_best_sellers_context()
+            context = self._format_best_sellers_context(data["products"], data["category"])
         elif intent == "check_stock":
-            context = self._build_stock_context(intent_data["product_id"])
-        elif intent == "most_expensive":
-            context, sources = self._build_price_query_context(order="DESC")
-        elif intent == "cheapest":
-            context, sources = self._build_price_query_context(order="ASC")
+            context = self._format_stock_context(data["product"], data["product_id"])
+        elif intent in ("most_expensive", "cheapest"):
+            context, sources = self._format_price_query_context(
+                data["products"], order=data["order"], limit=data["limit"], category=data["category"]
+            )
         else:
             context, sources = self._build_product_search_context(query)
-        
-        # Format conversation history
+        return context, sources, data
+    
+    def _build_context(
+        self,
+        intent: str,
+        intent_data: dict,
+        query: str,
+        user_id: Optional[int]
+    ) -> tuple[str, list[dict]]:
+        """Build (context, sources) for a detected intent."""
+        context, sources, _ = self._build_context_with_data(intent, intent_data, query, user_id)
+        return context, sources
+    
+    def _chain_inputs(
+        self,
+        query: str,
+        context: str,
+        conversation_history: Optional[list[dict]]
+    ) -> dict:
+        """Build chain inputs from context and conversation history."""
         chat_history = ""
         if conversation_history:
             for msg in conversation_history[-5:]:  # Last 5 messages
                 role = "Khách" if msg.get("role") == "user" else "Bot"
                 chat_history += f"{role}: {msg.get('content', '')}\n"
         
-        # Run chain
-        chain = self._get_chain()
-        answer = chain.invoke({
+        return {
             "context": context,
             "chat_history": chat_history or "Chưa có hội thoại trước đó.",
             "question": query
-        })
-        
+        }
+    
+    def _template_answer(self, intent: str, data: Optional[dict], polish: bool) -> Optional[str]:
+        """Render a structured intent without the LLM, unless polish was requested."""
+        if polish or not self.settings.template_answers_enabled:
+            return None
+        return templates.render_answer(intent, data)
+    
+    def _build_result(
+        self,
+        answer: str,
+        intent: str,
+        sources: list[dict],
+        user_id: Optional[int],
+        answer_mode: str = "llm"
+    ) -> dict:
+        """Assemble the chat response payload."""
         return {
             "answer": answer,
             "sources": [
@@ -267,9 +383,108 @@ Lịch sử hội thoại:
             ],
             "metadata": {
                 "intent": intent,
+                "answer_mode": answer_mode,
                 "user_id": user_id
             }
         }
+    
+    def chat(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        conversation_history: Optional[list[dict]] = None,
+        polish: bool = False
+    ) -> dict:
+        """
+        Process a chat message and return response (blocking, for scripts).
+        
+        Structured intents are answered from templates; polish=True sends them
+        through the LLM instead.
+        """
+        
+        # Detect intent
+        intent, intent_data = self._detect_intent(query)
+        
+        # Build context based on intent
+        context, sources, data = self._build_context_with_data(intent, intent_data, query, user_id)
+        
+        answer = self._template_answer(intent, data, polish)
+        if answer is not None:
+            return self._build_result(answer, intent, sources, user_id, "template")
+        
+        # Run chain
+        answer = self._get_chain().invoke(
+            self._chain_inputs(query, context, conversation_history)
+        )
+        
+        return self._build_result(answer, intent, sources, user_id)
+    
+    async def _aprepare(self, query: str, user_id: Optional[int]) -> tuple[str, str, list[dict], Optional[dict]]:
+        """Detect intent and build context off the loop: returns (intent, context, sources, data)."""
+        intent, intent_data = self._detect_intent(query)
+        
+        # Context builders are blocking: MySQL-backed intents go through the
+        # MySQL client's worker, vector search through the default thread pool.
+        if intent in self.MYSQL_INTENTS:
+            context, sources, data = await get_mysql_client().run_async(
+                self._build_context_with_data, intent, intent_data, query, user_id
+            )
+        else:
+            context, sources, data = await asyncio.to_thread(
+                self._build_context_with_data, intent, intent_data, query, user_id
+            )
+        return intent, context, sources, data
+    
+    async def achat(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        conversation_history: Optional[list[dict]] = None,
+        polish: bool = False
+    ) -> dict:
+        """Process a chat message without blocking the event loop."""
+        intent, context, sources, data = await self._aprepare(query, user_id)
+        
+        answer = self._template_answer(intent, data, polish)
+        if answer is not None:
+            return self._build_result(answer, intent, sources, user_id, "template")
+        
+        answer = await self._get_chain().ainvoke(
+            self._chain_inputs(query, context, conversation_history)
+        )
+        
+        return self._build_result(answer, intent, sources, user_id)
+    
+    async def astream_chat(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        conversation_history: Optional[list[dict]] = None,
+        polish: bool = False
+    ) -> AsyncIterator[dict]:
+        """Stream a chat answer as metadata, delta and done events."""
+        intent, context, sources, data = await self._aprepare(query, user_id)
+        
+        answer = self._template_answer(intent, data, polish)
+        if answer is not None:
+            result = self._build_result(answer, intent, sources, user_id, "template")
+            yield {"event": "metadata", "sources": result["sources"], "metadata": result["metadata"]}
+            yield {"event": "delta", "content": answer}
+            yield {"event": "done", **result}
+            return
+        
+        result = self._build_result("", intent, sources, user_id)
+        yield {"event": "metadata", "sources": result["sources"], "metadata": result["metadata"]}
+        
+        parts = []
+        async for chunk in self._get_chain().astream(
+            self._chain_inputs(query, context, conversation_history)
+        ):
+            parts.append(chunk)
+            yield {"event": "delta", "content": chunk}
+        
+        result["answer"] = "".join(parts)
+        yield {"event": "done", **result}
 
 
 @lru_cache()
@@ -2,16 +2,27 @@
 Smart Chat Agent using Text-to-SQL approach.
 LLM decides whether to use SQL query or vector search, eliminating the need for manual intent detection.
 """
+import asyncio
+import copy
 import json
 import re
-from typing import Optional
+import threading
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Optional
 from functools import lru_cache
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from app.config import get_settings
-from app.database import get_mysql_client
+from app.database import (
+    get_mysql_client, GuardedSQLExecutor, schema_columns, round_trips_so_far, add_round_trips
+)
 from app.vectorstore import get_vectorstore
+from app.cache import (
+    get_router_cache, get_request_coalescer, normalize_query, prior_turns, is_user_specific
+)
+from app.agents.chat_agent import get_chat_agent
 
 
 # Database schema for LLM to understand
@@ -83,12 +94,13 @@ Phân tích câu hỏi và trả về JSON với format:
     "strategy": "sql" | "vector" | "conversation",
     "reasoning": "giải thích ngắn gọn tại sao chọn strategy này",
     "sql_query": "câu SQL nếu strategy=sql, null nếu không",
-    "search_query": "từ khóa tìm kiếm nếu strategy=vector, null nếu không"
+    "search_query": "từ khóa tìm kiếm nếu strategy=vector, null nếu không",
+    "filters": {{"min_price": số | null, "max_price": số | null, "category": "tên danh mục" | null, "in_stock": true | null, "shop_id": số | null}} nếu strategy=vector, null nếu không
 }}
 
 Quy tắc chọn strategy:
 - "sql": Khi cần query dữ liệu có cấu trúc (giá cao/thấp nhất, đếm số lượng, thống kê, tồn kho, đơn hàng cụ thể, filter theo điều kiện,...)
-- "vector": Khi cần tìm sản phẩm theo ngữ nghĩa/mô tả (VD: "tổ chức tiệc sinh nhật", "đám cưới", "sự kiện ngoài trời",...)
+- "vector": Khi cần tìm sản phẩm theo ngữ nghĩa/mô tả (VD: "tổ chức tiệc sinh nhật", "đám cưới", "sự kiện ngoài trời",...), kể cả khi kèm điều kiện giá/danh mục/còn hàng (VD: "bàn tiệc dưới 200k còn hàng")
 - "conversation": Chào hỏi, câu hỏi chung không liên quan đến data
 
 Lưu ý SQL:
@@ -98,6 +110,12 @@ Lưu ý SQL:
 - WHERE status = 'Còn hàng' cho sản phẩm available
 - Nếu cần user_id, dùng placeholder {{user_id}}
 
+Lưu ý filters (strategy=vector):
+- Chỉ điền điều kiện user nói rõ, còn lại để null
+- Giá tính bằng VNĐ/ngày (200k = 200000); "dưới 200k" -> max_price=200000, "từ 1 triệu" -> min_price=1000000
+- in_stock=true khi user hỏi "còn hàng", "có sẵn"
+- search_query chỉ giữ phần mô tả sản phẩm, bỏ điều kiện đã đưa vào filters
+
 Câu hỏi: {question}
 User ID: {user_id}
 
@@ -127,6 +145,10 @@ Trả lời:"""
         self._llm = None
         self._router_chain = None
         self._answer_chain = None
+        self._sql_executor = None
+        # How each request was routed: "rules", "cache" or "llm"
+        self._route_counts: Counter = Counter()
+        self._route_counts_lock = threading.Lock()
     
     def _get_llm(self, temperature: float = 0.7):
         """Get LLM instance."""
@@ -180,54 +202,28 @@ Trả lời:"""
                 "strategy": "vector",
                 "reasoning": "Failed to parse router response",
                 "sql_query": None,
-                "search_query": None
+                "search_query": None,
+                "parse_error": True
             }
     
-    def _validate_sql(self, sql: str) -> bool:
-        """Validate SQL query for safety."""
-        # Remove trailing semicolon (common in LLM output)
-        sql = sql.strip().rstrip(";").strip()
-        sql_upper = sql.upper()
-        
-        # Only allow SELECT
-        if not sql_upper.startswith("SELECT"):
-            return False
-        
-        # Block dangerous keywords (must be whole words)
-        dangerous_patterns = [
-            r"\bDROP\b", r"\bDELETE\b", r"\bUPDATE\b", r"\bINSERT\b", 
-            r"\bALTER\b", r"\bTRUNCATE\b", r"\bEXEC\b", r"\bCREATE\b",
-            r"--",  # SQL comment
-        ]
-        for pattern in dangerous_patterns:
-            if re.search(pattern, sql_upper):
-                return False
-        
-        return True
-    
-    def _clean_sql(self, sql: str) -> str:
-        """Clean SQL query before execution."""
-        # Remove trailing semicolon
-        return sql.strip().rstrip(";").strip()
+    def _get_sql_executor(self) -> GuardedSQLExecutor:
+        """Executor that validates and bounds router-generated SQL."""
+        if self._sql_executor is None:
+            self._sql_executor = GuardedSQLExecutor(
+                get_mysql_client(),
+                schema_columns(DATABASE_SCHEMA),
+                max_limit=self.settings.sql_max_limit,
+                max_rows=self.settings.sql_max_rows,
+                max_examined_rows=self.settings.sql_max_examined_rows,
+                max_execution_ms=self.settings.sql_max_execution_ms,
+                explain=self.settings.sql_explain_enabled,
+                cache_ttl=self.settings.query_cache_sql_ttl,
+            )
+        return self._sql_executor
     
     def _execute_sql(self, sql: str, user_id: Optional[int] = None) -> list[dict]:
-        """Execute SQL query safely."""
-        # Clean and validate SQL
-        sql = self._clean_sql(sql)
-        
-        # Replace user_id placeholder
-        if user_id and "{user_id}" in sql:
-            sql = sql.replace("{user_id}", str(user_id))
-        
-        if not self._validate_sql(sql):
-            raise ValueError("Invalid or unsafe SQL query")
-        
-        mysql_client = get_mysql_client()
-        conn = mysql_client._get_connection()
-        
-        with conn.cursor() as cursor:
-            cursor.execute(sql)
-            return cursor.fetchall()
+        """Execute router SQL through the guarded executor (raises UnsafeSQLError)."""
+        return self._get_sql_executor().execute(sql, user_id)
     
     def _format_sql_results(self, results: list[dict]) -> tuple[str, list[dict]]:
         """Format SQL results as context string."""
@@ -281,74 +277,818 @@ Trả lời:"""
         
         return "\n".join(context_parts), sources
     
-    def chat(
-        self,
-        query: str,
-        user_id: Optional[int] = None,
-        conversation_history: Optional[list[dict]] = None
-    ) -> dict:
-        """Process chat message using smart routing."""
+    def _search_filters(self, routing: dict) -> Optional[dict]:
+        """
+        Validated vector-search filters from the router decision.
         
-        # Step 1: Route the query
-        router_chain = self._get_router_chain()
-        router_response = router_chain.invoke({
+        Malformed values are dropped rather than failing the search; the
+        category is mapped onto a real category name because Chroma matches
+        it exactly.
+        """
+        raw = routing.get("filters")
+        if not isinstance(raw, dict):
+            return None
+        filters = {}
+        for key in ("min_price", "max_price", "shop_id"):
+            value = raw.get(key)
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value >= 0:
+                filters[key] = int(value) if key == "shop_id" else value
+        if raw.get("in_stock") is True:
+            filters["in_stock"] = True
+        category = raw.get("category")
+        if isinstance(category, str) and category.strip():
+            mysql_client = get_mysql_client()
+            matched = mysql_client.match_category(category)
+            # Without a loaded category list the router's wording is all we have
+            if matched or mysql_client.rankings is None or not mysql_client.rankings.ready:
+                filters["category"] = matched or category.strip()
+        return filters or None
+    
+    def _router_inputs(self, query: str, user_id: Optional[int]) -> dict:
+        """Build router chain inputs."""
+        return {
             "schema": DATABASE_SCHEMA,
             "question": query,
             "user_id": user_id or "không xác định"
-        })
-        
+        }
+    
+    # Intents the fast path may answer; order intents also need a user_id
+    FAST_PATH_INTENTS = {"order_history", "order_status", "best_sellers", "check_stock", "most_expensive", "cheapest"}
+    USER_INTENTS = {"order_history", "order_status"}
+    
+    def _fast_path_intent(self, query: str, user_id: Optional[int]) -> Optional[tuple[str, dict, float]]:
+        """Return (intent, data, confidence) if the rule-based classifier can answer alone."""
+        if not self.settings.fast_path_enabled:
+            return None
+        intent, intent_data, confidence = get_chat_agent().classify_intent(query)
+        if intent not in self.FAST_PATH_INTENTS or confidence < self.settings.fast_path_min_confidence:
+            return None
+        if intent in self.USER_INTENTS and not user_id:
+            return None
+        return intent, intent_data, confidence
+    
+    def _fast_path_routing(self, intent: str, confidence: float) -> dict:
+        return {
+            "strategy": "fast_path",
+            "intent": intent,
+            "reasoning": f"Rule-based intent '{intent}' (confidence {confidence:.2f})",
+            "sql_query": None,
+            "search_query": None,
+            "router": "rules",
+        }
+    
+    def _count_route(self, routing: dict) -> None:
+        with self._route_counts_lock:
+            self._route_counts[routing.get("router") or "llm"] += 1
+    
+    def routing_stats(self) -> dict:
+        """How much router traffic each path absorbed."""
+        with self._route_counts_lock:
+            counts = dict(self._route_counts)
+        total = sum(counts.values())
+        return {
+            "rules": counts.get("rules", 0),
+            "cache": counts.get("cache", 0),
+            "llm": counts.get("llm", 0),
+            "fast_path_ratio": round(counts.get("rules", 0) / total, 4) if total else 0.0,
+            "llm_avoided_ratio": round((total - counts.get("llm", 0)) / total, 4) if total else 0.0,
+        }
+    
+    def _cached_routing(self, query: str, user_id: Optional[int]) -> Optional[dict]:
+        """Look up a previous routing decision for this question."""
+        if not self.settings.router_cache_enabled:
+            return None
+        routing = get_router_cache().get(query, user_id)
+        if routing is not None:
+            routing["router"] = "cache"
+        return routing
+    
+    def _remember_routing(self, query: str, user_id: Optional[int], routing: dict) -> None:
+        """Store a fresh LLM routing decision for reuse."""
+        routing["router"] = "llm"
+        if self.settings.router_cache_enabled:
+            get_router_cache().put(query, user_id, routing)
+    
+    def _route(self, query: str, user_id: Optional[int]) -> dict:
+        """Decide the strategy, reusing a cached decision when available."""
+        routing = self._cached_routing(query, user_id)
+        if routing is None:
+            router_response = self._get_router_chain().invoke(
+                self._router_inputs(query, user_id)
+            )
+            routing = self._parse_router_response(router_response)
+            self._remember_routing(query, user_id, routing)
+        return routing
+    
+    async def _allm_route(self, query: str, user_id: Optional[int]) -> dict:
+        """Ask the router LLM for a decision and remember it."""
+        router_response = await self._get_router_chain().ainvoke(
+            self._router_inputs(query, user_id)
+        )
         routing = self._parse_router_response(router_response)
-        strategy = routing.get("strategy", "vector")
+        await asyncio.to_thread(self._remember_routing, query, user_id, routing)
+        return routing
+    
+    async def _timed(self, awaitable: Awaitable) -> tuple[Any, float]:
+        """Await and return (result, elapsed_ms)."""
+        started = time.perf_counter()
+        result = await awaitable
+        return result, (time.perf_counter() - started) * 1000
+    
+    async def _asearch(self, query: str, filters: Optional[dict] = None) -> tuple[list[dict], dict]:
+        """Vector search off the event loop; returns (results, embed/search timings)."""
+        search_timings: dict = {}
+        results = await asyncio.to_thread(get_vectorstore().search_similar, query, None, search_timings, filters)
+        return results, search_timings
+    
+    def _speculate(self, query: str, user_id: Optional[int]) -> dict[str, asyncio.Task]:
+        """
+        Start likely retrievals while the router LLM is still thinking.
         
-        # Step 2: Execute based on strategy
+        Vector search with the raw query is the answer for most vector routes
+        and the fallback for failed SQL; a user's orders are prefetched only
+        when the question looks order-related.
+        """
+        if not self.settings.speculative_retrieval_enabled:
+            return {}
+        tasks = {
+            "vector": asyncio.create_task(self._timed(self._asearch(query)))
+        }
+        if user_id and get_chat_agent()._detect_intent(query)[0] in self.USER_INTENTS:
+            mysql_client = get_mysql_client()
+            # As many orders as a routed order-history SQL may return
+            tasks["orders"] = asyncio.create_task(self._timed(
+                mysql_client.run_async(mysql_client.get_user_orders, user_id, self.settings.sql_max_limit)
+            ))
+        for task in tasks.values():
+            # Unused speculation may fail; don't let it surface as an unretrieved error
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return tasks
+    
+    async def _use_speculation(self, speculation: dict, name: str, timings: dict) -> Optional[Any]:
+        """Take a speculative result if it was started and succeeded."""
+        task = speculation.pop(name, None)
+        if task is None:
+            return None
+        try:
+            result, elapsed_ms = await task
+        except Exception as e:
+            print(f"[ERROR] Speculative {name} retrieval failed: {e}")
+            return None
+        timings.setdefault("speculative", {})[name] = {"ms": round(elapsed_ms, 1), "used": True}
+        return result
+    
+    def _discard_speculation(self, speculation: dict, timings: dict) -> None:
+        """Cancel (or just drop) speculative work the router decision didn't need."""
+        for name, task in speculation.items():
+            if task.done() and not task.cancelled() and task.exception() is None:
+                elapsed_ms = task.result()[1]
+                timings.setdefault("speculative", {})[name] = {"ms": round(elapsed_ms, 1), "used": False}
+            else:
+                task.cancel()
+                timings.setdefault("speculative", {})[name] = {"ms": None, "used": False}
+        speculation.clear()
+    
+    def _handle_sql_failure(self, query: str, routing: dict, user_id: Optional[int], error: Exception) -> None:
+        """Record a failed SQL strategy and stop reusing its cached decision."""
+        print(f"[ERROR] SQL execution failed: {error}")
+        routing["reasoning"] = f"{routing.get('reasoning') or ''} (SQL failed: {error})"
+        if self.settings.router_cache_enabled:
+            get_router_cache().discard(query, user_id)
+    
+    def _format_chat_history(self, conversation_history: Optional[list[dict]]) -> str:
+        """Format the last few conversation turns for the answer prompt."""
+        chat_history = ""
+        if conversation_history:
+            for msg in conversation_history[-5:]:
+                role = "Khách" if msg.get("role") == "user" else "Bot"
+                chat_history += f"{role}: {msg.get('content', '')}\n"
+        return chat_history or "Chưa có hội thoại trước đó."
+    
+    def _retrieve(self, query: str, routing: dict, user_id: Optional[int]) -> tuple[str, str, list[dict]]:
+        """Execute the routed strategy and return (strategy, context, sources)."""
+        strategy = routing.get("strategy", "vector")
         context = ""
         sources = []
         
         if strategy == "sql" and routing.get("sql_query"):
             try:
-                sql = routing["sql_query"]
-                results = self._execute_sql(sql, user_id)
+                results = self._execute_sql(routing["sql_query"], user_id)
                 context, sources = self._format_sql_results(results)
             except Exception as e:
-                print(f"[ERROR] SQL execution failed: {e}")
                 # Fallback to vector search
                 strategy = "vector"
-                routing["reasoning"] += f" (SQL failed: {e})"
+                self._handle_sql_failure(query, routing, user_id, e)
         
         if strategy == "vector":
             search_query = routing.get("search_query") or query
-            vectorstore = get_vectorstore()
-            results = vectorstore.search_similar(search_query, n_results=5)
+            routing["filters"] = self._search_filters(routing)
+            results = get_vectorstore().search_similar(search_query, filters=routing["filters"])
             context, sources = self._format_vector_results(results)
         
         if strategy == "conversation":
             context = "Đây là câu hỏi chung, không cần truy vấn dữ liệu."
         
-        # Step 3: Format chat history
-        chat_history = ""
-        if conversation_history:
-            for msg in conversation_history[-5:]:
-                role = "Khách" if msg.get("role") == "user" else "Bot"
-                chat_history += f"{role}: {msg.get('content', '')}\n"
+        return strategy, context, sources
+    
+    async def _aretrieve(
+        self,
+        query: str,
+        routing: dict,
+        user_id: Optional[int],
+        speculation: Optional[dict] = None,
+        timings: Optional[dict] = None
+    ) -> tuple[str, str, list[dict]]:
+        """
+        Async variant of _retrieve: SQL and vector search run off the event loop.
         
-        # Step 4: Generate final answer
-        answer_chain = self._get_answer_chain()
-        answer = answer_chain.invoke({
-            "context": context,
-            "chat_history": chat_history or "Chưa có hội thoại trước đó.",
-            "question": query
-        })
+        Results already fetched speculatively are reused when the router's
+        decision matches them: the vector search for a vector route on the
+        raw query, the caller's orders for SQL that only lists their newest
+        orders (or as the fallback when the SQL fails).
+        """
+        speculation = speculation if speculation is not None else {}
+        timings = timings if timings is not None else {}
+        strategy = routing.get("strategy", "vector")
+        context = ""
+        sources = []
         
-        return {
+        orders_limit = None
+        if strategy == "sql" and routing.get("sql_query") and "orders" in speculation:
+            orders_limit = self._get_sql_executor().order_history_limit(routing["sql_query"])
+        if orders_limit:
+            orders = await self._use_speculation(speculation, "orders", timings)
+            if orders is not None:
+                # The SQL only lists the caller's newest orders: the prefetched
+                # rows (with their items) answer it without another query
+                strategy = "orders"
+                context = get_chat_agent()._format_order_history(orders[:orders_limit])
+        
+        if strategy == "sql" and routing.get("sql_query"):
+            try:
+                results = await get_mysql_client().run_async(
+                    self._execute_sql, routing["sql_query"], user_id
+                )
+                context, sources = self._format_sql_results(results)
+            except Exception as e:
+                await asyncio.to_thread(self._handle_sql_failure, query, routing, user_id, e)
+                orders = None
+                if "orders" in routing["sql_query"].lower():
+                    orders = await self._use_speculation(speculation, "orders", timings)
+                if orders is not None:
+                    # The question was about the user's orders; their history
+                    # is a better fallback than a product search.
+                    strategy = "orders"
+                    context = get_chat_agent()._format_order_history(orders)
+                else:
+                    strategy = "vector"
+        
+        if strategy == "vector":
+            search_query = routing.get("search_query") or query
+            routing["filters"] = self._search_filters(routing)
+            searched = None
+            # Speculation searched the raw query without filters
+            if search_query.strip() == query.strip() and not routing["filters"]:
+                searched = await self._use_speculation(speculation, "vector", timings)
+            if searched is None:
+                searched = await self._asearch(search_query, routing["filters"])
+            results, timings["vector_search"] = searched
+            context, sources = self._format_vector_results(results)
+        
+        if strategy == "conversation":
+            context = "Đây là câu hỏi chung, không cần truy vấn dữ liệu."
+        
+        return strategy, context, sources
+    
+    def _build_result(
+        self,
+        answer: str,
+        strategy: str,
+        routing: dict,
+        sources: list[dict],
+        user_id: Optional[int],
+        timings: Optional[dict] = None,
+        answer_mode: str = "llm"
+    ) -> dict:
+        """Assemble the chat response payload."""
+        result = {
             "answer": answer,
             "sources": sources,
             "metadata": {
                 "strategy": strategy,
                 "reasoning": routing.get("reasoning"),
                 "sql_query": routing.get("sql_query") if strategy == "sql" else None,
+                "filters": routing.get("filters") if strategy == "vector" else None,
+                "router": routing.get("router"),
+                "intent": routing.get("intent"),
+                "answer_mode": answer_mode,
                 "user_id": user_id
             }
         }
+        if timings:
+            result["metadata"]["timings"] = timings
+        return result
+    
+    def _template_answer(self, routing: dict, polish: bool) -> Optional[str]:
+        """Render a fast-path structured intent without the answer LLM."""
+        if routing.get("router") != "rules":
+            return None
+        return get_chat_agent()._template_answer(
+            routing.get("intent"), routing.get("template_data"), polish
+        )
+    
+    def _coalescing_scope(self, query: str, user_id: Optional[int]) -> str:
+        """
+        Who may share an answer to this query.
+        
+        Catalog questions are shared by every signed-in caller, like the
+        answer and router caches do; order questions stay per user.
+        """
+        if user_id is None:
+            return "anon"
+        if get_chat_agent()._detect_intent(query)[0] in self.USER_INTENTS:
+            return f"user:{user_id}"
+        return "auth"
+    
+    def _coalescing_key(self, query: str, scope: str, polish: bool) -> str:
+        """Requests with the same key can share one answer."""
+        return f"smart:{'polish' if polish else 'plain'}:{scope}:{normalize_query(query)}"
+    
+    def _coalesces(self, history: list[dict]) -> bool:
+        # Follow-ups depend on their own earlier turns
+        return self.settings.request_coalescing_enabled and not history
+    
+    def _shareable(self, result: dict, user_id: Optional[int], coalesced: bool) -> bool:
+        """False when a shared answer turned out to be about another user's orders."""
+        return not coalesced or result["metadata"].get("user_id") == user_id or not is_user_specific(result)
+    
+    def _mark_coalesced(self, result: dict, round_trips: int, user_id: Optional[int], coalesced: bool) -> dict:
+        """
+        Flag an answer shared from another request's computation.
+        
+        The follower issued no MySQL statements itself; it is charged the
+        shared computation's, so db_round_trips reads the same for everyone.
+        """
+        if coalesced:
+            add_round_trips(round_trips)
+            result["metadata"]["coalesced"] = True
+            result["metadata"]["user_id"] = user_id
+        return result
+    
+    def chat(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        conversation_history: Optional[list[dict]] = None,
+        polish: bool = False
+    ) -> dict:
+        """
+        Process chat message using smart routing (blocking, for scripts).
+        
+        Fast-path structured intents are answered from templates unless
+        polish=True asks for the LLM to write the answer. Identical
+        concurrent requests share one computation.
+        """
+        history = prior_turns(conversation_history, query)
+        if not self._coalesces(history):
+            return self._chat(query, user_id, history, polish)
+        def compute() -> tuple[dict, int]:
+            before = round_trips_so_far()
+            result = self._chat(query, user_id, None, polish)
+            return result, round_trips_so_far() - before
+        
+        coalescer = get_request_coalescer()
+        scope = self._coalescing_scope(query, user_id)
+        (result, round_trips), coalesced = coalescer.run(self._coalescing_key(query, scope, polish), compute)
+        if not self._shareable(result, user_id, coalesced):
+            # The router sent the leader to its own orders; share only with this user
+            (result, round_trips), coalesced = coalescer.run(
+                self._coalescing_key(query, f"user:{user_id}", polish), compute
+            )
+        return self._mark_coalesced(result, round_trips, user_id, coalesced)
+    
+    def _chat(
+        self,
+        query: str,
+        user_id: Optional[int],
+        conversation_history: Optional[list[dict]],
+        polish: bool
+    ) -> dict:
+        """Route, retrieve and answer one chat message."""
+        # Step 1: Route the query - rules first, then cached or LLM routing
+        fast_path = self._fast_path_intent(query, user_id)
+        if fast_path:
+            intent, intent_data, confidence = fast_path
+            routing = self._fast_path_routing(intent, confidence)
+        else:
+            routing = self._route(query, user_id)
+        self._count_route(routing)
+        
+        # Step 2: Execute based on strategy
+        if fast_path:
+            strategy = routing["strategy"]
+            context, sources, routing["template_data"] = get_chat_agent()._build_context_with_data(
+                intent, intent_data, query, user_id
+            )
+        else:
+            strategy, context, sources = self._retrieve(query, routing, user_id)
+        
+        answer = self._template_answer(routing, polish)
+        if answer is not None:
+            return self._build_result(answer, strategy, routing, sources, user_id, answer_mode="template")
+        
+        # Step 3: Generate final answer
+        answer = self._get_answer_chain().invoke({
+            "context": context,
+            "chat_history": self._format_chat_history(conversation_history),
+            "question": query
+        })
+        
+        return self._build_result(answer, strategy, routing, sources, user_id)
+    
+    async def _aprepare(
+        self,
+        query: str,
+        user_id: Optional[int]
+    ) -> tuple[str, dict, str, list[dict], dict]:
+        """
+        Route and retrieve without blocking.
+        
+        Returns (strategy, routing, context, sources, timings). When the LLM
+        router has to be called, likely retrievals run speculatively alongside
+        it and the decision picks which prefetched result to use.
+        """
+        timings: dict = {}
+        speculation: dict = {}
+        started = time.perf_counter()
+        
+        fast_path = self._fast_path_intent(query, user_id)
+        # Speculative tasks are discarded even when the router call fails
+        try:
+            if fast_path:
+                intent, intent_data, confidence = fast_path
+                routing = self._fast_path_routing(intent, confidence)
+            else:
+                routing = self._cached_routing(query, user_id)
+                if routing is None:
+                    speculation = self._speculate(query, user_id)
+                    routing = await self._allm_route(query, user_id)
+            self._count_route(routing)
+            routed = time.perf_counter()
+            timings["route_ms"] = round((routed - started) * 1000, 1)
+            
+            if fast_path:
+                strategy = routing["strategy"]
+                context, sources, routing["template_data"] = await get_mysql_client().run_async(
+                    get_chat_agent()._build_context_with_data, intent, intent_data, query, user_id
+                )
+            else:
+                strategy, context, sources = await self._aretrieve(
+                    query, routing, user_id, speculation, timings
+                )
+        finally:
+            self._discard_speculation(speculation, timings)
+        
+        timings["retrieve_ms"] = round((time.perf_counter() - routed) * 1000, 1)
+        speculative_used = [
+            info["ms"] for info in timings.get("speculative", {}).values() if info["used"]
+        ]
+        if speculative_used:
+            # Work that overlapped the router call instead of following it
+            timings["speculative_saved_ms"] = round(min(max(speculative_used), timings["route_ms"]), 1)
+        return strategy, routing, context, sources, timings
+    
+    async def achat(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        conversation_history: Optional[list[dict]] = None,
+        polish: bool = False
+    ) -> dict:
+        """
+        Process chat message using smart routing without blocking the event loop.
+        
+        Identical concurrent requests share one in-flight computation:
+        catalog questions across signed-in users, order questions per user.
+        A trailing history entry repeating the question is not a follow-up.
+        """
+        history = prior_turns(conversation_history, query)
+        if not self._coalesces(history):
+            return await self._achat(query, user_id, history, polish)
+        async def compute() -> tuple[dict, int]:
+            # Runs in the leader's context, so its statements are counted there
+            before = round_trips_so_far()
+            result = await self._achat(query, user_id, None, polish)
+            return result, round_trips_so_far() - before
+        
+        coalescer = get_request_coalescer()
+        scope = self._coalescing_scope(query, user_id)
+        (result, round_trips), coalesced = await coalescer.arun(self._coalescing_key(query, scope, polish), compute)
+        if not self._shareable(result, user_id, coalesced):
+            # The router sent the leader to its own orders; share only with this user
+            (result, round_trips), coalesced = await coalescer.arun(
+                self._coalescing_key(query, f"user:{user_id}", polish), compute
+            )
+        return self._mark_coalesced(result, round_trips, user_id, coalesced)
+    
+    async def _achat(
+        self,
+        query: str,
+        user_id: Optional[int],
+        conversation_history: Optional[list[dict]],
+        polish: bool
+    ) -> dict:
+        """Route, retrieve and answer one chat message without blocking."""
+        strategy, routing, context, sources, timings = await self._aprepare(query, user_id)
+        
+        answer = self._template_answer(routing, polish)
+        if answer is not None:
+            return self._build_result(answer, strategy, routing, sources, user_id, timings, "template")
+        
+        answer_started = time.perf_counter()
+        answer = await self._get_answer_chain().ainvoke({
+            "context": context,
+            "chat_history": self._format_chat_history(conversation_history),
+            "question": query
+        })
+        timings["answer_ms"] = round((time.perf_counter() - answer_started) * 1000, 1)
+        
+        return self._build_result(answer, strategy, routing, sources, user_id, timings)
+    
+    async def astream_chat(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        conversation_history: Optional[list[dict]] = None,
+        polish: bool = False
+    ) -> AsyncIterator[dict]:
+        """
+        Stream a chat answer as events.
+        
+        Yields {"event": "metadata"} with routing metadata and sources as soon
+        as retrieval is done, then {"event": "delta"} per answer chunk and a
+        final {"event": "done"} with the full result. Closing the generator
+        stops the underlying LLM stream.
+        """
+        strategy, routing, context, sources, timings = await self._aprepare(query, user_id)
+        
+        answer = self._template_answer(routing, polish)
+        if answer is not None:
+            result = self._build_result(answer, strategy, routing, sources, user_id, timings, "template")
+            yield {"event": "metadata", "sources": result["sources"], "metadata": result["metadata"]}
+            yield {"event": "delta", "content": answer}
+            yield {"event": "done", **result}
+            return
+        
+        result = self._build_result("", strategy, routing, sources, user_id, timings)
+        yield {"event": "metadata", "sources": result["sources"], "metadata": result["metadata"]}
+        
+        parts = []
+        answer_started = time.perf_counter()
+        async for chunk in self._get_answer_chain().astream({
+            "context": context,
+            "chat_history": self._format_chat_history(conversation_history),
+            "question": query
+        }):
+            parts.append(chunk)
+            yield {"event": "delta", "content": chunk}
+        
+        timings["answer_ms"] = round((time.perf_counter() - answer_started) * 1000, 1)
+        result["answer"] = "".join(parts)
+        yield {"event": "done", **result}
+    
+    def _batch_key(self, request: dict) -> str:
+        """Batch items with the same key get the same answer."""
+        return json.dumps(
+            [
+                normalize_query(request["query"]),
+                request.get("user_id"),
+                bool(request.get("polish")),
+                request.get("conversation_history") or [],
+            ],
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+    
+    async def _abatch_route(self, items: list[dict], max_concurrency: int) -> None:
+        """
+        Route batch items: rules, then the router cache, then one router LLM
+        call per distinct question and user scope (as the router cache keys them).
+        """
+        pending: dict[str, list[dict]] = {}
+        for item in items:
+            fast_path = self._fast_path_intent(item["query"], item["user_id"])
+            if fast_path:
+                intent, _, confidence = fast_path
+                item["fast_path"] = fast_path
+                item["routing"] = self._fast_path_routing(intent, confidence)
+                continue
+            item["routing"] = self._cached_routing(item["query"], item["user_id"])
+            if item["routing"] is None:
+                scope = "auth" if item["user_id"] is not None else "anon"
+                pending.setdefault(f"{scope}:{normalize_query(item['query'])}", []).append(item)
+        
+        groups = list(pending.values())
+        if groups:
+            responses = await self._get_router_chain().abatch(
+                [self._router_inputs(group[0]["query"], group[0]["user_id"]) for group in groups],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+            for group, response in zip(groups, responses):
+                if isinstance(response, Exception):
+                    for item in group:
+                        item["error"] = response
+                    continue
+                routing = self._parse_router_response(response)
+                await asyncio.to_thread(self._remember_routing, group[0]["query"], group[0]["user_id"], routing)
+                for item in group:
+                    # Retrieval annotates the routing (filters, SQL failures) per item
+                    item["routing"] = copy.deepcopy(routing)
+        
+        for item in items:
+            if "error" not in item:
+                self._count_route(item["routing"])
+    
+    async def _abatch_retrieve(self, items: list[dict]) -> None:
+        """
+        Retrieve for routed batch items.
+        
+        Each distinct (SQL, user) pair is executed once, order histories for
+        all users are loaded together, and vector lookups, including
+        fallbacks from failed SQL, go to the vector store together.
+        """
+        mysql_client = get_mysql_client()
+        chat_agent = get_chat_agent()
+        
+        async def fast_path(item: dict) -> None:
+            intent, intent_data, _ = item["fast_path"]
+            context, sources, item["routing"]["template_data"] = await mysql_client.run_async(
+                chat_agent._build_context_with_data, intent, intent_data, item["query"], item["user_id"]
+            )
+            item.update(strategy=item["routing"]["strategy"], context=context, sources=sources)
+        
+        sql_tasks: dict[tuple, asyncio.Future] = {}
+        
+        async def sql(item: dict) -> None:
+            key = (item["routing"]["sql_query"], item["user_id"])
+            if key not in sql_tasks:
+                sql_tasks[key] = asyncio.ensure_future(mysql_client.run_async(self._execute_sql, *key))
+            try:
+                results = await sql_tasks[key]
+            except Exception as e:
+                await asyncio.to_thread(self._handle_sql_failure, item["query"], item["routing"], item["user_id"], e)
+                item["strategy"] = "vector"
+                return
+            context, sources = self._format_sql_results(results)
+            item.update(strategy="sql", context=context, sources=sources)
+        
+        async def order_histories(history_items: list[dict]) -> None:
+            # One get_orders_for_users call for every user asking for their orders
+            orders = await mysql_client.run_async(
+                mysql_client.get_orders_for_users, sorted({item["user_id"] for item in history_items})
+            )
+            for item in history_items:
+                item["routing"]["template_data"] = None
+                item.update(
+                    strategy=item["routing"]["strategy"],
+                    context=chat_agent._format_order_history(orders.get(item["user_id"], [])),
+                    sources=[]
+                )
+        
+        # (items, coroutine) for the items that need a database step
+        stepped = []
+        history_items = []
+        for item in items:
+            strategy = item["routing"].get("strategy", "vector")
+            if "fast_path" in item and item["fast_path"][0] == "order_history":
+                history_items.append(item)
+            elif "fast_path" in item:
+                stepped.append(([item], fast_path(item)))
+            elif strategy == "sql" and item["routing"].get("sql_query"):
+                stepped.append(([item], sql(item)))
+            elif strategy == "conversation":
+                item.update(strategy=strategy, context="Đây là câu hỏi chung, không cần truy vấn dữ liệu.", sources=[])
+            else:
+                item["strategy"] = "vector"
+        if history_items:
+            stepped.append((history_items, order_histories(history_items)))
+        outcomes = await asyncio.gather(*(step for _, step in stepped), return_exceptions=True)
+        for (stepped_items, _), outcome in zip(stepped, outcomes):
+            if isinstance(outcome, Exception):
+                for item in stepped_items:
+                    item["error"] = outcome
+        
+        vector_items = [item for item in items if item.get("strategy") == "vector" and "error" not in item]
+        if not vector_items:
+            return
+        for item in vector_items:
+            item["routing"]["filters"] = self._search_filters(item["routing"])
+        search_timings: dict = {}
+        try:
+            found = await asyncio.to_thread(
+                get_vectorstore().search_many,
+                [(item["routing"].get("search_query") or item["query"], item["routing"]["filters"]) for item in vector_items],
+                None,
+                search_timings
+            )
+        except Exception as e:
+            for item in vector_items:
+                item["error"] = e
+            return
+        for item, results in zip(vector_items, found):
+            context, sources = self._format_vector_results(results)
+            item.update(context=context, sources=sources)
+            item["timings"]["vector_search"] = search_timings
+    
+    async def _abatch_answer(self, items: list[dict], max_concurrency: int) -> None:
+        """Render templates, then generate the rest with one LLM call per distinct prompt."""
+        pending: dict[str, list[dict]] = {}
+        for item in items:
+            answer = self._template_answer(item["routing"], item["polish"])
+            if answer is not None:
+                item.update(answer=answer, answer_mode="template")
+                continue
+            inputs = {
+                "context": item["context"],
+                "chat_history": self._format_chat_history(item["history"]),
+                "question": item["query"]
+            }
+            pending.setdefault(json.dumps(inputs, ensure_ascii=False, sort_keys=True), []).append(item)
+        
+        if not pending:
+            return
+        responses = await self._get_answer_chain().abatch(
+            [json.loads(key) for key in pending],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        for group, response in zip(pending.values(), responses):
+            for item in group:
+                if isinstance(response, Exception):
+                    item["error"] = response
+                else:
+                    item.update(answer=response, answer_mode="llm")
+    
+    async def abatch_chat(self, requests: list[dict], max_concurrency: Optional[int] = None) -> list[Any]:
+        """
+        Answer several chat requests together.
+        
+        Identical requests are answered once; routing and SQL are shared
+        between requests that need the same decision or statement, vector
+        lookups are searched in one embedding batch, and router and answer
+        LLM calls run at most `max_concurrency` at a time. Returns one
+        result dict per request, in order, or the exception that failed it.
+        Timings are per batch phase, since the work of a phase is shared.
+        """
+        max_concurrency = max_concurrency or self.settings.ask_batch_llm_concurrency
+        keys = [self._batch_key(request) for request in requests]
+        unique: dict[str, dict] = {}
+        for key, request in zip(keys, requests):
+            if key not in unique:
+                unique[key] = {
+                    "query": request["query"],
+                    "user_id": request.get("user_id"),
+                    "history": request.get("conversation_history"),
+                    "polish": bool(request.get("polish")),
+                    "timings": {},
+                }
+        items = list(unique.values())
+        
+        def live() -> list[dict]:
+            return [item for item in items if "error" not in item]
+        
+        started = time.perf_counter()
+        await self._abatch_route(items, max_concurrency)
+        routed = time.perf_counter()
+        await self._abatch_retrieve(live())
+        retrieved = time.perf_counter()
+        await self._abatch_answer(live(), max_concurrency)
+        answered = time.perf_counter()
+        
+        phases = {
+            "route_ms": round((routed - started) * 1000, 1),
+            "retrieve_ms": round((retrieved - routed) * 1000, 1),
+            "answer_ms": round((answered - retrieved) * 1000, 1),
+        }
+        results = []
+        for key in keys:
+            item = unique[key]
+            if "error" in item:
+                results.append(item["error"])
+                continue
+            result = self._build_result(
+                item["answer"], item["strategy"], item["routing"], item["sources"], item["user_id"],
+                {**phases, **item["timings"]}, item["answer_mode"]
+            )
+            result["metadata"]["batch"] = {"size": len(requests), "unique": len(items)}
+            results.append(result)
+        return results
 
 
 @lru_cache()
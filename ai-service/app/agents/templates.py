@@ -0,0 +1,158 @@
+"""
+Deterministic answer templates for structured intents.
+
+Renders the rows ChatAgent already loads for best sellers, price extremes,
+stock checks and order status straight into a Vietnamese answer, so these
+questions don't need an LLM call. The LLM can still rephrase the result
+when a request asks for polish.
+"""
+from typing import Optional
+
+
+ORDER_STATUS_LABELS = {
+    "pending": "Chờ xác nhận",
+    "confirmed": "Đã xác nhận",
+    "shipping": "Đang giao hàng",
+    "delivered": "Đã giao hàng",
+    "completed": "Hoàn thành",
+    "cancelled": "Đã hủy",
+}
+
+
+class _Defaults(dict):
+    """format_map mapping that renders missing fields as N/A."""
+
+    def __missing__(self, key):
+        return "N/A"
+
+
+def format_price(price) -> str:
+    """Format price in Vietnamese style: 500.000₫."""
+    return f"{float(price or 0):,.0f}₫".replace(",", ".")
+
+
+def _stock_text(stock) -> str:
+    stock = int(stock or 0)
+    return f"còn {stock} sản phẩm" if stock > 0 else "hết hàng"
+
+
+class AnswerTemplate:
+    """
+    A header/row/footer template.
+
+    List templates render `row` once per item; single-item templates render
+    only `header` from the item's fields. `empty` is used when there is no data.
+    """
+
+    def __init__(self, header: str, empty: str, row: Optional[str] = None, footer: Optional[str] = None):
+        self.header = header
+        self.empty = empty
+        self.row = row
+        self.footer = footer
+
+    def render_empty(self, fields: dict) -> str:
+        return self.empty.format_map(_Defaults(fields))
+
+    def render(self, fields: dict, items: Optional[list[dict]] = None) -> str:
+        if self.row is not None and not items:
+            return self.render_empty(fields)
+        parts = [self.header.format_map(_Defaults(fields))]
+        if self.row is not None:
+            parts.extend(
+                self.row.format_map(_Defaults(item, index=i))
+                for i, item in enumerate(items, 1)
+            )
+        if self.footer:
+            parts.append(self.footer.format_map(_Defaults(fields)))
+        return "\n".join(parts)
+
+
+_PRODUCT_ROW = "{index}. **{name}** - {price}/ngày | Danh mục: {category} | {stock_text}"
+
+TEMPLATES = {
+    "best_sellers": AnswerTemplate(
+        header="Top {count} sản phẩm{scope} được thuê nhiều nhất trên ReRent:",
+        row="{index}. **{name}** - {price}/ngày ({total_rented} lượt thuê) | Danh mục: {category} | {stock_text}",
+        footer="Bạn muốn xem chi tiết hoặc thuê sản phẩm nào không?",
+        empty="Hiện chưa có dữ liệu về sản phẩm được thuê nhiều. Bạn mô tả nhu cầu để mình gợi ý sản phẩm phù hợp nhé!",
+    ),
+    "most_expensive": AnswerTemplate(
+        header="Top {count} sản phẩm{scope} có giá thuê cao nhất hiện còn hàng:",
+        row=_PRODUCT_ROW,
+        footer="Bạn muốn xem chi tiết sản phẩm nào không?",
+        empty="Hiện chưa có sản phẩm{scope} nào còn hàng trong hệ thống.",
+    ),
+    "cheapest": AnswerTemplate(
+        header="Top {count} sản phẩm{scope} có giá thuê rẻ nhất hiện còn hàng:",
+        row=_PRODUCT_ROW,
+        footer="Bạn muốn xem chi tiết sản phẩm nào không?",
+        empty="Hiện chưa có sản phẩm{scope} nào còn hàng trong hệ thống.",
+    ),
+    "check_stock": AnswerTemplate(
+        header="Sản phẩm **{name}** (#{id}) hiện {stock_text}. Trạng thái: {status}.",
+        empty="Mình không tìm thấy sản phẩm #{product_id}. Bạn kiểm tra lại mã sản phẩm giúp mình nhé!",
+    ),
+    "order_status": AnswerTemplate(
+        header=(
+            "Thông tin đơn hàng #{id} của bạn:\n"
+            "- Trạng thái: {status_label}\n"
+            "- Tổng tiền: {total}\n"
+            "- Thời gian thuê: {start_date} - {end_date}\n"
+            "- Địa chỉ giao hàng: {address}"
+        ),
+        empty="Mình không tìm thấy đơn hàng #{order_id} trong tài khoản của bạn. Bạn kiểm tra lại mã đơn giúp mình nhé!",
+    ),
+}
+
+
+def _product_item(product: dict) -> dict:
+    return {
+        "name": product.get("name"),
+        "price": format_price(product.get("price")),
+        "category": product.get("category_name") or "Chưa phân loại",
+        "stock_text": _stock_text(product.get("stock")),
+        "total_rented": int(product.get("total_rented") or 0),
+    }
+
+
+def supports(intent: str) -> bool:
+    """Whether `intent` can be answered from a template."""
+    return intent in TEMPLATES
+
+
+def render_answer(intent: str, data: Optional[dict]) -> Optional[str]:
+    """Render a deterministic answer from intent data, or None if unsupported."""
+    template = TEMPLATES.get(intent)
+    if template is None or data is None:
+        return None
+
+    if intent in ("best_sellers", "most_expensive", "cheapest"):
+        items = [_product_item(p) for p in data.get("products") or []]
+        scope = f" thuộc danh mục {data['category']}" if data.get("category") else ""
+        return template.render({"count": len(items), "scope": scope}, items)
+
+    if intent == "check_stock":
+        product = data.get("product")
+        if not product:
+            return template.render_empty(data)
+        return template.render({
+            "id": product["id"],
+            "name": product["name"],
+            "stock_text": _stock_text(product.get("stock")),
+            "status": product.get("status"),
+        })
+
+    if intent == "order_status":
+        order = data.get("order")
+        if not order:
+            return template.render_empty(data)
+        return template.render({
+            "id": order["id"],
+            "status_label": ORDER_STATUS_LABELS.get(order.get("status"), order.get("status")),
+            "total": format_price(order.get("total_amount")),
+            "start_date": order.get("start_date") or "N/A",
+            "end_date": order.get("end_date") or "N/A",
+            "address": order.get("address") or "N/A",
+        })
+
+    return None
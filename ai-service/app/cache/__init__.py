@@ -0,0 +1,3 @@
+from .answer_cache import AnswerCache, get_answer_cache, normalize_query, prior_turns, is_user_specific
+from .router_cache import RouterCache, get_router_cache
+from .request_coalescer import RequestCoalescer, get_request_coalescer
@@ -0,0 +1,317 @@
+"""
+Semantic answer cache for /ask.
+
+Answers are looked up by exact normalized query first, then by embedding
+similarity within the caller's scope. Answers that depend on the caller
+(order history, SQL touching user_id) are stored per user and never
+served to anyone else.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from app.config import get_settings
+from app.database import get_mysql_client
+from app.vectorstore import get_vectorstore
+
+
+# ChatAgent intents whose answers are built from the caller's own orders
+USER_SPECIFIC_INTENTS = {"order_history", "order_status"}
+
+# Metadata about how one request was served, not part of the answer itself
+REQUEST_METADATA = ("cache", "coalesced", "db_round_trips")
+
+# Answers derived from rankings/aggregates over the whole catalog; any product
+# change can alter them, not only changes to products they cite.
+CATALOG_WIDE_INTENTS = {"best_sellers", "most_expensive", "cheapest"}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, NFC-normalize and collapse whitespace/trailing punctuation."""
+    text = unicodedata.normalize("NFC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.…")
+
+
+def prior_turns(conversation_history: Optional[list[dict]], query: str) -> list[dict]:
+    """
+    Conversation turns before the current question.
+
+    The Laravel ChatController saves the user's message before calling the
+    AI service, so the history it sends ends with the question being asked.
+    """
+    history = list(conversation_history or [])
+    if (
+        history
+        and history[-1].get("role") == "user"
+        and normalize_query(history[-1].get("content") or "") == normalize_query(query)
+    ):
+        history.pop()
+    return history
+
+
+def is_user_specific(result: dict) -> bool:
+    """Whether an answer was built from the caller's own data (orders, SQL on user_id)."""
+    metadata = result.get("metadata") or {}
+    sql = (metadata.get("sql_query") or "").lower()
+    return (
+        metadata.get("intent") in USER_SPECIFIC_INTENTS
+        or metadata.get("strategy") == "orders"
+        or "user_id" in sql
+        or "orders" in sql
+    )
+
+
+def query_signature(normalized: str) -> tuple[str, Optional[str]]:
+    """
+    (rule-based intent, mentioned category) of a normalized query.
+
+    "bàn tiệc rẻ nhất" and "bàn tiệc đắt nhất" embed almost identically;
+    their intents tell them apart, and the category tells apart the same
+    question asked about two categories.
+    """
+    # Imported here: the agents import this package
+    from app.agents.chat_agent import get_chat_agent
+    intent, intent_data, _ = get_chat_agent().classify_intent(normalized)
+    category = intent_data.get("category") or get_mysql_client().match_category(normalized)
+    return intent, category
+
+
+class AnswerCache:
+    """TTL + LRU cache of chat answers with embedding-similarity lookup."""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 600.0,
+        user_ttl: float = 60.0,
+        similarity_threshold: float = 0.95
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.user_ttl = user_ttl
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], dict] = OrderedDict()
+
+        # Metrics
+        self._hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._saved_seconds = 0.0
+
+    def _caller_scopes(self, namespace: str, user_id: Optional[int]) -> list[str]:
+        """Scopes a caller may read from: shared answers, then their own."""
+        if user_id is None:
+            return [f"{namespace}:shared:anon"]
+        return [f"{namespace}:shared:auth", f"{namespace}:user:{user_id}"]
+
+    def _result_scope(self, namespace: str, user_id: Optional[int], result: dict) -> str:
+        """Scope to store an answer under, based on how it was produced."""
+        if user_id is None:
+            return f"{namespace}:shared:anon"
+        if is_user_specific(result):
+            return f"{namespace}:user:{user_id}"
+        return f"{namespace}:shared:auth"
+
+    def _invalidation_kind(self, result: dict) -> str:
+        """How product changes affect this answer: 'none', 'products' or 'catalog'."""
+        metadata = result.get("metadata") or {}
+        if metadata.get("strategy") == "conversation":
+            return "none"
+        if metadata.get("strategy") == "sql" or metadata.get("intent") in CATALOG_WIDE_INTENTS:
+            return "catalog"
+        return "products"
+
+    def _is_fresh(self, entry: dict, now: float) -> bool:
+        return now - entry["created_at"] <= entry["ttl"]
+
+    def _numbers_match(self, a: str, b: str) -> bool:
+        # "đơn #12" and "đơn #13" embed almost identically but differ in meaning
+        return re.findall(r"\d+", a) == re.findall(r"\d+", b)
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(get_vectorstore().embed_texts([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _usable(self, entry: dict, now: float, templates_only: bool) -> bool:
+        if not self._is_fresh(entry, now):
+            return False
+        # Template answers are rendered from the question alone, never from earlier turns
+        return not templates_only or entry["result"].get("metadata", {}).get("answer_mode") == "template"
+
+    def lookup(
+        self,
+        query: str,
+        user_id: Optional[int],
+        namespace: str,
+        templates_only: bool = False
+    ) -> tuple[Optional[dict], dict]:
+        """
+        Find a cached answer for the caller.
+
+        A semantic (embedding-similarity) hit must also have the same digits,
+        rule-based intent and category as the query. Follow-up questions pass
+        templates_only=True: only template answers ignore the conversation.
+
+        Returns (result or None, probe). Pass the probe to store() on a miss
+        so the query is not normalized and embedded twice.
+        """
+        normalized = normalize_query(query)
+        scopes = self._caller_scopes(namespace, user_id)
+        probe = {
+            "normalized": normalized, "namespace": namespace, "user_id": user_id,
+            "embedding": None, "signature": None,
+        }
+        now = time.monotonic()
+
+        with self._lock:
+            for scope in scopes:
+                entry = self._entries.get((scope, normalized))
+                if entry and self._usable(entry, now, templates_only):
+                    self._entries.move_to_end((scope, normalized))
+                    self._hits += 1
+                    self._saved_seconds += entry["compute_seconds"]
+                    return self._serve(entry, user_id, "hit", 1.0), probe
+
+        probe["embedding"] = self._embed(normalized)
+        probe["signature"] = query_signature(normalized)
+
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] in scopes
+                and self._usable(entry, now, templates_only)
+                and self._numbers_match(normalized, entry["normalized"])
+                and entry["signature"] == probe["signature"]
+            ]
+            if candidates:
+                matrix = np.stack([entry["embedding"] for _, entry in candidates])
+                scores = matrix @ probe["embedding"]
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self._semantic_hits += 1
+                    self._saved_seconds += entry["compute_seconds"]
+                    return self._serve(entry, user_id, "semantic_hit", float(scores[best])), probe
+            self._misses += 1
+
+        return None, probe
+
+    def _serve(self, entry: dict, user_id: Optional[int], kind: str, similarity: float) -> dict:
+        """Copy a cached result and stamp the current caller into its metadata."""
+        result = dict(entry["result"])
+        metadata = dict(result.get("metadata") or {})
+        metadata["user_id"] = user_id
+        metadata["cache"] = {
+            "status": kind,
+            "similarity": round(similarity, 4),
+            "age_seconds": round(time.monotonic() - entry["created_at"], 1),
+        }
+        result["metadata"] = metadata
+        return result
+
+    def store(self, probe: dict, result: dict, compute_seconds: float) -> None:
+        """Cache a freshly computed answer."""
+        scope = self._result_scope(probe["namespace"], probe["user_id"], result)
+        embedding = probe["embedding"]
+        if embedding is None:
+            embedding = self._embed(probe["normalized"])
+        signature = probe["signature"] or query_signature(probe["normalized"])
+        entry = {
+            "normalized": probe["normalized"],
+            "embedding": embedding,
+            "signature": signature,
+            "result": {
+                **result,
+                "metadata": {
+                    key: value for key, value in (result.get("metadata") or {}).items()
+                    if key not in REQUEST_METADATA
+                },
+            },
+            "product_ids": {
+                s["product_id"] for s in result.get("sources", []) if s.get("product_id") is not None
+            },
+            "invalidation": self._invalidation_kind(result),
+            "ttl": self.user_ttl if ":user:" in scope else self.ttl,
+            "created_at": time.monotonic(),
+            "compute_seconds": compute_seconds,
+        }
+        if entry["invalidation"] == "products" and not entry["product_ids"]:
+            # Nothing to attribute it to (e.g. stock checks): drop on any change
+            entry["invalidation"] = "catalog"
+        key = (scope, probe["normalized"])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate_products(self, product_ids: set[int]) -> int:
+        """Drop answers citing the given products and all catalog-wide answers."""
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry["invalidation"] == "catalog"
+                or (entry["invalidation"] == "products" and entry["product_ids"] & product_ids)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+            return len(stale)
+
+    def clear(self) -> int:
+        """Drop every cached answer."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._invalidations += count
+            return count
+
+    def on_sync(self, event: dict) -> None:
+        """Vector store sync listener: invalidate per product, or everything after a full sync."""
+        if event.get("full") or event.get("product_ids") is None:
+            self.clear()
+        else:
+            self.invalidate_products(event["product_ids"])
+
+    def stats(self) -> dict:
+        """Hit rate and LLM latency saved by the cache."""
+        with self._lock:
+            lookups = self._hits + self._semantic_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "semantic_hits": self._semantic_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._hits + self._semantic_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "saved_llm_seconds": round(self._saved_seconds, 3),
+            }
+
+
+@lru_cache()
+def get_answer_cache() -> AnswerCache:
+    """Get cached AnswerCache instance, subscribed to vector store syncs."""
+    settings = get_settings()
+    cache = AnswerCache(
+        max_entries=settings.answer_cache_max_entries,
+        ttl=settings.answer_cache_ttl,
+        user_ttl=settings.answer_cache_user_ttl,
+        similarity_threshold=settings.answer_cache_similarity,
+    )
+    get_vectorstore().add_sync_listener(cache.on_sync)
+    return cache
@@ -0,0 +1,129 @@
+"""
+Single-flight coalescing of identical chat requests.
+
+When many users ask the same question at once (e.g. when a promo goes
+live), only the first request runs routing, retrieval and generation; the
+others wait for it and receive a copy of its result. A finished result
+stays joinable for a short window to absorb requests that arrive just
+after it completed.
+"""
+import asyncio
+import copy
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional
+
+from app.config import get_settings
+
+
+class RequestCoalescer:
+    """Shares one in-flight computation between callers with the same key."""
+
+    def __init__(self, window: float = 0.0):
+        self.window = window  # seconds a finished result stays joinable
+        self._lock = threading.Lock()
+        # Blocking callers (threads) and async callers (tasks) wait differently
+        self._flights: dict[str, dict] = {}
+        self._tasks: dict[str, dict] = {}
+        self._requests = 0
+        self._executions = 0
+        self._failures = 0
+
+    def _join(self, flights: dict[str, dict], key: str) -> Optional[dict]:
+        """The flight a caller can join for key, if any. Caller holds the lock."""
+        flight = flights.get(key)
+        if flight is not None and flight["done_at"] is not None and time.monotonic() - flight["done_at"] > self.window:
+            del flights[key]
+            return None
+        return flight
+
+    def _begin(self, flights: dict[str, dict], key: str, flight: dict) -> dict:
+        """Register a new flight, dropping finished ones past the window. Caller holds the lock."""
+        now = time.monotonic()
+        for stale in [k for k, f in flights.items() if f["done_at"] is not None and now - f["done_at"] > self.window]:
+            del flights[stale]
+        flight["done_at"] = None
+        flights[key] = flight
+        self._executions += 1
+        return flight
+
+    def _finish(self, flights: dict[str, dict], key: str, flight: dict, failed: bool) -> None:
+        with self._lock:
+            flight["done_at"] = time.monotonic()
+            if failed:
+                self._failures += 1
+            # Errors are shared with callers already waiting, never replayed later
+            if (failed or self.window <= 0) and flights.get(key) is flight:
+                del flights[key]
+
+    def run(self, key: str, compute: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Run compute() once for concurrent callers with the same key.
+
+        Returns (result, coalesced); every caller gets its own deep copy of
+        the result, and the leader's exception is raised in all of them.
+        """
+        with self._lock:
+            self._requests += 1
+            flight = self._join(self._flights, key)
+            leader = flight is None
+            if leader:
+                flight = self._begin(self._flights, key, {"event": threading.Event()})
+
+        if not leader:
+            flight["event"].wait()
+        else:
+            try:
+                flight["result"] = compute()
+            except Exception as e:
+                flight["error"] = e
+            finally:
+                flight["event"].set()
+                self._finish(self._flights, key, flight, "error" in flight)
+
+        if "error" in flight:
+            raise flight["error"]
+        return copy.deepcopy(flight["result"]), not leader
+
+    async def arun(self, key: str, compute: Callable[[], Awaitable]) -> tuple[Any, bool]:
+        """Async variant of run: compute() is awaited once as a shared task."""
+        with self._lock:
+            self._requests += 1
+            flight = self._join(self._tasks, key)
+            leader = flight is None
+            if leader:
+                flight = self._begin(self._tasks, key, {"task": asyncio.ensure_future(compute())})
+                flight["task"].add_done_callback(
+                    lambda task: self._finish(
+                        self._tasks, key, flight, task.cancelled() or task.exception() is not None
+                    )
+                )
+
+        # Shielded so a caller that goes away doesn't cancel everyone else's answer
+        result = await asyncio.shield(flight["task"])
+        return copy.deepcopy(result), not leader
+
+    def stats(self) -> dict:
+        """How many requests were answered by joining another request's computation."""
+        with self._lock:
+            coalesced = self._requests - self._executions
+            in_flight = sum(
+                1 for flights in (self._flights, self._tasks)
+                for flight in flights.values() if flight["done_at"] is None
+            )
+            return {
+                "window_ms": round(self.window * 1000),
+                "requests": self._requests,
+                "executions": self._executions,
+                "coalesced": coalesced,
+                "coalescing_ratio": round(coalesced / self._requests, 4) if self._requests else 0.0,
+                "failures": self._failures,
+                "in_flight": in_flight,
+            }
+
+
+@lru_cache()
+def get_request_coalescer() -> RequestCoalescer:
+    """Get cached RequestCoalescer instance."""
+    return RequestCoalescer(window=get_settings().request_coalescing_window_ms / 1000)
@@ -0,0 +1,211 @@
+"""
+Persistent cache of SmartChatAgent routing decisions.
+
+Maps a normalized question to the router's JSON (strategy, sql_query with
+the {user_id} placeholder kept, search_query, filters) so repeated questions skip
+the routing LLM call. Entries live in memory as an LRU and are written
+through to SQLite so they survive restarts and are shared by workers. The
+SQLite row is the source of truth: every hit re-reads it, so a decision
+discarded or replaced by one worker is not served by the others.
+
+The router's free-text `reasoning` can quote the original asker's data, so
+it is replaced by a neutral note before a decision is stored.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from app.config import get_settings
+from app.cache.answer_cache import normalize_query
+
+
+ROUTING_FIELDS = ("strategy", "reasoning", "sql_query", "search_query", "filters")
+VALID_STRATEGIES = {"sql", "vector", "conversation"}
+
+
+class RouterCache:
+    """Bounded LRU of routing decisions, persisted to SQLite."""
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._rejected = 0
+
+        self._open()
+
+    def _open(self) -> None:
+        """Open the SQLite store and load the most recently used entries."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS router_cache (
+                key TEXT PRIMARY KEY,
+                routing TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT key, routing FROM router_cache ORDER BY last_used DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for key, routing in reversed(rows):
+            self._entries[key] = self._entry(json.loads(routing))
+
+    def _key(self, question: str, user_id: Optional[int]) -> str:
+        # Routing differs for anonymous callers (no user to filter orders by),
+        # but never depends on which signed-in user is asking.
+        scope = "auth" if user_id is not None else "anon"
+        return f"{scope}:{normalize_query(question)}"
+
+    def _is_cacheable(self, routing: dict) -> bool:
+        """Only cache well-formed decisions whose SQL is user-independent."""
+        if routing.get("parse_error") or routing.get("strategy") not in VALID_STRATEGIES:
+            return False
+        if routing["strategy"] == "sql":
+            sql = routing.get("sql_query") or ""
+            if not sql:
+                return False
+            # A literal user id spliced into the SQL would leak across users
+            if "user_id" in sql.lower() and "{user_id}" not in sql:
+                return False
+        return True
+
+    @staticmethod
+    def _entry(routing: dict) -> dict:
+        """The stored form of a decision: routing fields, reasoning neutralized."""
+        entry = {field: routing.get(field) for field in ROUTING_FIELDS}
+        entry["reasoning"] = f"Cached routing decision ({entry.get('strategy')})"
+        return entry
+
+    def get(self, question: str, user_id: Optional[int]) -> Optional[dict]:
+        """Return a copy of the cached routing, or None."""
+        key = self._key(question, user_id)
+        with self._lock:
+            # Another worker may have discarded or replaced the decision
+            row = self._conn.execute("SELECT routing FROM router_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._entries.pop(key, None)
+                self._misses += 1
+                return None
+            routing = self._entry(json.loads(row[0]))
+            self._entries[key] = routing
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                # Picked up from another worker; the row stays for them
+                self._entries.popitem(last=False)
+            self._hits += 1
+            return dict(routing)
+
+    def put(self, question: str, user_id: Optional[int], routing: dict) -> bool:
+        """Cache a routing decision; returns False if it was not cacheable."""
+        if not self._is_cacheable(routing):
+            with self._lock:
+                self._rejected += 1
+            return False
+        self._store(self._key(question, user_id), self._entry(routing))
+        return True
+
+    def _store(self, key: str, routing: dict) -> None:
+        with self._lock:
+            self._entries[key] = routing
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+                self._evictions += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO router_cache (key, routing, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(routing, ensure_ascii=False), time.time())
+            )
+            if evicted:
+                self._conn.executemany("DELETE FROM router_cache WHERE key = ?", [(k,) for k in evicted])
+            self._conn.commit()
+
+    def discard(self, question: str, user_id: Optional[int]) -> None:
+        """Forget a decision, e.g. after its SQL failed to execute, in every worker."""
+        key = self._key(question, user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._conn.execute("DELETE FROM router_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Drop every cached decision."""
+        with self._lock:
+            self._entries.clear()
+            self._conn.execute("DELETE FROM router_cache")
+            self._conn.commit()
+
+    def warm(self, records: Iterable[dict]) -> int:
+        """
+        Load decisions from recorded traffic.
+
+        Each record is {"question", "user_id" (optional), "routing": {...}}.
+        Returns the number of decisions cached.
+        """
+        loaded = 0
+        for record in records:
+            routing = record.get("routing") or {}
+            if record.get("question") and self.put(record["question"], record.get("user_id"), routing):
+                loaded += 1
+        return loaded
+
+    def warm_from_jsonl(self, path: str) -> int:
+        """Warm from a JSON-lines file of recorded traffic."""
+        with open(path, encoding="utf-8") as f:
+            return self.warm(json.loads(line) for line in f if line.strip())
+
+    def flush(self) -> None:
+        """Persist in-memory recency so the hottest entries reload first."""
+        with self._lock:
+            now = time.time()
+            # Entries are in LRU order; spread timestamps to preserve it
+            self._conn.executemany(
+                "UPDATE router_cache SET last_used = ? WHERE key = ?",
+                [(now - (len(self._entries) - i) * 1e-3, key) for i, key in enumerate(self._entries)]
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "rejected": self._rejected,
+            }
+
+
+@lru_cache()
+def get_router_cache() -> RouterCache:
+    """Get cached RouterCache instance."""
+    settings = get_settings()
+    path = settings.router_cache_path or os.path.join(
+        settings.chroma_persist_directory, "router_cache.sqlite3"
+    )
+    return RouterCache(path, max_entries=settings.router_cache_max_entries)
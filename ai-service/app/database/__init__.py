@@ -1 +1,4 @@
-from .mysql_client import MySQLClient, get_mysql_client
+from .mysql_client import (
+    MySQLClient, get_mysql_client, track_round_trips, round_trips_so_far, add_round_trips
+)
+from .sql_guard import GuardedSQLExecutor, UnsafeSQLError, schema_columns
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+import pymysql
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of pymysql connections.
+
+    - Opens connections lazily up to max_size; warm() pre-opens min_size
+    - Callers wait up to `timeout` seconds for a free connection
+    - Idle connections are pinged on checkout and replaced if dead
+    - Connections older than `recycle` seconds are closed and reopened
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], pymysql.connections.Connection],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        recycle: float = 3600.0,
+        name: str = "mysql"
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.name = name
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle: deque[pymysql.connections.Connection] = deque()
+        self._created_at: dict[int, float] = {}
+        self._size = 0  # open connections, idle + checked out
+        self._closed = False
+
+        # Metrics
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._broken = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _open(self) -> pymysql.connections.Connection:
+        """Open a new connection; the caller has already reserved a slot."""
+        conn = self._connect()
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._created += 1
+        return conn
+
+    def _discard(self, conn: pymysql.connections.Connection) -> None:
+        """Close a connection without releasing its slot."""
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+        try:
+            if conn.open:
+                conn.close()
+        except Exception:
+            pass
+
+    def _free_slot(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_expired(self, conn: pymysql.connections.Connection) -> bool:
+        created = self._created_at.get(id(conn))
+        return self.recycle > 0 and created is not None and time.monotonic() - created > self.recycle
+
+    def _is_alive(self, conn: pymysql.connections.Connection) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def warm(self) -> None:
+        """Pre-open connections up to min_size."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                self._free_slot()
+                raise
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def acquire(self, timeout: Optional[float] = None) -> pymysql.connections.Connection:
+        """Check out a live connection, waiting up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        conn = None
+
+        with self._cond:
+            if self._closed:
+                raise PoolTimeoutError(f"{self.name} pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn = self._idle.pop()  # LIFO keeps hot connections warm
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout:.1f}s waiting for a {self.name} connection "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is not None and self._is_expired(conn):
+                self._discard(conn)
+                conn = None
+                with self._cond:
+                    self._recycled += 1
+            elif conn is not None and not self._is_alive(conn):
+                self._discard(conn)
+                conn = None
+                with self._cond:
+                    self._broken += 1
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            self._free_slot()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn: pymysql.connections.Connection, discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if broken."""
+        if discard or self._closed or not conn.open:
+            self._discard(conn)
+            self._free_slot()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[pymysql.connections.Connection]:
+        """Borrow a connection for the duration of a `with` block."""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            # Connection-level failure: don't hand this connection out again
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def stats(self) -> dict:
+        """Pool sizing and wait metrics."""
+        with self._cond:
+            return {
+                "name": self.name,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "recycled": self._recycled,
+                "broken": self._broken,
+                "avg_wait_ms": round(self._wait_total / self._checkouts * 1000, 2) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+            }
+
+    def close(self) -> None:
+        """Close idle connections and stop handing out new ones."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
@@ -0,0 +1,153 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+class QueryCache:
+    """
+    TTL + LRU cache of MySQL read results, invalidated by table versions.
+
+    Every entry records the version of each table it was read from. Bumping a
+    table (after a product sync, from the invalidation webhook, or when the
+    poller sees a new information_schema UPDATE_TIME) makes every entry that
+    read it stale without scanning the cache.
+    """
+
+    def __init__(self, max_entries: int = 2000, default_ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
+        self._versions: dict[str, int] = defaultdict(int)
+        self._update_times: dict[str, Any] = {}
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Per-method metrics
+        self._metrics: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "stale": 0, "expired": 0}
+        )
+        self._evictions = 0
+
+    def get_or_load(
+        self,
+        method: str,
+        key: Hashable,
+        tables: Iterable[str],
+        loader: Callable[[], Any],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """Return the cached result for (method, key), loading it on a miss."""
+        cache_key = (method, key)
+        now = time.monotonic()
+        with self._lock:
+            metrics = self._metrics[method]
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if now - entry["created_at"] > entry["ttl"]:
+                    metrics["expired"] += 1
+                    del self._entries[cache_key]
+                elif any(self._versions[t] != v for t, v in entry["versions"].items()):
+                    metrics["stale"] += 1
+                    del self._entries[cache_key]
+                else:
+                    self._entries.move_to_end(cache_key)
+                    metrics["hits"] += 1
+                    return copy.deepcopy(entry["value"])
+            metrics["misses"] += 1
+            # Versions are taken before the read so a bump during the query
+            # leaves the new entry already stale.
+            versions = {t: self._versions[t] for t in tables}
+
+        value = loader()
+
+        with self._lock:
+            self._entries[cache_key] = {
+                "value": copy.deepcopy(value),
+                "versions": versions,
+                "ttl": self.default_ttl if ttl is None else ttl,
+                "created_at": now,
+            }
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return value
+
+    def bump(self, tables: Optional[Iterable[str]] = None) -> dict[str, int]:
+        """Invalidate results read from `tables` (every table when None)."""
+        with self._lock:
+            if tables is None:
+                tables = list(self._versions) or []
+                self._entries.clear()
+            for table in tables:
+                self._versions[table.lower()] += 1
+            return dict(self._versions)
+
+    def observe_update_times(self, update_times: dict[str, Any]) -> list[str]:
+        """Bump tables whose information_schema UPDATE_TIME moved since the last poll."""
+        with self._lock:
+            changed = [
+                table for table, updated in update_times.items()
+                if table in self._update_times and updated != self._update_times[table]
+            ]
+            self._update_times.update(update_times)
+        if changed:
+            self.bump(changed)
+        return changed
+
+    def start_polling(self, fetch: Callable[[], dict[str, Any]], interval: float) -> None:
+        """Poll table update times in a daemon thread until close()."""
+        if interval <= 0 or self._poller is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.observe_update_times(fetch())
+                except Exception as e:
+                    print(f"[ERROR] Query cache table poll failed: {e}")
+                self._stop.wait(interval)
+
+        self._poller = threading.Thread(target=run, name="query-cache-poll", daemon=True)
+        self._poller.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            methods = {}
+            for method, m in self._metrics.items():
+                lookups = m["hits"] + m["misses"]
+                methods[method] = {**m, "hit_rate": round(m["hits"] / lookups, 4) if lookups else 0.0}
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "table_versions": dict(self._versions),
+                "polling": self._poller is not None and not self._stop.is_set(),
+                "methods": methods,
+            }
+
+
+def cached_query(tables: tuple[str, ...], ttl: Optional[float] = None):
+    """
+    Cache a MySQLClient read method through its `query_cache`.
+
+    Results are keyed by the call arguments and dropped when any of `tables`
+    is bumped or after `ttl` seconds (the cache default when None).
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            cache = self.query_cache
+            if cache is None:
+                return fn(self, *args, **kwargs)
+            key = (args, tuple(sorted(kwargs.items())))
+            return cache.get_or_load(fn.__name__, key, tables, lambda: fn(self, *args, **kwargs), ttl)
+        return wrapper
+    return decorator
@@ -0,0 +1,265 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from app.database.mysql_client import MySQLClient
+
+
+IN_STOCK_STATUS = "Còn hàng"
+
+
+def _category_key(name: Optional[str]) -> str:
+    return unicodedata.normalize("NFC", name or "").strip().lower()
+
+
+class RankingIndex:
+    """
+    In-memory best-seller and price rankings, maintained incrementally.
+
+    Built once from MySQL, then refreshed by reading only order_items rows
+    past the last seen id and products changed since the last seen
+    updated_at. Rankings are kept as sorted lists (overall and per category)
+    so top-N lookups are a slice. Products deleted from MySQL are dropped
+    when a vector store sync reports them (see drop()); a periodic full
+    rebuild picks up the rest of what the incremental path can't see:
+    deleted order items and edited quantities.
+    """
+
+    def __init__(
+        self,
+        client: "MySQLClient",
+        refresh_interval: float = 30.0,
+        rebuild_interval: float = 3600.0,
+        chunk_size: int = 500
+    ):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        # Serializes build/refresh so two refreshes never apply the same rows
+        self._update_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._reset()
+
+        # Metrics
+        self._builds = 0
+        self._refreshes = 0
+        self._lookups = 0
+        self._built_at: Optional[float] = None
+        self._build_seconds = 0.0
+
+    def _reset(self) -> None:
+        self.ready = False
+        self._products: dict[int, dict] = {}
+        self._rented: dict[int, int] = defaultdict(int)
+        self._last_item_id = 0
+        self._products_since = None
+        # Sorted (key, product_id) lists; None holds the overall ranking
+        self._by_rented: dict[Optional[str], list[tuple]] = defaultdict(list)
+        self._by_price: dict[Optional[str], list[tuple]] = defaultdict(list)
+        self._category_names: dict[str, str] = {}
+
+    # ----- maintenance -----
+
+    def _rented_key(self, product_id: int) -> tuple:
+        return (-self._rented[product_id], product_id)
+
+    def _price_key(self, product: dict) -> tuple:
+        return (float(product.get("price") or 0), product["id"])
+
+    @staticmethod
+    def _remove(ranking: list[tuple], key: tuple) -> None:
+        i = bisect_left(ranking, key)
+        if i < len(ranking) and ranking[i] == key:
+            del ranking[i]
+
+    def _unindex(self, product_id: int) -> None:
+        product = self._products.get(product_id)
+        if product is None:
+            return
+        category = _category_key(product.get("category_name"))
+        rented_key = self._rented_key(product_id)
+        for scope in (None, category):
+            self._remove(self._by_rented[scope], rented_key)
+        if product.get("status") == IN_STOCK_STATUS:
+            price_key = self._price_key(product)
+            for scope in (None, category):
+                self._remove(self._by_price[scope], price_key)
+
+    def _index(self, product: dict) -> None:
+        category = _category_key(product.get("category_name"))
+        if category:
+            self._category_names[category] = product["category_name"]
+        rented_key = self._rented_key(product["id"])
+        for scope in (None, category):
+            insort(self._by_rented[scope], rented_key)
+        if product.get("status") == IN_STOCK_STATUS:
+            price_key = self._price_key(product)
+            for scope in (None, category):
+                insort(self._by_price[scope], price_key)
+
+    def _apply_products(self, rows: list[dict]) -> None:
+        for row in rows:
+            self._unindex(row["id"])
+            self._products[row["id"]] = row
+            self._index(row)
+            updated = row.get("updated_at")
+            if updated is not None and (self._products_since is None or updated > self._products_since):
+                self._products_since = updated
+
+    def _apply_rentals(self, items: list[dict]) -> None:
+        for item in items:
+            product_id = item["product_id"]
+            known = product_id in self._products
+            if known:
+                self._unindex(product_id)
+            self._rented[product_id] += int(item["quantity"] or 0)
+            if known:
+                self._index(self._products[product_id])
+            self._last_item_id = max(self._last_item_id, item["id"])
+
+    def build(self) -> None:
+        """Load every product and rental total from MySQL and swap in fresh rankings."""
+        with self._update_lock:
+            self._build()
+
+    def _build(self) -> None:
+        started = time.monotonic()
+        products = [
+            row for chunk in self.client.iter_products_updated_since(None, self.chunk_size)
+            for row in chunk
+        ]
+        totals, last_item_id = self.client.get_rental_totals()
+
+        with self._lock:
+            self._reset()
+            self._rented.update(totals)
+            self._last_item_id = last_item_id
+            self._apply_products(products)
+            self.ready = True
+            self._builds += 1
+            self._built_at = time.time()
+            self._build_seconds = time.monotonic() - started
+
+    def refresh(self) -> None:
+        """Apply products changed and order items added since the last refresh."""
+        with self._update_lock:
+            if self.ready:
+                self._refresh()
+
+    def _refresh(self) -> None:
+        rows = [
+            row for chunk in self.client.iter_products_updated_since(self._products_since, self.chunk_size)
+            for row in chunk
+        ]
+        items = self.client.get_order_items_after(self._last_item_id)
+        while items:
+            with self._lock:
+                self._apply_rentals(items)
+            if len(items) < self.chunk_size:
+                break
+            items = self.client.get_order_items_after(self._last_item_id)
+        with self._lock:
+            self._apply_products(rows)
+            self._refreshes += 1
+
+    def drop(self, product_ids: set[int]) -> None:
+        """Remove products deleted from MySQL, which a refresh never reads back."""
+        with self._update_lock, self._lock:
+            for product_id in product_ids:
+                self._unindex(product_id)
+                self._products.pop(product_id, None)
+
+    def start(self) -> None:
+        """Build in a daemon thread, then refresh periodically until stop()."""
+        if self._thread is not None:
+            return
+
+        def run():
+            last_build = 0.0
+            while not self._stop.is_set():
+                try:
+                    if not self.ready or time.monotonic() - last_build >= self.rebuild_interval:
+                        self.build()
+                        last_build = time.monotonic()
+                    else:
+                        self.refresh()
+                except Exception as e:
+                    print(f"[ERROR] Ranking index update failed: {e}")
+                self._stop.wait(self.refresh_interval)
+
+        self._thread = threading.Thread(target=run, name="ranking-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ----- lookups -----
+
+    def match_category(self, text: str) -> Optional[str]:
+        """Return the longest known category name mentioned in `text`."""
+        text = _category_key(text)
+        with self._lock:
+            matches = [key for key in self._category_names if key and key in text]
+            return self._category_names[max(matches, key=len)] if matches else None
+
+    def best_sellers(self, limit: int = 5, category: Optional[str] = None) -> list[dict]:
+        """Top rented products, optionally within a category (same rows as get_best_sellers)."""
+        with self._lock:
+            self._lookups += 1
+            ranking = self._by_rented.get(_category_key(category) if category else None, [])
+            return [
+                {
+                    "id": product["id"],
+                    "name": product["name"],
+                    "price": product["price"],
+                    "stock": product["stock"],
+                    "category_name": product.get("category_name"),
+                    "total_rented": -negative_total,
+                }
+                for negative_total, product_id in ranking[:limit]
+                for product in (self._products[product_id],)
+            ]
+
+    def by_price(self, order: str = "DESC", limit: int = 5, category: Optional[str] = None) -> list[dict]:
+        """In-stock products by price, optionally within a category (same rows as get_products_by_price)."""
+        with self._lock:
+            self._lookups += 1
+            ranking = self._by_price.get(_category_key(category) if category else None, [])
+            if order.upper() == "DESC":
+                keys = ranking[-limit:][::-1] if limit > 0 else []
+            else:
+                keys = ranking[:limit]
+            return [
+                {
+                    "id": product["id"],
+                    "name": product["name"],
+                    "description": product.get("description"),
+                    "price": product["price"],
+                    "stock": product["stock"],
+                    "category_name": product.get("category_name"),
+                }
+                for _, product_id in keys
+                for product in (self._products[product_id],)
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "products": len(self._products),
+                "in_stock": len(self._by_price.get(None, [])),
+                "categories": len(self._category_names),
+                "last_order_item_id": self._last_item_id,
+                "builds": self._builds,
+                "refreshes": self._refreshes,
+                "lookups": self._lookups,
+                "built_at": self._built_at,
+                "build_seconds": round(self._build_seconds, 3),
+            }
@@ -0,0 +1,302 @@
+import re
+from typing import Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from app.database.mysql_client import MySQLClient
+
+
+# Placeholder the router is told to use for the caller's id
+USER_ID_PLACEHOLDER = "{user_id}"
+
+# Stand-in for the bound parameter while the SQL is re-rendered; swapped for
+# %s after every literal '%' has been escaped for pymysql.
+_PARAM_SENTINEL = "__rerent_param__"
+
+# Functions that read server state or stall the connection
+FORBIDDEN_FUNCTIONS = {
+    "SLEEP", "BENCHMARK", "LOAD_FILE", "GET_LOCK", "RELEASE_LOCK",
+    "RELEASE_ALL_LOCKS", "IS_FREE_LOCK", "IS_USED_LOCK", "USER",
+    "CURRENT_USER", "SESSION_USER", "SYSTEM_USER", "DATABASE", "SCHEMA",
+    "VERSION", "CONNECTION_ID", "LAST_INSERT_ID", "MASTER_POS_WAIT",
+}
+
+# Nodes that write, lock or touch session state
+FORBIDDEN_NODES = (exp.Into, exp.Lock, exp.Parameter, exp.SessionParameter, exp.Command)
+
+# Tables a plain "my recent orders" query reads: orders, their items and products
+ORDER_HISTORY_TABLES = {"orders", "order_items", "products"}
+
+
+class UnsafeSQLError(ValueError):
+    """Raised when generated SQL fails validation or exceeds its budget."""
+
+
+def schema_columns(schema: str) -> dict[str, set[str]]:
+    """
+    Parse the prompt's schema description into {table: {columns}}.
+
+    Expects numbered table headers ("1. products - ...") followed by indented
+    column bullets ("   - id (INT, PK)", "   - created_at, updated_at (...)").
+    """
+    tables: dict[str, set[str]] = {}
+    current = None
+    for line in schema.splitlines():
+        header = re.match(r"^\d+\.\s+(\w+)", line)
+        if header:
+            current = tables.setdefault(header.group(1).lower(), set())
+            continue
+        column = re.match(r"^\s+-\s+([\w,\s]+?)\s*\(", line)
+        if column and current is not None:
+            current.update(name.strip().lower() for name in column.group(1).split(","))
+    return tables
+
+
+class GuardedSQLExecutor:
+    """
+    Validates and runs LLM-generated SELECT statements.
+
+    - Parses the SQL and allows a single SELECT/UNION over whitelisted tables and columns
+    - Injects LIMIT when missing and clamps it to max_limit
+    - Binds the caller's user_id as a query parameter
+    - Rejects plans whose EXPLAIN row estimate exceeds max_examined_rows
+    - Bounds run time with a MAX_EXECUTION_TIME hint and fetches at most max_rows
+    """
+
+    def __init__(
+        self,
+        client: MySQLClient,
+        allowed_columns: dict[str, set[str]],
+        max_limit: int = 10,
+        max_rows: int = 100,
+        max_examined_rows: int = 100_000,
+        max_execution_ms: int = 3000,
+        explain: bool = True,
+        cache_ttl: Optional[float] = None
+    ):
+        self.client = client
+        self.allowed_columns = {t.lower(): {c.lower() for c in cols} for t, cols in allowed_columns.items()}
+        self.all_columns = set().union(*self.allowed_columns.values()) if self.allowed_columns else set()
+        self.max_limit = max_limit
+        self.max_rows = max_rows
+        self.max_examined_rows = max_examined_rows
+        self.max_execution_ms = max_execution_ms
+        self.explain = explain
+        self.cache_ttl = cache_ttl
+
+    def _parse(self, sql: str) -> exp.Expression:
+        """Parse into exactly one SELECT or set operation."""
+        sql = sql.strip().rstrip(";").strip()
+        # Quoted or bare, the placeholder becomes a real bind parameter
+        for form in (f"'{USER_ID_PLACEHOLDER}'", f'"{USER_ID_PLACEHOLDER}"', USER_ID_PLACEHOLDER):
+            sql = sql.replace(form, ":user_id")
+        try:
+            statements = [s for s in sqlglot.parse(sql, read="mysql") if s is not None]
+        except SqlglotError as e:
+            raise UnsafeSQLError(f"Could not parse SQL: {e}") from e
+        if len(statements) != 1:
+            raise UnsafeSQLError("Exactly one statement is allowed")
+        tree = statements[0]
+        if not isinstance(tree, (exp.Select, exp.SetOperation)):
+            raise UnsafeSQLError(f"Only SELECT is allowed, got {tree.key.upper()}")
+        return tree
+
+    def _check_nodes(self, tree: exp.Expression) -> None:
+        for node in tree.walk():
+            if isinstance(node, FORBIDDEN_NODES):
+                raise UnsafeSQLError(f"{node.key.upper()} is not allowed")
+            if isinstance(node, exp.Func):
+                name = (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).upper()
+                if name in FORBIDDEN_FUNCTIONS:
+                    raise UnsafeSQLError(f"Function {name} is not allowed")
+            if isinstance(node, exp.Placeholder) and node.name != "user_id":
+                raise UnsafeSQLError(f"Unknown placeholder {node.sql()}")
+
+    def _check_schema(self, tree: exp.Expression) -> set[str]:
+        """
+        Whitelist tables and columns; CTEs, derived tables and aliases resolve locally.
+
+        Returns the real tables the statement reads.
+        """
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        # Table alias -> real table, or None for CTEs / derived tables
+        sources: dict[str, Optional[str]] = {}
+        for table in tree.find_all(exp.Table):
+            name = table.name.lower()
+            if table.args.get("db") or table.args.get("catalog"):
+                raise UnsafeSQLError(f"Table {table.sql(dialect='mysql')} is not allowed")
+            if name in cte_names:
+                sources[table.alias_or_name.lower()] = None
+                continue
+            if name not in self.allowed_columns:
+                raise UnsafeSQLError(f"Table {name} is not allowed")
+            sources[table.alias_or_name.lower()] = name
+        for subquery in tree.find_all(exp.Subquery):
+            if subquery.alias:
+                sources[subquery.alias.lower()] = None
+
+        output_aliases = {alias.alias.lower() for alias in tree.find_all(exp.Alias)}
+        for column in tree.find_all(exp.Column):
+            name = column.name.lower()
+            qualifier = column.table.lower()
+            if qualifier and qualifier not in sources:
+                raise UnsafeSQLError(f"Unknown table {column.table}")
+            if isinstance(column.this, exp.Star):
+                continue
+            table = sources.get(qualifier) if qualifier else None
+            if table is not None:
+                if name not in self.allowed_columns[table]:
+                    raise UnsafeSQLError(f"Column {table}.{name} is not allowed")
+            elif name not in self.all_columns and name not in output_aliases:
+                raise UnsafeSQLError(f"Column {name} is not allowed")
+        return {table for table in sources.values() if table is not None}
+
+    def _clamp_limit(self, tree: exp.Expression) -> None:
+        limit = tree.args.get("limit")
+        value = limit.expression if limit is not None else None
+        if isinstance(value, exp.Literal) and value.is_int and int(value.this) <= self.max_limit:
+            return
+        tree.limit(self.max_limit, copy=False)
+
+    def _add_time_hint(self, tree: exp.Expression) -> None:
+        """MAX_EXECUTION_TIME must sit on the statement's first SELECT."""
+        if not self.max_execution_ms:
+            return
+        first = tree
+        while isinstance(first, exp.SetOperation):
+            first = first.left
+        if isinstance(first, exp.Subquery):
+            first = first.unnest()
+        if isinstance(first, exp.Select):
+            first.set("hint", exp.Hint(expressions=[
+                exp.Anonymous(this="MAX_EXECUTION_TIME", expressions=[exp.Literal.number(self.max_execution_ms)])
+            ]))
+
+    def prepare(self, sql: str, user_id: Optional[int] = None) -> tuple[str, tuple, set[str]]:
+        """
+        Validate generated SQL.
+
+        Returns (sql, params) ready for cursor.execute() and the tables it reads.
+        The SQL is re-rendered from the parse tree, so formatting differences
+        between generations of the same query disappear.
+        """
+        tree = self._parse(sql)
+        self._check_nodes(tree)
+        tables = self._check_schema(tree)
+
+        placeholders = list(tree.find_all(exp.Placeholder))
+        if placeholders and user_id is None:
+            raise UnsafeSQLError("Query needs a signed-in user")
+        for placeholder in placeholders:
+            placeholder.replace(exp.var(_PARAM_SENTINEL))
+
+        self._clamp_limit(tree)
+        self._add_time_hint(tree)
+
+        rendered = tree.sql(dialect="mysql").replace("%", "%%").replace(_PARAM_SENTINEL, "%s")
+        return rendered, (user_id,) * len(placeholders), tables
+
+    @staticmethod
+    def _equalities(condition: Optional[exp.Expression]) -> Optional[list[exp.EQ]]:
+        """The `=` terms of an AND chain, or None if it holds anything else."""
+        if condition is None:
+            return []
+        terms = list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+        return terms if all(isinstance(term, exp.EQ) for term in terms) else None
+
+    def order_history_limit(self, sql: str) -> Optional[int]:
+        """
+        How many of the caller's newest orders `sql` lists, or None if it does more.
+
+        Matches a plain SELECT over orders (optionally joined to order_items
+        and products on column equalities) whose only filter is
+        `orders.user_id = {user_id}` and which is ordered newest first or not
+        at all, i.e. the rows MySQLClient.get_user_orders returns. Grouping,
+        aggregates, subqueries and any other filter make it None.
+        """
+        try:
+            tree = self._parse(sql)
+        except UnsafeSQLError:
+            return None
+        if (
+            not isinstance(tree, exp.Select)
+            or tree.args.get("group") or tree.args.get("having")
+            or tree.find(exp.AggFunc, exp.Subquery, exp.CTE, exp.Window)
+        ):
+            return None
+        tables = {table.alias_or_name.lower(): table.name.lower() for table in tree.find_all(exp.Table)}
+        if "orders" not in tables.values() or not set(tables.values()) <= ORDER_HISTORY_TABLES:
+            return None
+
+        for join in tree.args.get("joins") or []:
+            terms = self._equalities(join.args.get("on"))
+            if terms is None or not all(
+                isinstance(term.this, exp.Column) and isinstance(term.expression, exp.Column) for term in terms
+            ):
+                return None
+
+        terms = self._equalities(tree.args["where"].this if tree.args.get("where") else None)
+        if not terms:
+            return None
+        user_filter = False
+        for term in terms:
+            left, right = term.this, term.expression
+            if isinstance(left, exp.Column) and isinstance(right, exp.Column):
+                continue  # join condition written in WHERE
+            column, value = (left, right) if isinstance(left, exp.Column) else (right, left)
+            table = tables.get(column.table.lower()) if isinstance(column, exp.Column) and column.table else "orders"
+            if not (
+                isinstance(column, exp.Column) and column.name.lower() == "user_id"
+                and table == "orders" and isinstance(value, exp.Placeholder)
+            ):
+                return None
+            user_filter = True
+        if not user_filter:
+            return None
+
+        order = tree.args.get("order")
+        for ordered in order.expressions if order else []:
+            if not (
+                ordered.args.get("desc") and isinstance(ordered.this, exp.Column)
+                and ordered.this.name.lower() in ("created_at", "id")
+            ):
+                return None
+
+        limit = tree.args.get("limit")
+        value = limit.expression if limit is not None else None
+        if isinstance(value, exp.Literal) and value.is_int:
+            return min(int(value.this), self.max_limit)
+        return None if limit is not None else self.max_limit
+
+    def estimate_rows(self, cursor, sql: str, params: tuple) -> int:
+        """Rows MySQL expects to examine: product within each SELECT, summed across them."""
+        cursor.execute(f"EXPLAIN {sql}", params)
+        per_select: dict[int, float] = {}
+        for row in cursor.fetchall():
+            rows = float(row.get("rows") or 1) * float(row.get("filtered") or 100) / 100
+            select_id = row.get("id") or 0
+            per_select[select_id] = per_select.get(select_id, 1.0) * max(rows, 1.0)
+        return int(sum(per_select.values()))
+
+    def execute(self, sql: str, user_id: Optional[int] = None) -> list[dict]:
+        """Validate, cost-check and run generated SQL, through the client's result cache."""
+        sql, params, tables = self.prepare(sql, user_id)
+        cache = self.client.query_cache
+        if cache is None:
+            return self._run(sql, params)
+        return cache.get_or_load(
+            "generated_sql", (sql, params), tables, lambda: self._run(sql, params), self.cache_ttl
+        )
+
+    def _run(self, sql: str, params: tuple) -> list[dict]:
+        with self.client.readonly_connection() as conn, conn.cursor() as cursor:
+            if self.explain:
+                estimate = self.estimate_rows(cursor, sql, params)
+                if estimate > self.max_examined_rows:
+                    raise UnsafeSQLError(
+                        f"Query plan examines ~{estimate} rows (budget {self.max_examined_rows})"
+                    )
+            cursor.execute(sql, params)
+            return cursor.fetchmany(self.max_rows)
@@ -1,23 +1,57 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager, aclosing
+import asyncio
+import json
 import logging
+import time
 
 from app.config import get_settings
 from app.schemas import (
     ChatRequest, ChatResponse, ProductSource,
-    SyncResponse, HealthResponse
+    BatchChatRequest, BatchChatItem, BatchChatResponse,
+    SyncJobResponse, HealthResponse,
+    CacheInvalidateRequest, CacheInvalidateResponse
 )
-from app.database import get_mysql_client
-from app.vectorstore import get_vectorstore
+from app.database import get_mysql_client, track_round_trips
+from app.vectorstore import get_vectorstore, get_sync_job_manager
 from app.agents import get_chat_agent
 from app.agents.smart_agent import get_smart_agent
+from app.cache import get_answer_cache, get_router_cache, get_request_coalescer, prior_turns
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _fill_empty_index(settings) -> None:
+    """
+    Start a full sync when the active index is empty but MySQL has products.
+    
+    A new embedding model, distance or backend opens a new, empty index;
+    without a sync every vector search would return nothing.
+    """
+    vectorstore = get_vectorstore()
+    if vectorstore.count() > 0:
+        return
+    products = get_mysql_client().count_in_stock_products()
+    if not products:
+        return
+    index = vectorstore._index_name()
+    if not settings.sync_on_empty_index:
+        logger.warning(
+            f"Vector index {index} is empty but MySQL has {products} products; "
+            "vector search returns nothing until POST /sync?full=true"
+        )
+        return
+    job, _ = get_sync_job_manager().start(full=True)
+    logger.warning(
+        f"Vector index {index} is empty but MySQL has {products} products; "
+        f"started full sync job {job['job_id']}"
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
@@ -27,9 +61,41 @@ async def lifespan(app: FastAPI):
     settings = get_settings()
     logger.info(f"ChromaDB persist directory: {settings.chroma_persist_directory}")
     
+    mysql_client = get_mysql_client()
+    try:
+        mysql_client.warm_pool()
+    except Exception as e:
+        logger.warning(f"Could not pre-open MySQL connections: {e}")
+    mysql_client.start_query_cache_polling()
+    get_vectorstore().add_sync_listener(mysql_client.on_products_synced)
+    mysql_client.start_rankings()
+    
+    try:
+        await asyncio.to_thread(get_vectorstore().load_embedding_model)
+    except Exception as e:
+        logger.warning(f"Could not load embedding model: {e}")
+    try:
+        await asyncio.to_thread(get_vectorstore().warm_lexical_index)
+    except Exception as e:
+        logger.warning(f"Could not build BM25 index: {e}")
+    try:
+        await asyncio.to_thread(_fill_empty_index, settings)
+    except Exception as e:
+        logger.warning(f"Could not check the vector index: {e}")
+    
+    if settings.router_cache_enabled and settings.router_cache_warm_file:
+        try:
+            loaded = get_router_cache().warm_from_jsonl(settings.router_cache_warm_file)
+            logger.info(f"Warmed router cache with {loaded} decisions")
+        except Exception as e:
+            logger.warning(f"Could not warm router cache: {e}")
+    
     yield
     
     logger.info("Shutting down AI Service...")
+    if settings.router_cache_enabled:
+        get_router_cache().close()
+    mysql_client.close()
 
 
 app = FastAPI(
@@ -55,8 +121,9 @@ async def health_check():
     mysql_client = get_mysql_client()
     vectorstore = get_vectorstore()
     
-    db_connected = mysql_client.test_connection()
-    vs_ready = vectorstore.is_ready()
+    # Blocking checks run off the event loop so a saturated pool can't stall /ask
+    db_connected = await mysql_client.run_async(mysql_client.test_connection)
+    vs_ready = await asyncio.to_thread(vectorstore.is_ready)
     
     status = "healthy" if (db_connected and vs_ready) else "degraded"
     
@@ -67,26 +134,196 @@ async def health_check():
     )
 
 
-@app.post("/sync", response_model=SyncResponse)
-async def sync_products():
-    """Sync products from MySQL to ChromaDB vector store."""
+@app.post("/sync", response_model=SyncJobResponse, status_code=202)
+async def sync_products(full: bool = False):
+    """
+    Start a background sync from MySQL to ChromaDB and return its job id.
+    
+    Only products changed since the last sync are re-embedded; pass
+    full=true to rebuild every document. Only one sync runs at a time:
+    triggers received while a job is running join that job.
+    """
     try:
-        vectorstore = get_vectorstore()
-        count = vectorstore.sync_products()
-        
-        logger.info(f"Synced {count} products to vector store")
-        
-        return SyncResponse(
-            success=True,
-            message=f"Successfully synced {count} products to vector store",
-            products_synced=count
-        )
+        job, coalesced = get_sync_job_manager().start(full=full)
     except Exception as e:
-        logger.error(f"Sync failed: {str(e)}")
+        logger.error(f"Failed to start sync: {str(e)}")
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to sync products: {str(e)}"
+            detail=f"Failed to start sync: {str(e)}"
+        )
+    
+    if coalesced:
+        logger.info(f"Sync trigger coalesced onto running job {job['job_id']}")
+    else:
+        logger.info(f"Started sync job {job['job_id']} ({job['mode']})")
+    
+    return SyncJobResponse(**job, coalesced=coalesced)
+
+
+@app.get("/sync/{job_id}", response_model=SyncJobResponse)
+async def get_sync_job(job_id: str):
+    """Get progress, counts and duration of a sync job."""
+    job = get_sync_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Sync job {job_id} not found")
+    return SyncJobResponse(**job)
+
+
+@app.post("/cache/invalidate", response_model=CacheInvalidateResponse)
+async def invalidate_cache(request: CacheInvalidateRequest):
+    """
+    Invalidate cached MySQL results for the given tables (all when omitted).
+    
+    Meant as a webhook for the backend to call after writes.
+    """
+    versions = get_mysql_client().invalidate_tables(request.tables)
+    logger.info(f"Invalidated query cache for tables: {request.tables or 'all'}")
+    return CacheInvalidateResponse(table_versions=versions)
+
+
+def _cache_namespace(request: ChatRequest) -> str:
+    """Answer cache namespace: agent type and whether answers were LLM-polished."""
+    namespace = "smart" if request.use_smart_agent else "rule"
+    return f"{namespace}:polish" if request.polish else namespace
+
+
+async def _answer_with_cache(agent, request: ChatRequest) -> dict:
+    """
+    Answer a chat request, serving from the semantic answer cache when possible.
+    
+    The backend sends the current message as the last history entry; only
+    earlier turns make a follow-up. Follow-ups depend on those turns, so they
+    are served and stored only when the answer is a template, which is
+    rendered from the question alone.
+    """
+    settings = get_settings()
+    if not settings.answer_cache_enabled:
+        return await agent.achat(
+            query=request.query,
+            user_id=request.user_id,
+            conversation_history=request.conversation_history,
+            polish=request.polish
+        )
+    
+    follow_up = bool(prior_turns(request.conversation_history, request.query))
+    cache = get_answer_cache()
+    namespace = _cache_namespace(request)
+    cached, probe = await asyncio.to_thread(
+        cache.lookup, request.query, request.user_id, namespace, follow_up
+    )
+    if cached is not None:
+        return cached
+    
+    started = time.perf_counter()
+    result = await agent.achat(
+        query=request.query,
+        user_id=request.user_id,
+        conversation_history=request.conversation_history,
+        polish=request.polish
+    )
+    if _cacheable(result, follow_up):
+        await asyncio.to_thread(cache.store, probe, result, time.perf_counter() - started)
+        result["metadata"] = {**(result.get("metadata") or {}), "cache": {"status": "miss"}}
+    return result
+
+
+def _cacheable(result: dict, follow_up: bool) -> bool:
+    """Whether an answer can be reused for the same question in another conversation."""
+    return not follow_up or (result.get("metadata") or {}).get("answer_mode") == "template"
+
+
+def _to_product_sources(sources: list[dict]) -> list[ProductSource]:
+    """Convert agent sources into response models."""
+    return [
+        ProductSource(
+            product_id=s["product_id"],
+            name=s["name"],
+            price=s["price"],
+            category=s.get("category")
         )
+        for s in sources
+    ]
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _stream_answer(agent, request: ChatRequest, http_request: Request):
+    """
+    Yield SSE frames for a chat request: metadata and sources, answer deltas, done.
+    
+    A cached answer is sent as a single delta. If the client disconnects the
+    agent's stream is closed, which stops the LLM generation.
+    """
+    settings = get_settings()
+    round_trips = track_round_trips()
+    cache = get_answer_cache() if settings.answer_cache_enabled else None
+    follow_up = bool(prior_turns(request.conversation_history, request.query))
+    probe = None
+    
+    if cache is not None:
+        namespace = _cache_namespace(request)
+        cached, probe = await asyncio.to_thread(
+            cache.lookup, request.query, request.user_id, namespace, follow_up
+        )
+        if cached is not None:
+            sources = [s.model_dump() for s in _to_product_sources(cached.get("sources", []))]
+            metadata = {**(cached.get("metadata") or {}), "db_round_trips": round_trips["count"]}
+            yield _sse("metadata", {"sources": sources, "metadata": metadata})
+            yield _sse("delta", {"content": cached["answer"]})
+            yield _sse("done", {"answer": cached["answer"], "sources": sources, "metadata": metadata})
+            return
+    
+    started = time.perf_counter()
+    events = agent.astream_chat(
+        query=request.query,
+        user_id=request.user_id,
+        conversation_history=request.conversation_history,
+        polish=request.polish
+    )
+    try:
+        async with aclosing(events):
+            async for event in events:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling answer stream")
+                    return
+                
+                kind = event.pop("event")
+                if kind == "done":
+                    if cache is not None and _cacheable(event, follow_up):
+                        result = {"answer": event["answer"], "sources": event["sources"], "metadata": event["metadata"]}
+                        await asyncio.to_thread(cache.store, probe, result, time.perf_counter() - started)
+                        event["metadata"] = {**(event.get("metadata") or {}), "cache": {"status": "miss"}}
+                if "metadata" in event:
+                    event["metadata"] = {**(event["metadata"] or {}), "db_round_trips": round_trips["count"]}
+                if "sources" in event:
+                    event["sources"] = [s.model_dump() for s in _to_product_sources(event["sources"])]
+                yield _sse(kind, event)
+    except asyncio.CancelledError:
+        logger.info("Answer stream cancelled")
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream failed: {str(e)}")
+        yield _sse("error", {"message": f"Failed to process chat: {str(e)}"})
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: ChatRequest, http_request: Request):
+    """
+    Chat with AI, streaming the answer as server-sent events.
+    
+    Events: `metadata` (routing metadata and sources, sent before generation
+    starts), `delta` (answer chunks as the model produces them), `done` (full
+    answer) or `error`.
+    """
+    agent = get_smart_agent() if request.use_smart_agent else get_chat_agent()
+    return StreamingResponse(
+        _stream_answer(agent, request, http_request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/ask", response_model=ChatResponse)
@@ -96,6 +333,9 @@ async def ask(request: ChatRequest):
     
     Set use_smart_agent=True (default) for Text-to-SQL approach (more flexible).
     Set use_smart_agent=False for rule-based intent detection (faster but limited).
+    
+    LLM calls are awaited and database/vector lookups run off the event loop,
+    so a slow Gemini round-trip does not stall other requests on the worker.
     """
     try:
         # Choose agent based on request
@@ -104,26 +344,13 @@ async def ask(request: ChatRequest):
         else:
             agent = get_chat_agent()
         
-        result = agent.chat(
-            query=request.query,
-            user_id=request.user_id,
-            conversation_history=request.conversation_history
-        )
-        
-        sources = [
-            ProductSource(
-                product_id=s["product_id"],
-                name=s["name"],
-                price=s["price"],
-                category=s.get("category")
-            )
-            for s in result.get("sources", [])
-        ]
+        round_trips = track_round_trips()
+        result = await _answer_with_cache(agent, request)
         
         return ChatResponse(
             answer=result["answer"],
-            sources=sources,
-            metadata=result.get("metadata")
+            sources=_to_product_sources(result.get("sources", [])),
+            metadata={**(result.get("metadata") or {}), "db_round_trips": round_trips["count"]}
         )
     except Exception as e:
         logger.error(f"Chat failed: {str(e)}")
@@ -133,15 +360,148 @@ async def ask(request: ChatRequest):
         )
 
 
+async def _answer_batch(requests: list[ChatRequest], max_concurrency: int) -> tuple[list, dict]:
+    """
+    Answer a batch in order; failed items are returned as their exception.
+    
+    Answer-cache hits are served first. The remaining smart-agent requests
+    go through the agent's batch pipeline; rule-agent requests are answered
+    individually, at most `max_concurrency` at a time. Fresh answers are
+    cached like single /ask answers.
+    """
+    settings = get_settings()
+    cache = get_answer_cache() if settings.answer_cache_enabled else None
+    cacheable = [
+        index for index, request in enumerate(requests)
+        if cache is not None and not request.conversation_history
+    ]
+    lookups = await asyncio.gather(*(
+        asyncio.to_thread(cache.lookup, requests[i].query, requests[i].user_id, _cache_namespace(requests[i]))
+        for i in cacheable
+    ))
+    
+    results: list = [None] * len(requests)
+    probes = {}
+    for index, (cached, probe) in zip(cacheable, lookups):
+        if cached is not None:
+            results[index] = cached
+        else:
+            probes[index] = probe
+    
+    misses = [index for index, result in enumerate(results) if result is None]
+    smart = [index for index in misses if requests[index].use_smart_agent]
+    rule = [index for index in misses if not requests[index].use_smart_agent]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def answer_rule(request: ChatRequest) -> dict:
+        async with semaphore:
+            return await get_chat_agent().achat(
+                query=request.query,
+                user_id=request.user_id,
+                conversation_history=request.conversation_history,
+                polish=request.polish
+            )
+    
+    started = time.perf_counter()
+    smart_results, *rule_results = await asyncio.gather(
+        get_smart_agent().abatch_chat([requests[i].model_dump() for i in smart], max_concurrency),
+        *(answer_rule(requests[i]) for i in rule),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    if isinstance(smart_results, Exception):
+        smart_results = [smart_results] * len(smart)
+    
+    stored = set()
+    for index, result in zip(smart + rule, list(smart_results) + rule_results):
+        results[index] = result
+        if index not in probes or isinstance(result, Exception):
+            continue
+        request = requests[index]
+        key = (_cache_namespace(request), request.user_id, request.query)
+        if key not in stored:
+            stored.add(key)
+            await asyncio.to_thread(cache.store, probes[index], result, elapsed)
+        result["metadata"] = {**(result.get("metadata") or {}), "cache": {"status": "miss"}}
+    
+    return results, {"cache_hits": len(requests) - len(misses), "smart": len(smart), "rule": len(rule)}
+
+
+@app.post("/ask/batch", response_model=BatchChatResponse)
+async def ask_batch(request: BatchChatRequest):
+    """
+    Answer several chat requests in one call, e.g. to pre-generate FAQ answers.
+    
+    Identical questions are answered once, routing and SQL work is shared,
+    vector queries are embedded in one batch and LLM calls run at most
+    `max_concurrency` (capped by ASK_BATCH_LLM_CONCURRENCY) at a time.
+    Results come back in request order; a failed item carries `error`
+    instead of failing the whole batch.
+    """
+    settings = get_settings()
+    if len(request.requests) > settings.ask_batch_max_items:
+        raise HTTPException(
+            status_code=422,
+            detail=f"A batch holds at most {settings.ask_batch_max_items} requests"
+        )
+    max_concurrency = max(1, min(
+        request.max_concurrency or settings.ask_batch_llm_concurrency,
+        settings.ask_batch_llm_concurrency
+    ))
+    
+    round_trips = track_round_trips()
+    started = time.perf_counter()
+    results, counts = await _answer_batch(request.requests, max_concurrency)
+    
+    items = []
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Batch item {index} failed: {str(result)}")
+            items.append(BatchChatItem(index=index, error=f"Failed to process chat: {str(result)}"))
+            continue
+        items.append(BatchChatItem(
+            index=index,
+            answer=result["answer"],
+            sources=_to_product_sources(result.get("sources", [])),
+            metadata=result.get("metadata")
+        ))
+    
+    return BatchChatResponse(
+        results=items,
+        metadata={
+            **counts,
+            "size": len(items),
+            "errors": sum(1 for item in items if item.error is not None),
+            "max_concurrency": max_concurrency,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "db_round_trips": round_trips["count"],
+        }
+    )
+
+
 @app.get("/stats")
 async def get_stats():
     """Get vector store statistics."""
     vectorstore = get_vectorstore()
     mysql_client = get_mysql_client()
     
+    # Store, embedding model and MySQL checks block; keep them off the event loop
+    vectorstore_products = await asyncio.to_thread(vectorstore.get_product_count)
+    embeddings = await asyncio.to_thread(vectorstore.embedding_stats)
+    database_connected = await mysql_client.run_async(mysql_client.test_connection)
+    
     return {
-        "vectorstore_products": vectorstore.get_product_count(),
-        "database_connected": mysql_client.test_connection()
+        "vectorstore_products": vectorstore_products,
+        "embeddings": embeddings,
+        "database_connected": database_connected,
+        "mysql_pool": mysql_client.pool_stats(),
+        "mysql_readonly_pool": mysql_client.readonly_pool_stats(),
+        "query_cache": mysql_client.query_cache_stats(),
+        "rankings": mysql_client.rankings_stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "router_cache": get_router_cache().stats(),
+        "router_paths": get_smart_agent().routing_stats(),
+        "request_coalescing": get_request_coalescer().stats()
     }
 
 
@@ -150,9 +510,8 @@ async def debug_database():
     """Debug endpoint to check database content."""
     mysql_client = get_mysql_client()
     
-    try:
-        conn = mysql_client._get_connection()
-        with conn.cursor() as cursor:
+    def query() -> dict:
+        with mysql_client.connection() as conn, conn.cursor() as cursor:
             # Count total products
             cursor.execute("SELECT COUNT(*) as total FROM products")
             total = cursor.fetchone()
@@ -170,6 +529,9 @@ async def debug_database():
                 "status_breakdown": statuses,
                 "sample_products": samples
             }
+    
+    try:
+        return await mysql_client.run_async(query)
     except Exception as e:
         return {"error": str(e)}
 
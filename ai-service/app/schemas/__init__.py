@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
 
@@ -8,6 +9,7 @@ class ChatRequest(BaseModel):
     user_id: Optional[int] = None
     conversation_history: Optional[list[dict]] = None
     use_smart_agent: bool = True  # Use Text-to-SQL agent by default
+    polish: bool = False  # Let the LLM write structured answers instead of templates
 
 
 class ProductSource(BaseModel):
@@ -25,11 +27,52 @@ class ChatResponse(BaseModel):
     metadata: Optional[dict] = None
 
 
-class SyncResponse(BaseModel):
-    """Response model for sync endpoint."""
-    success: bool
-    message: str
-    products_synced: int = 0
+class BatchChatRequest(BaseModel):
+    """Request model for the batch chat endpoint."""
+    requests: list[ChatRequest]
+    max_concurrency: Optional[int] = None  # LLM calls in flight, capped by the server setting
+
+
+class BatchChatItem(BaseModel):
+    """One answer of a batch, in request order; `error` is set instead of `answer` on failure."""
+    index: int
+    answer: Optional[str] = None
+    sources: list[ProductSource] = []
+    metadata: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    """Response model for the batch chat endpoint."""
+    results: list[BatchChatItem]
+    metadata: dict = {}
+
+
+class SyncJobResponse(BaseModel):
+    """Response model for sync job endpoints."""
+    job_id: str
+    status: str  # queued | running | succeeded | failed
+    mode: str
+    coalesced: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    passes: int = 0
+    progress: dict = {}
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    coalesced_triggers: int = 0
+
+
+class CacheInvalidateRequest(BaseModel):
+    """Request model for invalidating cached MySQL results."""
+    tables: Optional[list[str]] = None  # None invalidates every table
+
+
+class CacheInvalidateResponse(BaseModel):
+    """Response model for cache invalidation."""
+    table_versions: dict[str, int]
 
 
 class HealthResponse(BaseModel):
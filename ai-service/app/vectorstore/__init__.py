@@ -1 +1,4 @@
-from .chroma import ChromaVectorStore, get_vectorstore
+from .base import VectorStore, get_vectorstore
+from .chroma import ChromaVectorStore
+from .numpy_store import NumpyVectorStore
+from .sync_jobs import SyncJobManager, get_sync_job_manager
@@ -0,0 +1,664 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+from app.config import get_settings
+from app.database import get_mysql_client
+from app.vectorstore.bm25 import BM25Index, reciprocal_rank_fusion
+from app.vectorstore.embeddings import (
+    CachedEmbeddingFunction, QueryEmbeddingCache, collection_suffix, create_embedding_function
+)
+
+
+# (field, operator, value) condition on stored product metadata
+FilterClause = tuple[str, str, Any]
+
+# (doc_id, document, metadata, distance) returned by a backend query
+StoredMatch = tuple[str, str, dict, float]
+
+
+class VectorStore(ABC):
+    """
+    Product vector store: MySQL sync, hybrid search and embedding plumbing.
+
+    Backends only implement storage: upsert/delete by id, paging through
+    stored documents, stored content hashes and a filtered top-k query over
+    normalized embeddings. Everything else (delta sync, BM25 fusion,
+    query-embedding cache, filters) is shared.
+    """
+
+    INDEX_NAME = "rerent_products"
+    SYNC_STATE_FILE = "sync_state.json"
+    IN_STOCK_STATUS = "Còn hàng"
+    # Whether the lexical index keeps its own copy of each document and its
+    # metadata; backends that can look them up cheaply override _lexical_entry
+    KEEP_LEXICAL_DOCS = True
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._embedding_function = None
+        self._query_cache = QueryEmbeddingCache(
+            max_entries=self.settings.query_embedding_cache_max_entries,
+            ttl=self.settings.query_embedding_cache_ttl,
+        ) if self.settings.query_embedding_cache_enabled else None
+        # Index search time, reported apart from query embedding time
+        self._search_count = 0
+        self._search_seconds = 0.0
+        # Lexical side of hybrid search: BM25 over the stored documents,
+        # plus each document's text and metadata to build results from
+        self._lexical = BM25Index()
+        self._lexical_docs: dict[str, tuple[str, dict]] = {}
+        self._lexical_lock = threading.Lock()
+        self._sync_listeners: list[Callable[[dict], None]] = []
+        # Guards against two syncs interleaving their upserts and deletes
+        self._sync_lock = threading.Lock()
+        # Ids in the store, loaded on the first sync and kept up to date by it
+        self._stored_ids: Optional[set[str]] = None
+
+    # ----- storage, implemented by backends -----
+
+    @abstractmethod
+    def _open_store(self) -> None:
+        """Open or create the underlying index."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored documents."""
+
+    @abstractmethod
+    def _stored_hashes(self, ids: list[str]) -> dict[str, Optional[str]]:
+        """content_hash of each stored id; missing ids are left out."""
+
+    @abstractmethod
+    def _upsert(self, ids: list[str], documents: list[str], embeddings: np.ndarray, metadatas: list[dict]) -> None:
+        """Insert or replace documents with their (normalized) embeddings."""
+
+    @abstractmethod
+    def _delete(self, ids: list[str]) -> None:
+        """Remove documents by id."""
+
+    @abstractmethod
+    def _iter_stored(self, page_size: int = 1000, documents: bool = False) -> Iterator[tuple[list[str], list[str], list[dict]]]:
+        """Yield (ids, documents, metadatas) pages; documents and metadatas are empty unless asked for."""
+
+    @abstractmethod
+    def _query(self, vectors: np.ndarray, n_results: int, clauses: list[FilterClause]) -> list[list[StoredMatch]]:
+        """Nearest stored documents for each query vector, among those matching `clauses`."""
+
+    def _flush(self) -> None:
+        """Persist pending writes at the end of a sync pass (no-op by default)."""
+
+    def _index_stats(self) -> Optional[dict]:
+        """Backend-specific size and layout figures for /stats."""
+        return None
+
+    def _data_directory(self) -> str:
+        """Directory holding the sync state file."""
+        return self.settings.chroma_persist_directory
+
+    # ----- embeddings -----
+
+    def _get_embedding_function(self) -> CachedEmbeddingFunction:
+        """Get the configured embedding backend shared by sync and search."""
+        if self._embedding_function is None:
+            self._embedding_function = create_embedding_function(self.settings)
+        return self._embedding_function
+
+    def load_embedding_model(self) -> None:
+        """Load the embedding model now instead of on the first request."""
+        self._get_embedding_function().embedder.load()
+
+    def _index_name(self) -> str:
+        """
+        One index per embedding model, since vectors from different models
+        can't be compared. A new model starts empty and is filled by a full sync.
+        """
+        model_id = self._get_embedding_function().model_id
+        name = self.INDEX_NAME
+        if model_id != "chroma-default":
+            name = f"{name}_{collection_suffix(model_id)}"
+        # Distances from another metric aren't comparable either
+        if self.settings.vector_distance != "l2":
+            name = f"{name[:63 - len(self.settings.vector_distance) - 1]}_{self.settings.vector_distance}"
+        return name[:63]
+
+    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        """Embed query texts with the document model, through the query-embedding cache."""
+        return [vector.tolist() for vector in self.embed_queries(texts)[0]]
+
+    def embed_queries(self, texts: list[str]) -> tuple[np.ndarray, int]:
+        """Embed queries, batching cache misses; returns (vectors, cache hits)."""
+        embedder = self._get_embedding_function().embedder
+        if self._query_cache is None:
+            return embedder(texts), 0
+        return self._query_cache.embed(texts, embedder)
+
+    def embedding_stats(self) -> dict:
+        """Embedding model and document-embedding cache hit rate."""
+        function = self._get_embedding_function()
+        return {
+            "backend": self.settings.vector_store_backend,
+            "model": function.model_id,
+            "collection": self._index_name(),
+            "cache": function.cache.stats() if function.cache is not None else None,
+            "query_cache": self._query_cache.stats() if self._query_cache is not None else None,
+            "searches": self._search_count,
+            "avg_search_ms": round(self._search_seconds / self._search_count * 1000, 2) if self._search_count else 0.0,
+            "lexical_index": {"ready": self._lexical.ready, "documents": len(self._lexical)},
+            "index": self._index_stats(),
+        }
+
+    # ----- lexical index -----
+
+    def _get_lexical_index(self) -> BM25Index:
+        """BM25 index over the stored documents, built on first use."""
+        if not self._lexical.ready:
+            with self._lexical_lock:
+                if not self._lexical.ready:
+                    for ids, documents, metadatas in self._iter_stored(documents=True):
+                        self._index_lexical(ids, documents, metadatas)
+                    self._lexical.ready = True
+                    print(f"[DEBUG] Built BM25 index over {len(self._lexical)} documents")
+        return self._lexical
+
+    def warm_lexical_index(self) -> None:
+        """Build the BM25 index now instead of on the first search."""
+        self._get_lexical_index()
+
+    def _index_lexical(self, ids: list[str], documents: list[str], metadatas: list[dict]) -> None:
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self._lexical.upsert(doc_id, document or "")
+            if self.KEEP_LEXICAL_DOCS:
+                self._lexical_docs[doc_id] = (document or "", metadata or {})
+
+    def _unindex_lexical(self, ids: list[str]) -> None:
+        self._lexical.remove(ids)
+        for doc_id in ids:
+            self._lexical_docs.pop(doc_id, None)
+
+    def _lexical_entry(self, doc_id: str) -> tuple[str, dict]:
+        """Document text and metadata for a lexical hit."""
+        return self._lexical_docs.get(doc_id, ("", {}))
+
+    # ----- sync -----
+
+    def add_sync_listener(self, listener: Callable[[dict], None]) -> None:
+        """
+        Register a callback run after a sync pass that changed data.
+
+        The callback receives {"mode", "full", "product_ids", "removed_ids"};
+        product_ids is the set of upserted or deleted product ids, or None
+        after a full sync; removed_ids holds the products dropped from the
+        store because they were deleted or went out of stock.
+        """
+        self._sync_listeners.append(listener)
+
+    def _notify_sync_listeners(self, event: dict) -> None:
+        for listener in self._sync_listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"[ERROR] Sync listener failed: {e}")
+
+    def is_ready(self) -> bool:
+        """Check if vector store is ready."""
+        try:
+            self._open_store()
+            return True
+        except Exception as e:
+            print(f"[ERROR] VectorStore not ready: {e}")
+            return False
+
+    def get_product_count(self) -> int:
+        """Get number of products in vector store."""
+        try:
+            return self.count()
+        except Exception:
+            return 0
+
+    def _sync_state_path(self) -> str:
+        """Path of the JSON file holding the sync high-water mark."""
+        return os.path.join(self._data_directory(), self.SYNC_STATE_FILE)
+
+    def _load_sync_state(self) -> dict:
+        """Load persisted sync state, or an empty state if none exists."""
+        try:
+            with open(self._sync_state_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_sync_state(self, state: dict) -> None:
+        """Persist sync state next to the index data."""
+        os.makedirs(self._data_directory(), exist_ok=True)
+        tmp_path = self._sync_state_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._sync_state_path())
+
+    def _product_metadata(self, product: dict) -> dict:
+        """Build stored metadata for a product row."""
+        return {
+            "product_id": product["id"],
+            "name": product["name"],
+            "price": float(product["price"]) if product["price"] else 0,
+            "stock": product["stock"] or 0,
+            "category": product["category_name"] or "Chưa phân loại",
+            "status": product["status"] or "active",
+            "shop_id": product.get("shop_id") or 0
+        }
+
+    def _content_hash(self, document: str, metadata: dict) -> str:
+        """Hash of everything we store for a product, used to skip unchanged rows."""
+        payload = document + "\x00" + json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _find_stale_ids(self) -> list[str]:
+        """
+        Stored ids whose product was deleted or went out of stock.
+
+        Diffs the in-memory set of stored ids against MySQL's in-stock ids,
+        so only the first sync after startup pages through the store.
+        """
+        if self._stored_ids is None:
+            self._stored_ids = {doc_id for ids, _, _ in self._iter_stored() for doc_id in ids}
+        in_stock = {f"product_{product_id}" for product_id in get_mysql_client().get_in_stock_product_ids()}
+        return sorted(self._stored_ids - in_stock)
+
+    def _sync_chunk(
+        self,
+        rows: list[dict],
+        full: bool,
+        stats: dict,
+        progress,
+        changed_ids: Optional[set[int]] = None
+    ) -> None:
+        """Hash, diff and upsert one streamed chunk of product rows."""
+        batch_size = max(1, self.settings.sync_embed_batch_size)
+
+        in_stock = {
+            f"product_{row['id']}": row
+            for row in rows
+            if row["status"] == self.IN_STOCK_STATUS
+        }
+
+        # Compare against stored hashes so unchanged documents are not re-embedded
+        existing_hashes = {}
+        if in_stock and not full:
+            existing_hashes = self._stored_hashes(list(in_stock))
+
+        documents = []
+        metadatas = []
+        ids = []
+        for doc_id, product in in_stock.items():
+            doc_text = self._create_product_document(product)
+            metadata = self._product_metadata(product)
+            content_hash = self._content_hash(doc_text, metadata)
+            if existing_hashes.get(doc_id) == content_hash:
+                stats["unchanged"] += 1
+                continue
+            metadata["content_hash"] = content_hash
+            documents.append(doc_text)
+            metadatas.append(metadata)
+            ids.append(doc_id)
+
+        stats["fetched"] += len(rows)
+        # One encode call for the chunk's changed documents; the backend batches
+        # internally and serves unchanged text from the embedding cache.
+        embeddings = self._get_embedding_function().embed(documents) if documents else None
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self._upsert(ids[start:end], documents[start:end], embeddings[start:end], metadatas[start:end])
+            self._index_lexical(ids[start:end], documents[start:end], metadatas[start:end])
+            if self._stored_ids is not None:
+                self._stored_ids.update(ids[start:end])
+            stats["upserted"] += len(ids[start:end])
+            if changed_ids is not None:
+                changed_ids.update(metadata["product_id"] for metadata in metadatas[start:end])
+            stats["batches"] += 1
+            self._report_progress(stats, progress)
+
+        if not ids:
+            self._report_progress(stats, progress)
+
+    def _report_progress(self, stats: dict, progress) -> None:
+        """Log sync progress and forward it to the optional callback."""
+        print(
+            f"[DEBUG] Sync progress: fetched={stats['fetched']} "
+            f"upserted={stats['upserted']} unchanged={stats['unchanged']} "
+            f"batches={stats['batches']}"
+        )
+        if progress is not None:
+            progress(dict(stats))
+
+    def sync_products(
+        self,
+        full: bool = False,
+        progress: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """
+        Sync products from MySQL to the vector store.
+
+        Delta mode (default) only fetches products whose row or category
+        changed since the last sync's `updated_at` high-water mark, re-embeds
+        documents whose content hash changed and deletes products that
+        disappeared or went out of stock (an id-set diff against MySQL).
+        `full=True` ignores the high-water mark and stored hashes and
+        re-embeds the whole catalog. Either way documents are upserted, so
+        the index is never empty mid-sync.
+
+        Rows are streamed from MySQL in `sync_chunk_size` chunks and embedded
+        in `sync_embed_batch_size` batches, so memory stays flat regardless of
+        catalog size. `progress` is called with running counts after each batch.
+        """
+        with self._sync_lock:
+            return self._sync_products(full, progress)
+
+    def _sync_products(self, full: bool, progress: Optional[Callable[[dict], None]]) -> dict:
+        """Run one sync pass; the caller holds the sync lock."""
+        self._open_store()
+        state = self._load_sync_state()
+        mode = "full" if full else "delta"
+
+        since = None
+        if not full and state.get("high_water_mark") and self.count() > 0:
+            since = datetime.fromisoformat(state["high_water_mark"])
+
+        stats = {
+            "mode": mode,
+            "fetched": 0,
+            "upserted": 0,
+            "unchanged": 0,
+            "deleted": 0,
+            "batches": 0,
+        }
+        high_water_mark = since
+        # Full syncs notify listeners without ids to keep memory flat
+        changed_ids: Optional[set[int]] = None if full else set()
+
+        mysql_client = get_mysql_client()
+        for rows in mysql_client.iter_products_updated_since(
+            since, chunk_size=self.settings.sync_chunk_size
+        ):
+            for row in rows:
+                for updated_at in (row.get("updated_at"), row.get("category_updated_at")):
+                    if updated_at and (high_water_mark is None or updated_at > high_water_mark):
+                        high_water_mark = updated_at
+            self._sync_chunk(rows, full, stats, progress, changed_ids)
+
+        stale_ids = self._find_stale_ids()
+        if stale_ids:
+            self._delete(stale_ids)
+            self._unindex_lexical(stale_ids)
+            self._stored_ids.difference_update(stale_ids)
+        stats["deleted"] = len(stale_ids)
+        removed_ids = {int(doc_id.removeprefix("product_")) for doc_id in stale_ids}
+        if changed_ids is not None:
+            changed_ids.update(removed_ids)
+        self._flush()
+
+        if high_water_mark is not None:
+            state["high_water_mark"] = high_water_mark.isoformat()
+        state["last_mode"] = mode
+        self._save_sync_state(state)
+
+        print(
+            f"[DEBUG] Sync ({mode}, since={since}) done: upserted {stats['upserted']}, "
+            f"deleted {stats['deleted']}, unchanged {stats['unchanged']}"
+        )
+
+        if stats["upserted"] or stats["deleted"]:
+            self._notify_sync_listeners({
+                "mode": mode,
+                "full": full,
+                "product_ids": changed_ids,
+                "removed_ids": removed_ids,
+            })
+
+        stats["total"] = self.count()
+        stats["high_water_mark"] = state.get("high_water_mark")
+        return stats
+
+    def _create_product_document(self, product: dict) -> str:
+        """Create a text document from product data for embedding."""
+        parts = [
+            f"Tên sản phẩm: {product['name']}",
+        ]
+
+        if product.get('description'):
+            parts.append(f"Mô tả: {product['description']}")
+
+        if product.get('category_name'):
+            parts.append(f"Danh mục: {product['category_name']}")
+
+        if product.get('price'):
+            price_formatted = f"{float(product['price']):,.0f}₫"
+            parts.append(f"Giá thuê: {price_formatted}")
+
+        if product.get('stock'):
+            parts.append(f"Số lượng còn: {product['stock']}")
+
+        return "\n".join(parts)
+
+    # ----- search -----
+
+    def _result(self, metadata: dict, document: str, distance: Optional[float] = None) -> dict:
+        """Search result dict from stored metadata."""
+        return {
+            "product_id": metadata.get("product_id"),
+            "name": metadata.get("name"),
+            "price": metadata.get("price"),
+            "stock": metadata.get("stock"),
+            "category": metadata.get("category"),
+            "document": document,
+            "distance": distance
+        }
+
+    @staticmethod
+    def _filter_clauses(filters: Optional[dict]) -> list[FilterClause]:
+        """
+        (field, operator, value) conditions for structured search filters.
+
+        Supported filters: min_price, max_price, category, in_stock, shop_id.
+        Unknown keys and None values are ignored.
+        """
+        filters = filters or {}
+        clauses = []
+        if filters.get("min_price") is not None:
+            clauses.append(("price", "$gte", float(filters["min_price"])))
+        if filters.get("max_price") is not None:
+            clauses.append(("price", "$lte", float(filters["max_price"])))
+        if filters.get("category"):
+            clauses.append(("category", "$eq", filters["category"]))
+        if filters.get("in_stock"):
+            clauses.append(("stock", "$gt", 0))
+        if filters.get("shop_id") is not None:
+            clauses.append(("shop_id", "$eq", int(filters["shop_id"])))
+        return clauses
+
+    _OPERATORS = {
+        "$eq": lambda a, b: a == b,
+        "$gt": lambda a, b: a is not None and a > b,
+        "$gte": lambda a, b: a is not None and a >= b,
+        "$lte": lambda a, b: a is not None and a <= b,
+    }
+
+    def _lexical_filter(self, clauses: list[FilterClause]) -> Optional[Callable[[str], bool]]:
+        """The filter conditions, checked against lexical-index metadata."""
+        if not clauses:
+            return None
+
+        def matches(doc_id: str) -> bool:
+            metadata = self._lexical_entry(doc_id)[1]
+            return all(self._OPERATORS[op](metadata.get(field), value) for field, op, value in clauses)
+        return matches
+
+    def _vector_search(
+        self,
+        queries: list[str],
+        n_results: int,
+        clauses: list[FilterClause],
+        timings: Optional[dict] = None
+    ) -> list[list[tuple[str, dict]]]:
+        """Nearest documents by embedding for each query, as (doc_id, result) pairs."""
+        self._open_store()
+
+        started = time.perf_counter()
+        vectors, hits = self.embed_queries(queries)
+        embedded = time.perf_counter()
+        matches = self._query(vectors, n_results, clauses)
+        searched = time.perf_counter()
+        self._search_count += len(queries)
+        self._search_seconds += searched - embedded
+        if timings is not None:
+            timings.update({
+                "embed_ms": round((embedded - started) * 1000, 1),
+                "embedding_cache": "hit" if hits == len(queries) else "miss",
+                "search_ms": round((searched - embedded) * 1000, 1),
+            })
+        return [
+            [(doc_id, self._result(metadata, document, distance)) for doc_id, document, metadata, distance in found]
+            for found in matches
+        ]
+
+    def _lexical_search(
+        self,
+        query: str,
+        n_results: int,
+        doc_filter: Optional[Callable[[str], bool]] = None
+    ) -> list[str]:
+        """Doc ids ranked by BM25."""
+        return [doc_id for doc_id, _ in self._get_lexical_index().search(query, n_results, doc_filter)]
+
+    def _fuse(self, vector_matches: list[tuple[str, dict]], lexical_ids: list[str], n_results: int) -> list[dict]:
+        """Reciprocal-rank fusion of the vector and BM25 candidate lists."""
+        by_id = dict(vector_matches)
+        fused = reciprocal_rank_fusion(
+            [[doc_id for doc_id, _ in vector_matches], lexical_ids], k=self.settings.hybrid_rrf_k
+        )
+        lexical_hits = set(lexical_ids)
+        results = []
+        for doc_id, score in fused[:n_results]:
+            result = by_id.get(doc_id)
+            if result is None:
+                document, metadata = self._lexical_entry(doc_id)
+                result = self._result(metadata, document)
+            retrievers = [name for name, hit in (("vector", doc_id in by_id), ("lexical", doc_id in lexical_hits)) if hit]
+            results.append({**result, "score": round(score, 6), "retrievers": retrievers})
+        return results
+
+    def _distance(self, similarity: float) -> float:
+        """Distance for a unit-vector dot product, in the configured metric's units."""
+        if self.settings.vector_distance == "l2":
+            # Squared L2, as Chroma reports it
+            return 2 - 2 * similarity
+        return 1 - similarity
+
+    def search_batch(
+        self,
+        queries: list[str],
+        n_results: Optional[int] = None,
+        timings: Optional[dict] = None,
+        filters: Optional[dict] = None
+    ) -> list[list[dict]]:
+        """
+        Search several queries at once: one embedding batch and one index query.
+
+        Same results per query as search_similar; `filters` apply to all of them.
+        """
+        if not queries:
+            return []
+        n_results = n_results or self.settings.vector_search_results
+        clauses = self._filter_clauses(filters)
+        if not self.settings.hybrid_search_enabled:
+            return [
+                [result for _, result in matches]
+                for matches in self._vector_search(queries, n_results, clauses, timings)
+            ]
+
+        candidates = max(n_results * 3, self.settings.hybrid_candidates)
+        vector_matches = self._vector_search(queries, candidates, clauses, timings)
+        started = time.perf_counter()
+        doc_filter = self._lexical_filter(clauses)
+        lexical_ids = [self._lexical_search(query, candidates, doc_filter) for query in queries]
+        if timings is not None:
+            timings["lexical_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return [
+            self._fuse(matches, ids, n_results)
+            for matches, ids in zip(vector_matches, lexical_ids)
+        ]
+
+    def search_similar(
+        self,
+        query: str,
+        n_results: Optional[int] = None,
+        timings: Optional[dict] = None,
+        filters: Optional[dict] = None
+    ) -> list[dict]:
+        """
+        Search for products matching the query (`vector_search_results` by default).
+
+        With hybrid search enabled, vector and BM25 candidates are fused by
+        reciprocal rank, so exact product names found lexically are not lost
+        when their embedding ranks low. `filters` (min_price, max_price,
+        category, in_stock, shop_id) are applied inside both indexes, so the
+        top results all satisfy them. If `timings` is given it receives
+        embed_ms, search_ms, lexical_ms and whether the query embedding came
+        from the cache.
+        """
+        return self.search_batch([query], n_results, timings, filters)[0]
+
+    def search_many(
+        self,
+        lookups: list[tuple[str, Optional[dict]]],
+        n_results: Optional[int] = None,
+        timings: Optional[dict] = None
+    ) -> list[list[dict]]:
+        """
+        Search (query, filters) pairs, one search_batch call per distinct filter set.
+
+        With the query-embedding cache enabled, every distinct query is first
+        embedded in a single batch, so the per-filter searches only hit the
+        cache. Duplicate lookups are searched once.
+        """
+        started = time.perf_counter()
+        groups: dict[str, list[str]] = {}
+        for query, filters in lookups:
+            queries = groups.setdefault(json.dumps(filters, sort_keys=True), [])
+            if query not in queries:
+                queries.append(query)
+        if len(groups) > 1 and self._query_cache is not None:
+            self.embed_queries(list(dict.fromkeys(query for query, _ in lookups)))
+
+        found = {}
+        for key, queries in groups.items():
+            for query, results in zip(queries, self.search_batch(queries, n_results, None, json.loads(key))):
+                found[key, query] = results
+        if timings is not None:
+            timings.update({
+                "queries": len(found),
+                "filter_sets": len(groups),
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+        return [found[json.dumps(filters, sort_keys=True), query] for query, filters in lookups]
+
+
+@lru_cache()
+def get_vectorstore() -> VectorStore:
+    """Get the configured vector store backend."""
+    backend = get_settings().vector_store_backend
+    if backend == "chroma":
+        from app.vectorstore.chroma import ChromaVectorStore
+        return ChromaVectorStore()
+    if backend == "numpy":
+        from app.vectorstore.numpy_store import NumpyVectorStore
+        return NumpyVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,124 @@
+"""
+In-process BM25 index over product documents.
+
+Complements vector search with exact lexical matches (product names, SKUs,
+model numbers). Text is folded to unaccented lowercase so "ban tiec" finds
+"Bàn tiệc"; Vietnamese words are mostly two syllables, so adjacent syllable
+pairs are indexed too and rank exact phrases above scattered syllables.
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Iterable, Optional
+
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def fold_diacritics(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics ("Đèn LED" -> "den led")."""
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text: str) -> list[str]:
+    """Folded syllables plus adjacent syllable pairs ("to chuc tiec" -> ..., "to_chuc", "chuc_tiec")."""
+    syllables = _TOKEN_PATTERN.findall(fold_diacritics(text))
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index, updated per document."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._doc_terms: dict[str, Counter] = {}
+        self._doc_len: dict[str, int] = {}
+        self._total_len = 0
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def upsert(self, doc_id: str, text: str) -> None:
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, freq in terms.items():
+                self._postings[term][doc_id] = freq
+            self._doc_terms[doc_id] = terms
+            length = sum(terms.values())
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def upsert_many(self, docs: Iterable[tuple[str, str]]) -> None:
+        for doc_id, text in docs:
+            self.upsert(doc_id, text)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._total_len = 0
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 10,
+        doc_filter: Optional[Callable[[str], bool]] = None
+    ) -> list[tuple[str, float]]:
+        """Top (doc_id, score) pairs for the query, best first, among docs passing `doc_filter`."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: dict[str, float] = defaultdict(float)
+            allowed: dict[str, bool] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, freq in postings.items():
+                    if doc_filter is not None:
+                        if doc_id not in allowed:
+                            allowed[doc_id] = doc_filter(doc_id)
+                        if not allowed[doc_id]:
+                            continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank)."""
+    scores: dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,20 +1,25 @@
 import chromadb
-from typing import Optional
-from functools import lru_cache
-from app.config import get_settings
-from app.database import get_mysql_client
+import numpy as np
+from typing import Iterator, Optional
+from app.vectorstore.base import FilterClause, StoredMatch, VectorStore
 
 
-class ChromaVectorStore:
+class ChromaVectorStore(VectorStore):
     """ChromaDB vector store for product embeddings."""
-    
-    COLLECTION_NAME = "rerent_products"
-    
+
+    # Collection metadata keys -> configuration names in newer Chroma
+    HNSW_CONFIGURATION_KEYS = {
+        "hnsw:space": "space",
+        "hnsw:M": "max_neighbors",
+        "hnsw:construction_ef": "ef_construction",
+        "hnsw:search_ef": "ef_search",
+    }
+
     def __init__(self):
-        self.settings = get_settings()
+        super().__init__()
         self._client: Optional[chromadb.PersistentClient] = None
         self._collection = None
-    
+
     def _get_client(self) -> chromadb.PersistentClient:
         """Get or create ChromaDB persistent client."""
         if self._client is None:
@@ -22,132 +27,122 @@ class ChromaVectorStore:
                 path=self.settings.chroma_persist_directory
             )
         return self._client
-    
+
+    def _hnsw_metadata(self) -> dict:
+        """HNSW index parameters from settings, as Chroma collection metadata."""
+        return {
+            "hnsw:space": self.settings.vector_distance,
+            "hnsw:M": self.settings.hnsw_m,
+            "hnsw:construction_ef": self.settings.hnsw_construction_ef,
+            "hnsw:search_ef": self.settings.hnsw_search_ef,
+        }
+
     def _get_collection(self):
         """Get or create the products collection."""
         if self._collection is None:
             client = self._get_client()
+            hnsw = self._hnsw_metadata()
             self._collection = client.get_or_create_collection(
-                name=self.COLLECTION_NAME,
-                metadata={"description": "ReRent product embeddings for RAG"},
+                name=self._index_name(),
+                metadata={
+                    "description": "ReRent product embeddings for RAG",
+                    "embedding_model": self._get_embedding_function().model_id,
+                    **hnsw,
+                },
+                embedding_function=self._get_embedding_function(),
             )
+            self._check_hnsw(hnsw)
         return self._collection
-    
-    def is_ready(self) -> bool:
-        """Check if vector store is ready."""
-        try:
-            collection = self._get_collection()
-            return collection is not None
-        except Exception as e:
-            print(f"[ERROR] VectorStore not ready: {e}")
-            return False
-    
-    def get_product_count(self) -> int:
-        """Get number of products in vector store."""
-        try:
-            collection = self._get_collection()
-            return collection.count()
-        except Exception:
-            return 0
-    
-    def sync_products(self) -> int:
-        """Sync products from MySQL to ChromaDB."""
-        mysql_client = get_mysql_client()
-        products = mysql_client.get_all_products()
-        
-        print(f"[DEBUG] Fetched {len(products)} products from MySQL")
-        
-        if not products:
-            return 0
-        
-        collection = self._get_collection()
-        
-        # Clear existing data
-        existing_ids = collection.get()["ids"]
-        if existing_ids:
-            collection.delete(ids=existing_ids)
-        
-        # Prepare data for insertion
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for product in products:
-            # Create document text for embedding
-            doc_text = self._create_product_document(product)
-            documents.append(doc_text)
-            
-            # Store metadata
-            metadatas.append({
-                "product_id": product["id"],
-                "name": product["name"],
-                "price": float(product["price"]) if product["price"] else 0,
-                "stock": product["stock"] or 0,
-                "category": product["category_name"] or "Chưa phân loại",
-                "status": product["status"] or "active"
-            })
-            
-            ids.append(f"product_{product['id']}")
-        
-        # Add to collection (auto-persists with PersistentClient)
-        collection.add(
+
+    def _check_hnsw(self, expected: dict) -> None:
+        """Warn when an existing collection was built with other HNSW parameters."""
+        stored = dict(self._collection.metadata or {})
+        # Newer Chroma keeps the live values in the collection configuration
+        configuration = (getattr(self._collection, "configuration", None) or {}).get("hnsw") or {}
+        for key, name in self.HNSW_CONFIGURATION_KEYS.items():
+            if configuration.get(name) is not None:
+                stored[key] = configuration[name]
+        changed = {
+            key: (stored.get(key), value) for key, value in expected.items()
+            if key in stored and stored[key] != value
+        }
+        if not changed:
+            return
+        if set(changed) == {"hnsw:search_ef"}:
+            try:
+                # Newer Chroma can change the search breadth in place
+                self._collection.modify(configuration={"hnsw": {"ef_search": expected["hnsw:search_ef"]}})
+                print(f"[DEBUG] Updated HNSW search_ef to {expected['hnsw:search_ef']}")
+                return
+            except Exception:
+                pass
+        print(
+            f"[ERROR] Collection {self._collection.name} keeps its HNSW parameters {changed} "
+            "(stored, configured); delete it and run a full sync to rebuild"
+        )
+
+    def _open_store(self) -> None:
+        self._get_collection()
+
+    def count(self) -> int:
+        return self._get_collection().count()
+
+    def _stored_hashes(self, ids: list[str]) -> dict[str, Optional[str]]:
+        existing = self._get_collection().get(ids=ids, include=["metadatas"])
+        return {
+            doc_id: (metadata or {}).get("content_hash")
+            for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+
+    def _upsert(self, ids: list[str], documents: list[str], embeddings: np.ndarray, metadatas: list[dict]) -> None:
+        self._get_collection().upsert(
             documents=documents,
+            embeddings=embeddings.tolist(),
             metadatas=metadatas,
             ids=ids
         )
-        
-        print(f"[DEBUG] Added {len(products)} products to ChromaDB")
-        
-        return len(products)
-    
-    def _create_product_document(self, product: dict) -> str:
-        """Create a text document from product data for embedding."""
-        parts = [
-            f"Tên sản phẩm: {product['name']}",
-        ]
-        
-        if product.get('description'):
-            parts.append(f"Mô tả: {product['description']}")
-        
-        if product.get('category_name'):
-            parts.append(f"Danh mục: {product['category_name']}")
-        
-        if product.get('price'):
-            price_formatted = f"{float(product['price']):,.0f}₫"
-            parts.append(f"Giá thuê: {price_formatted}")
-        
-        if product.get('stock'):
-            parts.append(f"Số lượng còn: {product['stock']}")
-        
-        return "\n".join(parts)
-    
-    def search_similar(self, query: str, n_results: int = 5) -> list[dict]:
-        """Search for similar products based on query."""
+
+    def _delete(self, ids: list[str]) -> None:
+        self._get_collection().delete(ids=ids)
+
+    def _iter_stored(self, page_size: int = 1000, documents: bool = False) -> Iterator[tuple[list[str], list[str], list[dict]]]:
         collection = self._get_collection()
-        
-        results = collection.query(
-            query_texts=[query],
+        include = ["documents", "metadatas"] if documents else []
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=include)
+            if not page["ids"]:
+                return
+            yield page["ids"], page.get("documents") or [], page.get("metadatas") or []
+            offset += len(page["ids"])
+
+    @staticmethod
+    def _where(clauses: list[FilterClause]) -> Optional[dict]:
+        """Chroma `where` clause for the filter conditions."""
+        conditions = [{field: {op: value}} for field, op, value in clauses]
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _query(self, vectors: np.ndarray, n_results: int, clauses: list[FilterClause]) -> list[list[StoredMatch]]:
+        where = self._where(clauses)
+        query_args = {"where": where} if where else {}
+        results = self._get_collection().query(
+            query_embeddings=vectors.tolist(),
             n_results=n_results,
-            include=["documents", "metadatas", "distances"]
+            include=["documents", "metadatas", "distances"],
+            **query_args
         )
-        
-        similar_products = []
-        if results and results["metadatas"]:
-            for i, metadata in enumerate(results["metadatas"][0]):
-                similar_products.append({
-                    "product_id": metadata.get("product_id"),
-                    "name": metadata.get("name"),
-                    "price": metadata.get("price"),
-                    "stock": metadata.get("stock"),
-                    "category": metadata.get("category"),
-                    "document": results["documents"][0][i] if results["documents"] else "",
-                    "distance": results["distances"][0][i] if results["distances"] else None
-                })
-        
-        return similar_products
-
-
-@lru_cache()
-def get_vectorstore() -> ChromaVectorStore:
-    """Get cached ChromaVectorStore instance."""
-    return ChromaVectorStore()
+
+        matches = []
+        for row, ids in enumerate(results["ids"]):
+            matches.append([
+                (
+                    doc_id,
+                    results["documents"][row][i] if results["documents"] else "",
+                    results["metadatas"][row][i] if results["metadatas"] else {},
+                    results["distances"][row][i] if results["distances"] else None
+                )
+                for i, doc_id in enumerate(ids)
+            ])
+        return matches
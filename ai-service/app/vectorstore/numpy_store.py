@@ -0,0 +1,419 @@
+import json
+import os
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+
+from app.vectorstore.base import FilterClause, StoredMatch, VectorStore
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact (brute-force) vector store over a memory-mapped embedding matrix.
+
+    The product catalog fits in RAM many times over, so top-k is one
+    matrix-vector product over normalized embeddings plus argpartition: no
+    HNSW graph and no SQLite. Vectors live in a .npy memmap that grows by
+    doubling, stored as float32, float16 or int8 with a per-vector scale.
+    With a compact dtype, `rerank` candidates can be re-scored exactly from a
+    float32 copy kept on disk; only the rows being re-ranked are paged in.
+
+    Metadata is columnar: numeric fields and dictionary-encoded category and
+    status codes in NumPy arrays, names and documents in plain lists, so a
+    product costs a few dozen bytes of metadata instead of a dict, and
+    filters are a vectorized mask.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    SCALES_FILE = "scales.npy"
+    FULL_VECTORS_FILE = "vectors_full.npy"
+    COLUMNS_FILE = "columns.npz"
+    META_FILE = "meta.json"
+    # Present while writes since the last flush are unpersisted; a crash
+    # leaves it behind and the index is rebuilt by the next sync.
+    DIRTY_FILE = "dirty"
+    DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+    COLUMNS = {
+        "product_id": np.int64,
+        "price": np.float64,
+        "stock": np.int64,
+        "shop_id": np.int64,
+        "category": np.int32,
+        "status": np.int32,
+        "content_hash": "S32",
+    }
+    # Columns stored as codes into a per-column vocabulary
+    ENCODED_COLUMNS = ("category", "status")
+    # Compact scores are computed in float32 over blocks of this many rows
+    SCORE_BLOCK_ROWS = 8192
+    # Lexical hits are served from the columns instead of per-product dicts
+    KEEP_LEXICAL_DOCS = False
+
+    def __init__(self):
+        super().__init__()
+        if self.settings.numpy_index_dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported numpy index dtype: {self.settings.numpy_index_dtype}")
+        self.dtype = np.dtype(self.DTYPES[self.settings.numpy_index_dtype])
+        # Exact re-ranking only means something for lossy storage
+        self.rerank = self.settings.numpy_index_rerank if self.dtype != np.float32 else 0
+        self._lock = threading.RLock()
+        self._opened = False
+        self._dirty = False
+        self._matrices: dict[str, np.memmap] = {}
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._names: list[str] = []
+        self._documents: list[str] = []
+        self._columns: dict[str, np.ndarray] = {}
+        self._vocab: dict[str, list[str]] = {name: [] for name in self.ENCODED_COLUMNS}
+        self._codes: dict[str, dict[str, int]] = {name: {} for name in self.ENCODED_COLUMNS}
+
+    def _data_directory(self) -> str:
+        root = self.settings.numpy_index_directory or os.path.join(
+            self.settings.chroma_persist_directory, "numpy_index"
+        )
+        return os.path.join(root, f"{self._index_name()}_{self.dtype.name}")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._data_directory(), name)
+
+    def _matrix_files(self) -> list[str]:
+        files = [self.VECTORS_FILE]
+        if self.dtype == np.int8:
+            files.append(self.SCALES_FILE)
+        if self.rerank:
+            files.append(self.FULL_VECTORS_FILE)
+        return files
+
+    @property
+    def _capacity(self) -> int:
+        vectors = self._matrices.get(self.VECTORS_FILE)
+        return len(vectors) if vectors is not None else 0
+
+    # ----- storage -----
+
+    def _open_store(self) -> None:
+        """Map the persisted index, or start empty if there is none (or it was left dirty)."""
+        with self._lock:
+            if self._opened:
+                return
+            os.makedirs(self._data_directory(), exist_ok=True)
+            persisted = all(os.path.exists(self._path(name)) for name in self._matrix_files() + [self.META_FILE])
+            if os.path.exists(self._path(self.DIRTY_FILE)):
+                print("[ERROR] Numpy index was not flushed cleanly; starting empty until the next sync")
+            elif persisted:
+                self._load()
+                print(f"[DEBUG] Mapped numpy index with {len(self._ids)} vectors")
+            self._allocate_columns(self._capacity)
+            self._opened = True
+
+    def _load(self) -> None:
+        with open(self._path(self.META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        for name in self._matrix_files():
+            self._matrices[name] = np.load(self._path(name), mmap_mode="r+")
+        self._ids = meta["ids"]
+        self._names = meta["names"]
+        self._documents = meta["documents"]
+        self._vocab = meta["vocab"]
+        self._codes = {name: {value: code for code, value in enumerate(values)} for name, values in self._vocab.items()}
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        with np.load(self._path(self.COLUMNS_FILE)) as columns:
+            self._allocate_columns(self._capacity)
+            for name in self.COLUMNS:
+                self._columns[name][:len(self._ids)] = columns[name]
+
+    def _allocate_columns(self, capacity: int) -> None:
+        """Size every column to `capacity` rows, keeping existing values."""
+        for name, dtype in self.COLUMNS.items():
+            column = np.zeros(capacity, dtype=dtype)
+            current = self._columns.get(name)
+            if current is not None:
+                column[:min(len(current), capacity)] = current[:capacity]
+            self._columns[name] = column
+
+    def _encode(self, column: str, value: Optional[str]) -> int:
+        value = value or ""
+        code = self._codes[column].get(value)
+        if code is None:
+            code = len(self._vocab[column])
+            self._vocab[column].append(value)
+            self._codes[column][value] = code
+        return code
+
+    def _set_row(self, row: int, metadata: dict) -> None:
+        self._columns["product_id"][row] = metadata.get("product_id") or 0
+        self._columns["price"][row] = metadata.get("price") or 0
+        self._columns["stock"][row] = metadata.get("stock") or 0
+        self._columns["shop_id"][row] = metadata.get("shop_id") or 0
+        for name in self.ENCODED_COLUMNS:
+            self._columns[name][row] = self._encode(name, metadata.get(name))
+        content_hash = metadata.get("content_hash")
+        self._columns["content_hash"][row] = bytes.fromhex(content_hash) if content_hash else b""
+        self._names[row] = metadata.get("name") or ""
+
+    def _metadata(self, row: int) -> dict:
+        """Rebuild the stored metadata dict for one row."""
+        return {
+            "product_id": int(self._columns["product_id"][row]),
+            "name": self._names[row],
+            "price": float(self._columns["price"][row]),
+            "stock": int(self._columns["stock"][row]),
+            "category": self._vocab["category"][self._columns["category"][row]],
+            "status": self._vocab["status"][self._columns["status"][row]],
+            "shop_id": int(self._columns["shop_id"][row]),
+            "content_hash": self._content_hash_at(row),
+        }
+
+    def _grow(self, rows: int, dim: int) -> None:
+        """Grow every memmap and column (by doubling) to hold at least `rows` rows."""
+        vectors = self._matrices.get(self.VECTORS_FILE)
+        if vectors is not None and vectors.shape[1] != dim:
+            raise ValueError(f"Embedding dimension changed from {vectors.shape[1]} to {dim}")
+        capacity = self._capacity
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        shapes = {
+            self.VECTORS_FILE: ((new_capacity, dim), self.dtype),
+            self.SCALES_FILE: ((new_capacity,), np.float32),
+            self.FULL_VECTORS_FILE: ((new_capacity, dim), np.float32),
+        }
+        for name in self._matrix_files():
+            shape, dtype = shapes[name]
+            tmp_path = self._path(name + ".tmp")
+            grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+            current = self._matrices.pop(name, None)
+            if current is not None:
+                grown[:len(self._ids)] = current[:len(self._ids)]
+                grown.flush()
+            del grown, current
+            os.replace(tmp_path, self._path(name))
+            self._matrices[name] = np.load(self._path(name), mmap_mode="r+")
+        self._allocate_columns(new_capacity)
+
+    def _write_vectors(self, row: int, vector: np.ndarray) -> None:
+        """Store one unit vector in the configured precision."""
+        if self.dtype == np.int8:
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            self._matrices[self.VECTORS_FILE][row] = np.round(vector / scale).astype(np.int8)
+            self._matrices[self.SCALES_FILE][row] = scale
+        else:
+            self._matrices[self.VECTORS_FILE][row] = vector
+        if self.rerank:
+            self._matrices[self.FULL_VECTORS_FILE][row] = vector
+
+    def _mark_dirty(self) -> None:
+        if not self._dirty:
+            with open(self._path(self.DIRTY_FILE), "w") as f:
+                f.write("1")
+            self._dirty = True
+
+    def count(self) -> int:
+        self._open_store()
+        return len(self._ids)
+
+    def _content_hash_at(self, row: int) -> Optional[str]:
+        # Fixed-width bytes come back with trailing NULs stripped
+        digest = self._columns["content_hash"][row]
+        return digest.ljust(32, b"\0").hex() if digest else None
+
+    def _stored_hashes(self, ids: list[str]) -> dict[str, Optional[str]]:
+        with self._lock:
+            return {
+                doc_id: self._content_hash_at(self._rows[doc_id])
+                for doc_id in ids if doc_id in self._rows
+            }
+
+    def _upsert(self, ids: list[str], documents: list[str], embeddings: np.ndarray, metadatas: list[dict]) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms > 0, norms, 1)
+        with self._lock:
+            self._open_store()
+            self._mark_dirty()
+            new = sum(1 for doc_id in dict.fromkeys(ids) if doc_id not in self._rows)
+            self._grow(len(self._ids) + new, embeddings.shape[1])
+            for doc_id, document, vector, metadata in zip(ids, documents, embeddings, metadatas):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[doc_id] = row
+                    self._ids.append(doc_id)
+                    self._names.append("")
+                    self._documents.append(document)
+                else:
+                    self._documents[row] = document
+                self._write_vectors(row, vector)
+                self._set_row(row, metadata)
+
+    def _delete(self, ids: list[str]) -> None:
+        """Remove rows by moving the last row into each hole."""
+        with self._lock:
+            self._open_store()
+            self._mark_dirty()
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                if row != last:
+                    moved = self._ids[last]
+                    for matrix in self._matrices.values():
+                        matrix[row] = matrix[last]
+                    for column in self._columns.values():
+                        column[row] = column[last]
+                    self._ids[row] = moved
+                    self._names[row] = self._names[last]
+                    self._documents[row] = self._documents[last]
+                    self._rows[moved] = row
+                self._ids.pop()
+                self._names.pop()
+                self._documents.pop()
+
+    def _flush(self) -> None:
+        """Flush the memmaps, then atomically write columns and ids/documents."""
+        with self._lock:
+            if not self._dirty:
+                return
+            for matrix in self._matrices.values():
+                matrix.flush()
+            n = len(self._ids)
+            tmp_path = self._path(self.COLUMNS_FILE + ".tmp.npz")
+            np.savez(tmp_path, **{name: column[:n] for name, column in self._columns.items()})
+            os.replace(tmp_path, self._path(self.COLUMNS_FILE))
+            tmp_path = self._path(self.META_FILE + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "dtype": self.dtype.name,
+                    "ids": self._ids,
+                    "names": self._names,
+                    "documents": self._documents,
+                    "vocab": self._vocab,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(self.META_FILE))
+            os.remove(self._path(self.DIRTY_FILE))
+            self._dirty = False
+
+    def _iter_stored(self, page_size: int = 1000, documents: bool = False) -> Iterator[tuple[list[str], list[str], list[dict]]]:
+        self._open_store()
+        with self._lock:
+            ids = list(self._ids)
+            docs = list(self._documents) if documents else []
+            metadatas = [self._metadata(row) for row in range(len(ids))] if documents else []
+        for start in range(0, len(ids), page_size):
+            end = start + page_size
+            yield ids[start:end], docs[start:end], metadatas[start:end]
+
+    def _index_stats(self) -> dict:
+        """Rows, storage precision and bytes per product (vectors and metadata)."""
+        with self._lock:
+            n = len(self._ids)
+            vectors = self._matrices.get(self.VECTORS_FILE)
+            dim = vectors.shape[1] if vectors is not None else 0
+            vector_bytes = dim * self.dtype.itemsize + (4 if self.dtype == np.int8 else 0)
+            column_bytes = sum(np.dtype(dtype).itemsize for dtype in self.COLUMNS.values())
+            name_bytes = sum(len(name.encode("utf-8")) for name in self._names) / n if n else 0
+            return {
+                "rows": n,
+                "dimension": dim,
+                "dtype": self.dtype.name,
+                "rerank_candidates": self.rerank,
+                "vector_bytes_per_product": vector_bytes,
+                "metadata_bytes_per_product": round(column_bytes + name_bytes, 1),
+                # Read only for re-ranked candidates, so mostly not resident
+                "rerank_bytes_per_product_on_disk": dim * 4 if self.rerank else 0,
+            }
+
+    # ----- search -----
+
+    def _lexical_entry(self, doc_id: str) -> tuple[str, dict]:
+        with self._lock:
+            row = self._rows.get(doc_id)
+            if row is None:
+                return "", {}
+            return self._documents[row], self._metadata(row)
+
+    def _lexical_filter(self, clauses: list[FilterClause]):
+        """One vectorized mask per search instead of a metadata lookup per BM25 posting."""
+        if not clauses:
+            return None
+        with self._lock:
+            mask = self._mask(clauses, len(self._ids))
+            rows = dict(self._rows)
+        return lambda doc_id: doc_id in rows and bool(mask[rows[doc_id]])
+
+    def _mask(self, clauses: list[FilterClause], n: int) -> Optional[np.ndarray]:
+        """Boolean row mask for the filter conditions, or None when unfiltered."""
+        if not clauses:
+            return None
+        mask = np.ones(n, dtype=bool)
+        for field, op, value in clauses:
+            column = self._columns.get(field)
+            if field in self.ENCODED_COLUMNS and op == "$eq":
+                mask &= column[:n] == self._codes[field].get(value, -1)
+            elif column is None or field in self.ENCODED_COLUMNS or column.dtype.kind == "S":
+                mask &= np.array(
+                    [self._OPERATORS[op](self._metadata(row).get(field), value) for row in range(n)], dtype=bool
+                )
+            elif op == "$eq":
+                mask &= column[:n] == value
+            elif op == "$gt":
+                mask &= column[:n] > value
+            elif op == "$gte":
+                mask &= column[:n] >= value
+            else:
+                mask &= column[:n] <= value
+        return mask
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray], n: int) -> np.ndarray:
+        """Cosine scores from the stored precision, shape (queries, candidate rows)."""
+        vectors = self._matrices[self.VECTORS_FILE]
+        matrix = vectors[:n] if rows is None else vectors[rows]
+        if self.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), self.SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + self.SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self.dtype == np.int8:
+            scales = self._matrices[self.SCALES_FILE]
+            scores *= scales[:n] if rows is None else scales[rows]
+        return scores
+
+    def _query(self, vectors: np.ndarray, n_results: int, clauses: list[FilterClause]) -> list[list[StoredMatch]]:
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        with self._lock:
+            self._open_store()
+            n = len(self._ids)
+            mask = self._mask(clauses, n)
+            rows = np.flatnonzero(mask) if mask is not None else None
+            candidates = n if rows is None else len(rows)
+            if not candidates or n_results <= 0:
+                return [[] for _ in queries]
+
+            scores = self._scores(queries, rows, n)
+            k = min(n_results, candidates)
+            depth = min(max(k, self.rerank), candidates)
+            top = np.argpartition(-scores, depth - 1, axis=1)[:, :depth]
+            matches = []
+            for query, query_scores, found in zip(queries, scores, top):
+                found_rows = found if rows is None else rows[found]
+                if self.rerank:
+                    # Exact float32 scores for the compact index's candidates
+                    order = np.argsort(found_rows)
+                    found, found_rows = found[order], found_rows[order]
+                    exact = self._matrices[self.FULL_VECTORS_FILE][found_rows] @ query
+                    best = np.argsort(-exact)[:k]
+                    ranked = [(int(found_rows[i]), float(exact[i])) for i in best]
+                else:
+                    best = np.argsort(-query_scores[found])
+                    ranked = [(int(found_rows[i]), float(query_scores[found[i]])) for i in best]
+                matches.append([
+                    (self._ids[row], self._documents[row], self._metadata(row), self._distance(score))
+                    for row, score in ranked
+                ])
+            return matches
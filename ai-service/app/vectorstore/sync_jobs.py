@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+from app.vectorstore.base import get_vectorstore
+
+
+class SyncJobManager:
+    """
+    Runs MySQL -> Chroma syncs as background jobs, one at a time.
+
+    Triggers that arrive while a job is running coalesce onto that job and
+    request one more delta pass once the current pass finishes, so changes
+    made after the running pass started reading are still picked up. If any
+    coalesced trigger asked for a full rebuild, that follow-up pass is full.
+    """
+
+    MAX_HISTORY = 50
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._current_id: Optional[str] = None
+
+    def start(self, full: bool = False) -> tuple[dict, bool]:
+        """Start a sync job, or join the running one. Returns (job, coalesced)."""
+        with self._lock:
+            if self._current_id is not None:
+                job = self._jobs[self._current_id]
+                job["coalesced_triggers"] += 1
+                job["rerun_requested"] = True
+                if full:
+                    job["full_requested"] = True
+                    job["mode"] = "full"
+                return dict(job), True
+
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "mode": "full" if full else "delta",
+                "created_at": datetime.now(timezone.utc),
+                "started_at": None,
+                "finished_at": None,
+                "duration_seconds": None,
+                "passes": 0,
+                "progress": {},
+                "result": None,
+                "error": None,
+                "coalesced_triggers": 0,
+                "rerun_requested": False,
+                "full_requested": False,
+            }
+            self._jobs[job_id] = job
+            self._current_id = job_id
+            while len(self._jobs) > self.MAX_HISTORY:
+                self._jobs.popitem(last=False)
+
+        thread = threading.Thread(
+            target=self._run, args=(job_id, full), name=f"sync-{job_id[:8]}", daemon=True
+        )
+        thread.start()
+        return dict(job), False
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Snapshot of a job's state, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id: str, full: bool) -> None:
+        started = time.monotonic()
+        self._update(job_id, status="running", started_at=datetime.now(timezone.utc))
+        vectorstore = get_vectorstore()
+        totals = {"fetched": 0, "upserted": 0, "unchanged": 0, "deleted": 0, "batches": 0}
+
+        def on_progress(stats: dict) -> None:
+            progress = {key: totals[key] + stats.get(key, 0) for key in totals}
+            self._update(job_id, progress=progress)
+
+        try:
+            while True:
+                with self._lock:
+                    job = self._jobs[job_id]
+                    # Follow-up passes only pick up new changes, unless a
+                    # coalesced trigger asked for a rebuild
+                    full = full or job["full_requested"]
+                    job["rerun_requested"] = False
+                    job["full_requested"] = False
+                    job["passes"] += 1
+
+                result = vectorstore.sync_products(full=full, progress=on_progress)
+                for key in totals:
+                    totals[key] += result.get(key, 0)
+                full = False
+
+                with self._lock:
+                    job = self._jobs[job_id]
+                    job["progress"] = dict(totals)
+                    job["result"] = {**result, **totals}
+                    if not job["rerun_requested"]:
+                        self._finish(job, "succeeded", started)
+                        return
+        except Exception as e:
+            print(f"[ERROR] Sync job {job_id} failed: {e}")
+            with self._lock:
+                job = self._jobs[job_id]
+                job["error"] = str(e)
+                self._finish(job, "failed", started)
+
+    def _finish(self, job: dict, status: str, started: float) -> None:
+        """Mark a job finished and release the single-flight slot. Caller holds the lock."""
+        job["status"] = status
+        job["finished_at"] = datetime.now(timezone.utc)
+        job["duration_seconds"] = round(time.monotonic() - started, 3)
+        job["rerun_requested"] = False
+        job["full_requested"] = False
+        self._current_id = None
+
+
+@lru_cache()
+def get_sync_job_manager() -> SyncJobManager:
+    """Get cached SyncJobManager instance."""
+    return SyncJobManager()
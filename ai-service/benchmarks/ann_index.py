@@ -0,0 +1,121 @@
+"""
+HNSW parameter sweep: build time, index size, p50/p99 latency and recall@k.
+
+Builds a Chroma collection for every combination of --m, --construction-ef
+and --search-ef over a synthetic catalog (or an exported embedding matrix,
+e.g. a NumPy backend's vectors.npy or any float32 .npy of shape (n, dim)),
+then compares each against brute-force search.
+
+    cd ai-service
+    python -m benchmarks.ann_index --docs 50000 --m 16,32 --search-ef 10,50,100
+    python -m benchmarks.ann_index --catalog ./chroma_data/numpy_index/.../vectors.npy
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.vector_search import exact_top_k, load, make_corpus, make_queries, percentile
+
+
+def directory_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def load_catalog(path: str, limit: int) -> np.ndarray:
+    """Unit-normalized float32 rows of an exported embedding matrix."""
+    vectors = np.asarray(np.load(path, mmap_mode="r")[:limit] if limit else np.load(path), dtype=np.float32)
+    # Exported memmaps are over-allocated; unused rows are all zeros
+    vectors = vectors[np.abs(vectors).sum(axis=1) > 0]
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", help="float32 .npy embedding matrix to index instead of synthetic data")
+    parser.add_argument("--docs", type=int, default=20000, help="synthetic catalog size (or row limit for --catalog)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--distance", default="l2", choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=ints, default=[16])
+    parser.add_argument("--construction-ef", type=ints, default=[100])
+    parser.add_argument("--search-ef", type=ints, default=[10, 50, 100])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.catalog:
+        corpus = load_catalog(args.catalog, args.docs)
+    else:
+        corpus = make_corpus(args.docs, args.dim, args.clusters, args.seed)
+    queries = make_queries(corpus, args.queries, args.seed)
+    truth = exact_top_k(corpus, queries, args.k)
+
+    started = time.perf_counter()
+    for query in queries:
+        scores = corpus @ query
+        np.argpartition(-scores, args.k)[:args.k]
+    brute_ms = (time.perf_counter() - started) / len(queries) * 1000
+
+    os.environ["EMBEDDING_BACKEND"] = "chroma-default"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    os.environ["VECTOR_DISTANCE"] = args.distance
+    from app.config import get_settings
+    from app.vectorstore.chroma import ChromaVectorStore
+
+    rows = []
+    with tempfile.TemporaryDirectory() as root:
+        for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+            directory = os.path.join(root, f"m{m}-c{construction_ef}-s{search_ef}")
+            os.environ.update({
+                "CHROMA_PERSIST_DIRECTORY": directory,
+                "HNSW_M": str(m),
+                "HNSW_CONSTRUCTION_EF": str(construction_ef),
+                "HNSW_SEARCH_EF": str(search_ef),
+            })
+            get_settings.cache_clear()
+            store = ChromaVectorStore()
+            store._open_store()
+            build_seconds = load(store, corpus)
+
+            latencies = []
+            recalls = []
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                matches = store._query(query[None, :], args.k, [])[0]
+                latencies.append(time.perf_counter() - started)
+                recalls.append(len({doc_id for doc_id, _, _, _ in matches} & expected) / args.k)
+
+            rows.append({
+                "M": m,
+                "construction_ef": construction_ef,
+                "search_ef": search_ef,
+                "build_s": build_seconds,
+                "index_MB": directory_bytes(directory) / 2**20,
+                "p50_ms": percentile(latencies, 50),
+                "p99_ms": percentile(latencies, 99),
+                f"recall@{args.k}": float(np.mean(recalls)),
+            })
+
+    source = args.catalog or "synthetic"
+    print(f"{len(corpus)} docs x {corpus.shape[1]} dims ({source}), {len(queries)} queries, "
+          f"k={args.k}, distance={args.distance}; brute force {brute_ms:.3f} ms/query")
+    columns = list(rows[0])
+    print(" | ".join(f"{c:>15}" for c in columns))
+    for row in rows:
+        print(" | ".join(f"{v:>15.3f}" if isinstance(v, float) else f"{v:>15}" for v in row.values()))
+
+
+if __name__ == "__main__":
+    main()
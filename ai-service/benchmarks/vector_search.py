@@ -0,0 +1,180 @@
+"""
+Vector store backend benchmark: query latency, recall@k and memory per product.
+
+Loads the same synthetic clustered, normalized embeddings into each backend
+(no embedding model or MySQL needed) and measures single-query and batched
+top-k latency plus recall against exact float64 search. NumPy backends are
+named numpy-<dtype>[-rerank<N>], e.g. numpy-int8-rerank50; their bytes per
+product (vectors + columnar metadata) are reported next to the size of the
+same metadata held as a Python dict.
+
+    cd ai-service
+    python -m benchmarks.vector_search --docs 20000 --dim 384 --queries 200
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_corpus(docs: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors drawn around random centroids, like product embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim))
+    vectors = centroids[rng.integers(0, clusters, docs)] + 0.6 * rng.standard_normal((docs, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_queries(corpus: np.ndarray, queries: int, seed: int) -> np.ndarray:
+    """Perturbed corpus vectors, so each query has a meaningful neighbourhood."""
+    rng = np.random.default_rng(seed + 1)
+    picked = corpus[rng.integers(0, len(corpus), queries)]
+    noisy = picked + 0.05 * rng.standard_normal(picked.shape)
+    return (noisy / np.linalg.norm(noisy, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> list[set[str]]:
+    scores = queries.astype(np.float64) @ corpus.astype(np.float64).T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [{f"product_{i}" for i in row} for row in top]
+
+
+def load(store, corpus: np.ndarray, batch: int = 1000) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(corpus), batch):
+        ids = [f"product_{i}" for i in range(start, min(start + batch, len(corpus)))]
+        metadatas = [metadata(i) for i in range(start, start + len(ids))]
+        store._upsert(ids, [""] * len(ids), corpus[start:start + len(ids)], metadatas)
+    store._flush()
+    return time.perf_counter() - started
+
+
+def metadata(i: int) -> dict:
+    return {
+        "product_id": i, "name": f"Sản phẩm cho thuê số {i}", "price": float(i % 500) * 1000,
+        "stock": i % 7, "category": f"Danh mục {i % 20}", "status": "Còn hàng", "shop_id": i % 50,
+        "content_hash": f"{i:064x}",
+    }
+
+
+def dict_bytes(value) -> int:
+    """Deep size of a metadata dict as the per-product dict layout keeps it."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(dict_bytes(k) + dict_bytes(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def memory_per_product(store, dim: int) -> tuple[float, float]:
+    """(vector bytes, metadata bytes) per product."""
+    stats = store._index_stats()
+    if stats is not None:
+        return stats["vector_bytes_per_product"], stats["metadata_bytes_per_product"]
+    # Chroma keeps float32 vectors in its HNSW index and metadata as rows
+    return dim * 4, float("nan")
+
+
+def percentile(samples: list[float], p: float) -> float:
+    return float(np.percentile(samples, p)) * 1000
+
+
+def bench(name: str, store, queries: np.ndarray, truth: list[set[str]], k: int, batch: int) -> dict:
+    single = []
+    found = []
+    for query in queries:
+        started = time.perf_counter()
+        matches = store._query(query[None, :], k, [])[0]
+        single.append(time.perf_counter() - started)
+        found.append({doc_id for doc_id, _, _, _ in matches})
+    recall = np.mean([len(f & t) / k for f, t in zip(found, truth)])
+
+    batched = []
+    for start in range(0, len(queries), batch):
+        started = time.perf_counter()
+        store._query(queries[start:start + batch], k, [])
+        batched.append((time.perf_counter() - started) / len(queries[start:start + batch]))
+
+    filtered = []
+    clauses = [("price", "$lte", 200000.0), ("stock", "$gt", 0)]
+    for query in queries[:50]:
+        started = time.perf_counter()
+        store._query(query[None, :], k, clauses)
+        filtered.append(time.perf_counter() - started)
+
+    return {
+        "backend": name,
+        "p50_ms": percentile(single, 50),
+        "p95_ms": percentile(single, 95),
+        "batch_ms_per_query": percentile(batched, 50),
+        "filtered_p50_ms": percentile(filtered, 50),
+        f"recall@{k}": float(recall),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument(
+        "--backends",
+        default="numpy-float32,numpy-float16,numpy-int8,numpy-int8-rerank50,chroma"
+    )
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Settings are read on first use, so point every store at the scratch directory
+        os.environ["CHROMA_PERSIST_DIRECTORY"] = directory
+        os.environ["EMBEDDING_BACKEND"] = "chroma-default"
+        os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+        from app.config import get_settings
+
+        corpus = make_corpus(args.docs, args.dim, args.clusters, args.seed)
+        queries = make_queries(corpus, args.queries, args.seed)
+        truth = exact_top_k(corpus, queries, args.k)
+
+        rows = []
+        for backend in args.backends.split(","):
+            get_settings.cache_clear()
+            numpy_backend = re.fullmatch(r"numpy(?:-(float32|float16|int8))?(?:-rerank(\d+))?", backend)
+            if numpy_backend:
+                os.environ["NUMPY_INDEX_DTYPE"] = numpy_backend.group(1) or "float32"
+                os.environ["NUMPY_INDEX_RERANK"] = numpy_backend.group(2) or "0"
+                os.environ["NUMPY_INDEX_DIRECTORY"] = os.path.join(directory, backend)
+                from app.vectorstore.numpy_store import NumpyVectorStore
+                store = NumpyVectorStore()
+            elif backend == "chroma":
+                from app.vectorstore.chroma import ChromaVectorStore
+                store = ChromaVectorStore()
+            else:
+                raise SystemExit(f"Unknown backend: {backend}")
+            store._open_store()
+            load_seconds = load(store, corpus)
+            vector_bytes, metadata_bytes = memory_per_product(store, args.dim)
+            rows.append({
+                **bench(backend, store, queries, truth, args.k, args.batch),
+                "load_s": load_seconds,
+                "vector_B/product": float(vector_bytes),
+                "metadata_B/product": float(metadata_bytes),
+            })
+
+    print(f"{args.docs} docs x {args.dim} dims, {args.queries} queries, k={args.k}")
+    print(f"metadata as a Python dict: ~{dict_bytes(metadata(args.docs // 2))} B/product")
+    columns = list(rows[0])
+    print(" | ".join(f"{c:>18}" for c in columns))
+    for row in rows:
+        print(" | ".join(f"{v:>18.3f}" if isinstance(v, float) else f"{v:>18}" for v in row.values()))
+
+
+if __name__ == "__main__":
+    main()
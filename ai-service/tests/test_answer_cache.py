@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.cache import answer_cache, prior_turns
+from app.cache.answer_cache import AnswerCache
+
+
+QUERY = "bàn tiệc nào rẻ nhất"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "query_signature", lambda normalized: ("cheapest", None))
+    cache = AnswerCache()
+    monkeypatch.setattr(cache, "_embed", lambda text: np.ones(4, dtype=np.float32) / 2)
+    return cache
+
+
+def test_prior_turns_drops_the_current_message():
+    earlier = [{"role": "user", "content": "xin chào"}, {"role": "assistant", "content": "Chào bạn"}]
+    assert prior_turns([{"role": "user", "content": "Bàn tiệc nào rẻ nhất?"}], QUERY) == []
+    assert prior_turns(earlier + [{"role": "user", "content": QUERY}], QUERY) == earlier
+    assert prior_turns(earlier, QUERY) == earlier
+    assert prior_turns(None, QUERY) == []
+
+
+def test_follow_ups_are_served_template_answers_only(cache):
+    _, probe = cache.lookup(QUERY, None, "smart")
+    cache.store(probe, {"answer": "llm", "metadata": {"answer_mode": "llm"}}, 1.0)
+
+    cached, _ = cache.lookup(QUERY, None, "smart")
+    assert cached["answer"] == "llm"
+    cached, probe = cache.lookup(QUERY, None, "smart", templates_only=True)
+    assert cached is None
+
+    cache.store(probe, {"answer": "template", "metadata": {"answer_mode": "template"}}, 1.0)
+    cached, _ = cache.lookup(QUERY, None, "smart", templates_only=True)
+    assert cached["answer"] == "template"
+
+
+def test_backend_requests_are_answered_from_the_cache(cache, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("langchain_google_genai")
+    from app import main
+    from app.schemas import ChatRequest
+
+    monkeypatch.setattr(main, "get_answer_cache", lambda: cache)
+    calls = []
+
+    class Agent:
+        async def achat(self, query, user_id, conversation_history, polish):
+            calls.append(conversation_history)
+            return {"answer": "a", "sources": [], "metadata": {"strategy": "vector", "answer_mode": "llm"}}
+
+    # The Laravel controller stores the message before asking, so it is always in the history
+    request = ChatRequest(query=QUERY, user_id=7, conversation_history=[{"role": "user", "content": QUERY}])
+    first = asyncio.run(main._answer_with_cache(Agent(), request))
+    second = asyncio.run(main._answer_with_cache(Agent(), request))
+
+    assert len(calls) == 1
+    assert first["metadata"]["cache"]["status"] == "miss"
+    assert second["metadata"]["cache"]["status"] == "hit"
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+
+from app.agents import smart_agent
+from app.agents.smart_agent import SmartChatAgent
+
+
+class FakeMySQLClient:
+    rankings = None
+
+    def __init__(self):
+        self.order_lookups = []
+
+    async def run_async(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def match_category(self, text):
+        return None
+
+    def get_orders_for_users(self, user_ids, limit=5):
+        self.order_lookups.append(list(user_ids))
+        return {
+            user_id: [{"id": user_id * 10, "status": "Đã giao", "total_amount": 1000, "items": []}]
+            for user_id in user_ids
+        }
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.lookups = []
+
+    def search_many(self, lookups, n_results=None, timings=None):
+        self.lookups.append(list(lookups))
+        return [
+            [{"product_id": i, "name": f"{query} {i}", "price": 1000.0, "category": "Tiệc", "stock": 1}]
+            for i, (query, _) in enumerate(lookups, 1)
+        ]
+
+
+class FakeRouterCache:
+    def __init__(self):
+        self.discarded = []
+
+    def discard(self, question, user_id):
+        self.discarded.append(question)
+
+
+class FakeAnswerChain:
+    def __init__(self):
+        self.inputs = []
+
+    async def abatch(self, inputs, config=None, return_exceptions=False):
+        self.inputs.extend(inputs)
+        return [f"answer: {i['question']}" for i in inputs]
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = SmartChatAgent()
+    vectorstore = FakeVectorStore()
+    router_cache = FakeRouterCache()
+    mysql_client = FakeMySQLClient()
+    monkeypatch.setattr(smart_agent, "get_mysql_client", lambda: mysql_client)
+    monkeypatch.setattr(smart_agent, "get_vectorstore", lambda: vectorstore)
+    monkeypatch.setattr(smart_agent, "get_router_cache", lambda: router_cache)
+
+    def execute_sql(sql, user_id=None):
+        if "broken" in sql:
+            raise ValueError("Unknown column broken")
+        return [{"id": 7, "name": "Bàn tiệc", "price": 50000}]
+
+    monkeypatch.setattr(agent, "_execute_sql", execute_sql)
+    agent.mysql_client = mysql_client
+    agent.vectorstore = vectorstore
+    agent.router_cache = router_cache
+    return agent
+
+
+def item(query, routing):
+    return {"query": query, "user_id": None, "history": None, "polish": False, "timings": {}, "routing": routing}
+
+
+def test_abatch_retrieve_keeps_outcomes_with_their_items(agent):
+    items = [
+        item("xin chào", {"strategy": "conversation"}),
+        item("giá lỗi", {"strategy": "sql", "sql_query": "SELECT broken FROM products"}),
+        item("bàn tiệc cưới", {"strategy": "vector", "search_query": "bàn tiệc"}),
+        item("giá bàn", {"strategy": "sql", "sql_query": "SELECT id, name, price FROM products"}),
+    ]
+    asyncio.run(agent._abatch_retrieve(items))
+
+    assert not any("error" in i for i in items)
+    conversation, failed_sql, vector, sql = items
+    assert conversation["strategy"] == "conversation" and conversation["sources"] == []
+    # Failed SQL falls back to vector search, batched with the vector item
+    assert failed_sql["strategy"] == "vector" and failed_sql["sources"]
+    assert "SQL failed" in failed_sql["routing"]["reasoning"]
+    assert agent.router_cache.discarded == ["giá lỗi"]
+    assert vector["strategy"] == "vector" and vector["sources"][0]["name"].startswith("bàn tiệc")
+    assert agent.vectorstore.lookups == [[("giá lỗi", None), ("bàn tiệc", None)]]
+    assert sql["strategy"] == "sql" and sql["sources"][0]["product_id"] == 7
+
+
+def test_abatch_retrieve_isolates_a_failing_step(agent, monkeypatch):
+    def broken_fast_path(*args):
+        raise RuntimeError("MySQL down")
+
+    monkeypatch.setattr(smart_agent.get_chat_agent(), "_build_context_with_data", broken_fast_path)
+    items = [
+        item("xin chào", {"strategy": "conversation"}),
+        {**item("sản phẩm bán chạy", {"strategy": "fast_path"}), "fast_path": ("best_sellers", {}, 0.95)},
+        item("giá bàn", {"strategy": "sql", "sql_query": "SELECT id, name, price FROM products"}),
+    ]
+    asyncio.run(agent._abatch_retrieve(items))
+
+    assert "error" not in items[0] and items[0]["strategy"] == "conversation"
+    assert isinstance(items[1]["error"], RuntimeError)
+    assert "error" not in items[2] and items[2]["strategy"] == "sql"
+
+
+def test_abatch_retrieve_loads_order_histories_in_one_call(agent):
+    def history(user_id):
+        return {
+            **item("đơn hàng của tôi", {"strategy": "fast_path"}),
+            "user_id": user_id,
+            "fast_path": ("order_history", {}, 0.95),
+        }
+
+    items = [history(1), item("xin chào", {"strategy": "conversation"}), history(2), history(1)]
+    asyncio.run(agent._abatch_retrieve(items))
+
+    assert agent.mysql_client.order_lookups == [[1, 2]]
+    assert "Đơn #10" in items[0]["context"] and "Đơn #20" in items[2]["context"]
+    assert items[1]["strategy"] == "conversation"
+
+
+def test_abatch_chat_answers_in_order_with_per_item_errors(agent, monkeypatch):
+    routings = {
+        "xin chào": {"strategy": "conversation"},
+        "giá lỗi": {"strategy": "sql", "sql_query": "SELECT broken FROM products"},
+        "bàn tiệc cưới": {"strategy": "vector", "search_query": "bàn tiệc"},
+    }
+    chain = FakeAnswerChain()
+    monkeypatch.setattr(agent, "_fast_path_intent", lambda query, user_id: None)
+    monkeypatch.setattr(agent, "_cached_routing", lambda query, user_id: {**routings[query], "router": "cache"})
+    monkeypatch.setattr(agent, "_get_answer_chain", lambda: chain)
+
+    queries = ["xin chào", "giá lỗi", "bàn tiệc cưới", "xin chào"]
+    results = asyncio.run(agent.abatch_chat([{"query": q} for q in queries]))
+
+    assert [r["answer"] for r in results] == [f"answer: {q}" for q in queries]
+    assert [r["metadata"]["strategy"] for r in results] == ["conversation", "vector", "vector", "conversation"]
+    assert results[0]["metadata"]["batch"] == {"size": 4, "unique": 3}
+    # The duplicate question shares one answer call
+    assert len(chain.inputs) == 3
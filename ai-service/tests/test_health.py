@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain_google_genai")
+
+from app import main
+
+
+class ThreadRecordingMySQLClient:
+    def __init__(self, threads):
+        self.threads = threads
+
+    async def run_async(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def test_connection(self):
+        self.threads.append(threading.get_ident())
+        return True
+
+
+class ThreadRecordingVectorStore:
+    def __init__(self, threads):
+        self.threads = threads
+
+    def is_ready(self):
+        self.threads.append(threading.get_ident())
+        return True
+
+
+def test_health_checks_run_off_the_event_loop(monkeypatch):
+    threads = []
+    monkeypatch.setattr(main, "get_mysql_client", lambda: ThreadRecordingMySQLClient(threads))
+    monkeypatch.setattr(main, "get_vectorstore", lambda: ThreadRecordingVectorStore(threads))
+
+    async def check():
+        return await main.health_check(), threading.get_ident()
+
+    response, loop_thread = asyncio.run(check())
+    assert response.status == "healthy"
+    assert len(threads) == 2 and loop_thread not in threads
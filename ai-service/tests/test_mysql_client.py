@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from app.database.mysql_client import MySQLClient
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.log.append("close cursor")
+
+    def execute(self, query, args=None):
+        query = " ".join(query.split())
+        self.conn.log.append((query, args))
+        if query.startswith("SELECT @@SESSION."):
+            self.rows = [{"value": self.conn.session[query.split(".", 1)[1].split()[0]]}]
+        elif query.startswith("SET SESSION"):
+            self.conn.session[query.split()[2]] = args[0]
+        else:
+            self.conn.queried_with = dict(self.conn.session)
+            self.rows = list(self.conn.rows)
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.session = {"net_write_timeout": 60, "information_schema_stats_expiry": 86400}
+        self.queried_with = None
+        self.log = []
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def mysql(monkeypatch):
+    client = MySQLClient()
+    conn = FakeConnection([{"id": i} for i in range(5)])
+
+    @contextmanager
+    def connection():
+        yield conn
+
+    monkeypatch.setattr(client, "connection", connection)
+    yield client, conn
+    client.close()
+
+
+def test_product_stream_restores_net_write_timeout(mysql):
+    client, conn = mysql
+    chunks = list(client.iter_products_updated_since(chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert conn.session["net_write_timeout"] == 60
+    assert ("SET SESSION net_write_timeout = %s", (client.settings.sync_net_write_timeout,)) in conn.log
+
+
+def test_abandoned_product_stream_restores_net_write_timeout(mysql):
+    client, conn = mysql
+    stream = client.iter_products_updated_since(chunk_size=2)
+    next(stream)
+    assert conn.session["net_write_timeout"] == client.settings.sync_net_write_timeout
+
+    stream.close()
+    assert conn.session["net_write_timeout"] == 60
+    # The streaming cursor is closed before the restore runs on the connection
+    assert conn.log[-3:] == ["close cursor", ("SET SESSION net_write_timeout = %s", (60,)), "close cursor"]
+
+
+def test_table_update_times_bypass_the_statistics_cache(mysql):
+    client, conn = mysql
+    updated = datetime(2026, 1, 1, 12, 0)
+    conn.rows = [{"name": "Products", "updated": updated}, {"name": "orders", "updated": None}]
+
+    assert client.table_update_times() == {"products": updated, "orders": None}
+    assert conn.queried_with["information_schema_stats_expiry"] == 0
+    assert conn.session["information_schema_stats_expiry"] == 86400
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from app.database.query_cache import QueryCache
+
+
+def test_changed_update_time_bumps_the_table_version():
+    cache = QueryCache()
+    first = datetime(2026, 1, 1, 12, 0)
+
+    # The first poll only records a baseline
+    assert cache.observe_update_times({"products": first, "orders": None}) == []
+    assert cache.stats()["table_versions"] == {}
+
+    assert cache.observe_update_times({"products": first, "orders": None}) == []
+    assert cache.observe_update_times({"products": first + timedelta(seconds=1), "orders": None}) == ["products"]
+    assert cache.stats()["table_versions"] == {"products": 1}
+
+
+def test_update_time_change_makes_cached_results_stale():
+    cache = QueryCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return len(loads)
+
+    cache.observe_update_times({"products": None})
+    assert cache.get_or_load("count", (), ("products",), load) == 1
+    assert cache.get_or_load("count", (), ("products",), load) == 1
+
+    cache.observe_update_times({"products": datetime(2026, 1, 1, 12, 0)})
+    assert cache.get_or_load("count", (), ("products",), load) == 2
+    assert cache.stats()["methods"]["count"]["stale"] == 1
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from app.database.mysql_client import MySQLClient
+from app.database.rankings import RankingIndex
+
+
+UPDATED = datetime(2026, 1, 1, 12, 0)
+PRODUCTS = [
+    {"id": 1, "name": "Bàn tiệc", "price": 100, "stock": 3, "status": "Còn hàng", "category_name": "Bàn", "updated_at": UPDATED},
+    {"id": 2, "name": "Ghế tiệc", "price": 50, "stock": 0, "status": "Hết hàng", "category_name": "Ghế", "updated_at": UPDATED},
+    {"id": 3, "name": "Lều", "price": 300, "stock": 1, "status": "Còn hàng", "category_name": "Lều", "updated_at": UPDATED},
+]
+
+
+@pytest.fixture
+def mysql(monkeypatch):
+    client = MySQLClient()
+    client.rankings = RankingIndex(client)
+    existing = {product["id"] for product in PRODUCTS}
+    monkeypatch.setattr(
+        client, "iter_products_updated_since",
+        lambda since, chunk_size=500: iter([PRODUCTS] if since is None else [])
+    )
+    monkeypatch.setattr(client, "get_rental_totals", lambda: ({1: 5, 2: 9, 3: 1}, 3))
+    monkeypatch.setattr(client, "get_order_items_after", lambda last_id: [])
+    monkeypatch.setattr(client, "get_existing_product_ids", lambda ids: existing & set(ids))
+    client.rankings.build()
+    yield client, existing
+    client.close()
+
+
+def test_sync_drops_deleted_products_from_the_rankings(mysql):
+    client, existing = mysql
+    existing.discard(3)
+
+    # 2 went out of stock and 3 was deleted; both left the vector store
+    client.on_products_synced({"mode": "delta", "full": False, "product_ids": {2, 3}, "removed_ids": {2, 3}})
+
+    assert [p["id"] for p in client.rankings.best_sellers(5)] == [2, 1]
+    assert [p["id"] for p in client.rankings.by_price("DESC", 5)] == [1]
+    assert client.rankings.best_sellers(5, "Lều") == []
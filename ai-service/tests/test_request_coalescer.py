@@ -0,0 +1,227 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.cache import answer_cache
+from app.cache.answer_cache import AnswerCache
+from app.cache.request_coalescer import RequestCoalescer
+from app.database import add_round_trips, track_round_trips
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": "x", "metadata": {}}
+
+    async def main():
+        return await asyncio.gather(*(coalescer.arun("k", compute) for _ in range(10)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [coalesced for _, coalesced in results].count(False) == 1
+    # Every caller gets its own copy
+    assert results[0][0] == results[1][0] and results[0][0] is not results[1][0]
+    stats = coalescer.stats()
+    assert stats["requests"] == 10 and stats["executions"] == 1
+    assert stats["coalescing_ratio"] == 0.9 and stats["in_flight"] == 0
+
+
+def test_finished_results_are_joinable_only_within_the_window():
+    coalescer = RequestCoalescer(window=0.1)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        first = await coalescer.arun("k", compute)
+        within = await coalescer.arun("k", compute)
+        await asyncio.sleep(0.15)
+        after = await coalescer.arun("k", compute)
+        return first, within, after
+
+    assert asyncio.run(main()) == ((1, False), (1, True), (2, False))
+
+
+def test_errors_reach_waiters_but_are_not_replayed():
+    coalescer = RequestCoalescer(window=10)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("router down")
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        failures = await asyncio.gather(*(coalescer.arun("k", fail) for _ in range(3)), return_exceptions=True)
+        return failures, await coalescer.arun("k", ok)
+
+    failures, retried = asyncio.run(main())
+    assert all(isinstance(f, ValueError) for f in failures)
+    assert retried == ("ok", False)
+    assert coalescer.stats()["failures"] == 1
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    coalescer = RequestCoalescer()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(coalescer.arun("k", compute))
+        follower = asyncio.ensure_future(coalescer.arun("k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+def test_blocking_callers_share_one_computation():
+    coalescer = RequestCoalescer()
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"a": 1}
+
+    threads = [threading.Thread(target=lambda: results.append(coalescer.run("k", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True, True, True]
+
+
+def test_answer_cache_does_not_store_per_request_metadata(monkeypatch):
+    monkeypatch.setattr(answer_cache, "query_signature", lambda normalized: ("product_search", None))
+    cache = AnswerCache()
+    monkeypatch.setattr(cache, "_embed", lambda text: np.ones(4, dtype=np.float32) / 2)
+
+    _, probe = cache.lookup("bàn tiệc", None, "smart")
+    result = {"answer": "a", "metadata": {"strategy": "vector", "coalesced": True, "db_round_trips": 0}}
+    cache.store(probe, result, 1.0)
+
+    cached, _ = cache.lookup("bàn tiệc", None, "smart")
+    assert cached["metadata"]["strategy"] == "vector"
+    assert "coalesced" not in cached["metadata"] and "db_round_trips" not in cached["metadata"]
+    assert cached["metadata"]["cache"]["status"] == "hit"
+    assert result["metadata"]["coalesced"] is True
+
+
+def test_followers_report_the_shared_computation_round_trips(monkeypatch):
+    pytest.importorskip("langchain_google_genai")
+    from app.agents import smart_agent
+
+    coalescer = RequestCoalescer()
+    monkeypatch.setattr(smart_agent, "get_request_coalescer", lambda: coalescer)
+    agent = smart_agent.SmartChatAgent()
+
+    async def achat(query, user_id, conversation_history, polish):
+        add_round_trips(2)  # what the leader's queries would count
+        await asyncio.sleep(0.05)
+        return {"answer": "a", "metadata": {}}
+
+    monkeypatch.setattr(agent, "_achat", achat)
+
+    async def request():
+        counter = track_round_trips()
+        result = await agent.achat("bàn tiệc giá bao nhiêu")
+        return counter["count"], result["metadata"].get("coalesced", False)
+
+    async def main():
+        return await asyncio.gather(*(asyncio.ensure_future(request()) for _ in range(3)))
+
+    assert sorted(asyncio.run(main())) == [(2, False), (2, True), (2, True)]
+
+
+def test_signed_in_users_share_a_catalog_question(monkeypatch):
+    pytest.importorskip("langchain_google_genai")
+    from app.agents import smart_agent
+
+    coalescer = RequestCoalescer()
+    monkeypatch.setattr(smart_agent, "get_request_coalescer", lambda: coalescer)
+    agent = smart_agent.SmartChatAgent()
+    calls = []
+
+    async def achat(query, user_id, conversation_history, polish):
+        calls.append(user_id)
+        await asyncio.sleep(0.05)
+        return {"answer": "a", "metadata": {"strategy": "vector", "user_id": user_id}}
+
+    monkeypatch.setattr(agent, "_achat", achat)
+    query = "bàn tiệc giá bao nhiêu"
+
+    async def main():
+        # The backend stores the message first, so it arrives as the last history entry
+        return await asyncio.gather(*(
+            agent.achat(query, user_id, [{"role": "user", "content": query}])
+            for user_id in (1, 2)
+        ))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [r["metadata"]["user_id"] for r in results] == [1, 2]
+    assert sorted(r["metadata"].get("coalesced", False) for r in results) == [False, True]
+
+
+def test_answers_about_a_users_orders_are_not_shared(monkeypatch):
+    pytest.importorskip("langchain_google_genai")
+    from app.agents import smart_agent
+
+    coalescer = RequestCoalescer()
+    monkeypatch.setattr(smart_agent, "get_request_coalescer", lambda: coalescer)
+    agent = smart_agent.SmartChatAgent()
+    calls = []
+
+    async def achat(query, user_id, conversation_history, polish):
+        calls.append(user_id)
+        await asyncio.sleep(0.05)
+        sql = f"SELECT * FROM orders WHERE user_id = {user_id}"
+        return {"answer": f"orders of {user_id}", "metadata": {"strategy": "sql", "sql_query": sql, "user_id": user_id}}
+
+    monkeypatch.setattr(agent, "_achat", achat)
+
+    async def main():
+        # Not an order intent to the rules; the routed SQL is what makes it per user
+        return await asyncio.gather(*(agent.achat("tổng tiền tôi đã chi", user_id) for user_id in (1, 2)))
+
+    results = asyncio.run(main())
+    assert sorted(calls) == [1, 2]
+    assert [r["answer"] for r in results] == ["orders of 1", "orders of 2"]
+
+
+def test_earlier_turns_bypass_coalescing(monkeypatch):
+    pytest.importorskip("langchain_google_genai")
+    from app.agents import smart_agent
+
+    agent = smart_agent.SmartChatAgent()
+    seen = []
+
+    async def achat(query, user_id, conversation_history, polish):
+        seen.append(conversation_history)
+        return {"answer": "a", "metadata": {}}
+
+    monkeypatch.setattr(agent, "_achat", achat)
+    history = [
+        {"role": "user", "content": "bàn tiệc"},
+        {"role": "assistant", "content": "..."},
+        {"role": "user", "content": "cái rẻ nhất?"},
+    ]
+    result = asyncio.run(agent.achat("Cái rẻ nhất", 1, history))
+    assert seen == [history[:2]]
+    assert "coalesced" not in result["metadata"]
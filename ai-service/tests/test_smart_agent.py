@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+
+from app.agents.smart_agent import SmartChatAgent
+
+
+def test_failed_router_call_cancels_speculative_retrievals(monkeypatch):
+    agent = SmartChatAgent()
+    started = {}
+
+    def speculate(query, user_id):
+        started["orders"] = asyncio.create_task(asyncio.sleep(10))
+        return dict(started)
+
+    async def route(query, user_id):
+        raise TimeoutError("router timed out")
+
+    monkeypatch.setattr(agent, "_fast_path_intent", lambda query, user_id: None)
+    monkeypatch.setattr(agent, "_cached_routing", lambda query, user_id: None)
+    monkeypatch.setattr(agent, "_speculate", speculate)
+    monkeypatch.setattr(agent, "_allm_route", route)
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await agent._aprepare("đơn hàng của tôi", 7)
+        await asyncio.sleep(0)
+        return started["orders"].cancelled()
+
+    assert asyncio.run(main())
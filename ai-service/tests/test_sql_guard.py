@@ -0,0 +1,110 @@
+import pytest
+
+from app.database.sql_guard import GuardedSQLExecutor, UnsafeSQLError
+
+
+COLUMNS = {
+    "products": {"id", "name", "price", "stock", "status", "category_id", "created_at"},
+    "categories": {"id", "name"},
+    "orders": {"id", "user_id", "status", "total_amount", "created_at"},
+    "order_items": {"id", "order_id", "product_id", "quantity"},
+}
+
+
+@pytest.fixture
+def guard():
+    return GuardedSQLExecutor(None, COLUMNS, max_limit=10, max_execution_ms=0)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT name FROM products", "SELECT name FROM products LIMIT 10"),
+    ("SELECT name FROM products LIMIT 500", "SELECT name FROM products LIMIT 10"),
+    ("SELECT name FROM products LIMIT 3", "SELECT name FROM products LIMIT 3"),
+    ("SELECT name FROM products;", "SELECT name FROM products LIMIT 10"),
+])
+def test_prepare_injects_and_clamps_limit(guard, sql, expected):
+    assert guard.prepare(sql)[0] == expected
+
+
+def test_prepare_binds_every_user_id_placeholder(guard):
+    sql, params, tables = guard.prepare(
+        "SELECT id FROM orders WHERE user_id = '{user_id}' OR user_id = {user_id}", user_id=7
+    )
+    assert sql == "SELECT id FROM orders WHERE user_id = %s OR user_id = %s LIMIT 10"
+    assert params == (7, 7)
+    assert tables == {"orders"}
+
+
+def test_prepare_requires_a_user_for_user_queries(guard):
+    with pytest.raises(UnsafeSQLError, match="signed-in"):
+        guard.prepare("SELECT id FROM orders WHERE user_id = {user_id}")
+
+
+def test_prepare_escapes_literal_percent_signs(guard):
+    sql, params, _ = guard.prepare("SELECT name FROM products WHERE name LIKE '%bàn%'")
+    assert sql == "SELECT name FROM products WHERE name LIKE '%%bàn%%' LIMIT 10"
+    assert params == ()
+
+
+def test_prepare_resolves_aliases_ctes_and_derived_tables(guard):
+    _, _, tables = guard.prepare(
+        "WITH cheap AS (SELECT id, name FROM products WHERE price < 100) "
+        "SELECT c.name, t.n FROM cheap c JOIN (SELECT category_id, COUNT(*) AS n FROM products "
+        "GROUP BY category_id) t ON t.category_id = c.id ORDER BY n"
+    )
+    assert tables == {"products"}
+
+
+def test_prepare_adds_the_execution_time_hint_to_the_first_select():
+    guard = GuardedSQLExecutor(None, COLUMNS, max_limit=10, max_execution_ms=3000)
+    sql, _, tables = guard.prepare("SELECT name FROM products UNION SELECT name FROM categories")
+    assert sql.startswith("SELECT /*+ MAX_EXECUTION_TIME(3000) */ name FROM products UNION")
+    assert tables == {"products", "categories"}
+
+
+@pytest.mark.parametrize("sql, message", [
+    ("SELECT * FROM users", "Table users"),
+    ("SELECT password FROM products", "Column"),
+    ("SELECT p.password FROM products p", "Column products.password"),
+    ("SELECT x.id FROM products", "Unknown table"),
+    ("SELECT * FROM mysql.user", "not allowed"),
+    ("DELETE FROM products", "Only SELECT"),
+    ("UPDATE products SET price = 0", "Only SELECT"),
+    ("SELECT 1; DROP TABLE products", "one statement"),
+    ("SELECT SLEEP(5) FROM products", "SLEEP"),
+    ("SELECT id FROM products FOR UPDATE", "not allowed"),
+    ("SELECT id INTO @x FROM products", "not allowed"),
+    ("SELECT id FROM products WHERE id = :other", "placeholder"),
+])
+def test_prepare_rejects_unsafe_sql(guard, sql, message):
+    with pytest.raises(UnsafeSQLError, match=message):
+        guard.prepare(sql, user_id=1)
+
+
+@pytest.mark.parametrize("sql, limit", [
+    ("SELECT * FROM orders WHERE user_id = {user_id}", 10),
+    ("SELECT * FROM orders WHERE user_id = {user_id} ORDER BY created_at DESC LIMIT 3", 3),
+    ("SELECT * FROM orders WHERE user_id = {user_id} LIMIT 50", 10),
+    (
+        "SELECT o.id, p.name FROM orders o JOIN order_items oi ON oi.order_id = o.id "
+        "JOIN products p ON p.id = oi.product_id WHERE o.user_id = '{user_id}'",
+        10,
+    ),
+])
+def test_order_history_limit_matches_plain_order_listings(guard, sql, limit):
+    assert guard.order_history_limit(sql) == limit
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM orders WHERE user_id = {user_id} AND status = 'pending'",
+    "SELECT COUNT(*) FROM orders WHERE user_id = {user_id}",
+    "SELECT * FROM orders WHERE user_id = {user_id} ORDER BY total_amount DESC",
+    "SELECT * FROM orders WHERE id = 5",
+    "SELECT * FROM orders",
+    "SELECT o.* FROM orders o JOIN order_items oi ON oi.order_id = o.id AND oi.product_id = 3 "
+    "WHERE o.user_id = {user_id}",
+    "SELECT * FROM products WHERE id IN (SELECT product_id FROM order_items)",
+    "not sql at all",
+])
+def test_order_history_limit_rejects_anything_more(guard, sql):
+    assert guard.order_history_limit(sql) is None
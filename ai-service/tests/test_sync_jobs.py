@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from app.vectorstore import sync_jobs
+from app.vectorstore.sync_jobs import SyncJobManager
+
+
+class BlockingVectorStore:
+    """Records each sync pass; the first pass waits until released."""
+
+    def __init__(self):
+        self.passes: list[bool] = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def sync_products(self, full=False, progress=None):
+        self.passes.append(full)
+        if len(self.passes) == 1:
+            self.started.set()
+            assert self.release.wait(5)
+        return {"fetched": 1, "upserted": 1, "unchanged": 0, "deleted": 0, "batches": 1}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = BlockingVectorStore()
+    monkeypatch.setattr(sync_jobs, "get_vectorstore", lambda: store)
+    return store
+
+
+def wait_finished(manager: SyncJobManager, job_id: str) -> dict:
+    for _ in range(500):
+        job = manager.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("sync job did not finish")
+
+
+def test_triggers_during_a_run_coalesce_into_one_delta_pass(store):
+    manager = SyncJobManager()
+    job, coalesced = manager.start()
+    assert not coalesced
+    assert store.started.wait(5)
+
+    for _ in range(3):
+        joined, coalesced = manager.start()
+        assert coalesced and joined["job_id"] == job["job_id"]
+    store.release.set()
+
+    finished = wait_finished(manager, job["job_id"])
+    assert finished["status"] == "succeeded"
+    assert finished["coalesced_triggers"] == 3
+    assert finished["passes"] == 2
+    assert store.passes == [False, False]
+    assert finished["progress"]["upserted"] == 2
+
+
+def test_full_trigger_during_a_delta_run_gets_a_full_pass(store):
+    manager = SyncJobManager()
+    job, _ = manager.start()
+    assert store.started.wait(5)
+
+    joined, coalesced = manager.start(full=True)
+    assert coalesced and joined["mode"] == "full"
+    manager.start()
+    store.release.set()
+
+    wait_finished(manager, job["job_id"])
+    assert store.passes == [False, True]
+
+
+def test_a_new_job_starts_after_the_previous_one_finished(store):
+    manager = SyncJobManager()
+    store.release.set()
+    first, _ = manager.start()
+    wait_finished(manager, first["job_id"])
+
+    second, coalesced = manager.start(full=True)
+    assert not coalesced and second["job_id"] != first["job_id"]
+    wait_finished(manager, second["job_id"])
+    assert store.passes == [False, True]
@@ -60,6 +60,9 @@ public function ask(string $query, ?int $userId = null, array $conversationHisto
 
     /**
      * Trigger product sync in AI service.
+     *
+     * The sync runs in the background; the response contains a job_id
+     * that can be polled with syncStatus().
      */
     public function sync(): ?array
     {
@@ -81,6 +84,30 @@ public function sync(): ?array
         }
     }
 
+    /**
+     * Get progress of a product sync job in AI service.
+     */
+    public function syncStatus(string $jobId): ?array
+    {
+        try {
+            $response = Http::timeout($this->timeout)
+                ->get("{$this->baseUrl}/sync/{$jobId}");
+
+            if ($response->successful()) {
+                return $response->json();
+            }
+
+            return null;
+        } catch (\Throwable $e) {
+            Log::error('AI Service sync status failed', [
+                'job_id' => $jobId,
+                'message' => $e->getMessage(),
+            ]);
+
+            return null;
+        }
+    }
+
     /**
      * Check AI service health.
      */